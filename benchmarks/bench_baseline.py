@@ -0,0 +1,81 @@
+"""
+Benchmark capturing a live-trace baseline: reading every file into the blob
+store versus cloning the tree with each copy-on-write strategy.
+
+Usage:
+    python benchmarks/bench_baseline.py [--files 2000] [--size 262144] [--path DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execdiff.live_trace import BASELINE_MODES, TraceSession
+
+
+def build_tree(root, n_files, size, files_per_dir=100):
+    """Create n_files files of ``size`` bytes, files_per_dir per directory."""
+    chunk = os.urandom(min(size, 1 << 16))
+    for i in range(n_files):
+        dirpath = os.path.join(root, "d%d" % (i // files_per_dir))
+        if i % files_per_dir == 0:
+            os.makedirs(dirpath, exist_ok=True)
+        with open(os.path.join(dirpath, "f%d.bin" % i), "wb") as f:
+            remaining = size
+            while remaining > 0:
+                f.write(chunk[:remaining])
+                remaining -= len(chunk)
+
+
+def du(path):
+    """
+    Blocks allocated under path, not counting files hard-linked from the
+    workspace. Reflinked extents are shared but still show up here.
+    """
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if st.st_nlink == 1:
+                total += st.st_blocks * 512
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--path", help="Directory to build the tree in (default: a temp dir)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="execdiff-bench-", dir=args.path)
+    cwd = os.getcwd()
+    os.environ.setdefault("EXECDIFF_INDEX_DIR", os.path.join(root, ".index"))
+    try:
+        build_tree(root, args.files, args.size)
+        os.chdir(root)
+        print("%d files x %d bytes in %s" % (args.files, args.size, root))
+        for mode in BASELINE_MODES:
+            # Start cold every time: no blobs or digests from the previous mode
+            shutil.rmtree(".execdiff", ignore_errors=True)
+            shutil.rmtree(os.environ["EXECDIFF_INDEX_DIR"], ignore_errors=True)
+            session = TraceSession(".", baseline=mode)
+            start = time.perf_counter()
+            session.capture_baseline()
+            elapsed = time.perf_counter() - start
+            report = session.baseline_report
+            used = ",".join(sorted(report.strategies)) if report else "blobs"
+            files = report.files if report else len(session.versions)
+            print("%-11s %6d files  %9.1f ms  %8.1f MiB on disk  (%s)"
+                  % (mode, files, elapsed * 1000, du(".execdiff") / 2.0 ** 20, used or "unsupported"))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark snapshot memory and diff time: the previous {relpath: {"mtime",
+"size"}} record dicts versus ColumnarSnapshot, on a synthetic tree (no
+files are written). Memory is measured with tracemalloc and includes the
+path strings.
+
+Usage:
+    python benchmarks/bench_columnar.py [--files 1000000] [--changed 0.01] [--clustered]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execdiff import _diff_file_records
+from execdiff.columnar import ColumnarSnapshot, diff_snapshots
+from execdiff.snapshot import FileStat
+
+
+def stats(files, changed, generation, per_dir=200, clustered=False):
+    """
+    {relpath: FileStat}; in generation 1, every 1/changed-th file is
+    rewritten, or with ``clustered`` the first changed * files ones.
+    """
+    step = int(1 / changed) if changed else 0
+    result = {}
+    for i in range(files):
+        mtime_ns = 1700000000 * 10 ** 9 + i
+        if clustered:
+            rewritten = i < files * changed
+        else:
+            rewritten = step and i % step == 0
+        if generation and rewritten:
+            mtime_ns += 10 ** 9
+        result["src/d%d/file_%d.py" % (i // per_dir, i)] = FileStat(mtime_ns, 100 + i % 5000, 1000 + i, 0o100644)
+    return result
+
+
+def as_records(files):
+    return {relpath: {"mtime": st.mtime, "size": st.size} for relpath, st in files.items()}
+
+
+def measure(build):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    value = build()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of files modified between snapshots")
+    parser.add_argument("--clustered", action="store_true",
+                        help="Modify files in as few directories as possible instead of spreading them out")
+    args = parser.parse_args()
+
+    def build(generation):
+        return stats(args.files, args.changed, generation, clustered=args.clustered)
+
+    before_records, records_bytes = measure(lambda: as_records(build(0)))
+    after_records = as_records(build(1))
+    before_columns, columns_bytes = measure(lambda: ColumnarSnapshot.from_stats(build(0)))
+    # Interned: the second snapshot reuses the first one's path strings
+    after_columns, second_bytes = measure(lambda: ColumnarSnapshot.from_stats(build(1)))
+
+    print("%d files, %.1f%% modified%s" % (args.files, args.changed * 100, " (clustered)" if args.clustered else ""))
+    print("record dicts      %8.1f MB  (%d bytes/file)" % (records_bytes / 1e6, records_bytes // args.files))
+    print("columnar          %8.1f MB  (%d bytes/file)" % (columns_bytes / 1e6, columns_bytes // args.files))
+    print("columnar, 2nd     %8.1f MB  (%d bytes/file, shared paths)" % (second_bytes / 1e6,
+                                                                         second_bytes // args.files))
+
+    start = time.perf_counter()
+    dict_diff = _diff_file_records(before_records, after_records)
+    dict_time = time.perf_counter() - start
+    start = time.perf_counter()
+    merge_diff = diff_snapshots(before_columns, after_columns)
+    merge_time = time.perf_counter() - start
+    print("dict diff         %8.1f ms" % (dict_time * 1000))
+    print("merge-join diff   %8.1f ms" % (merge_time * 1000))
+    same = all(sorted(r["path"] for r in a) == [r["path"] for r in b] for a, b in zip(dict_diff, merge_diff))
+    print("same changes reported: %s (%d modified)" % (same, len(merge_diff[1])))
+
+
+if __name__ == "__main__":
+    main()
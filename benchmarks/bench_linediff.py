@@ -0,0 +1,52 @@
+"""
+Benchmark live-trace line counting: difflib.unified_diff (the previous
+engine) versus linediff.diff_stats, on a large file with scattered edits.
+
+Usage:
+    python benchmarks/bench_linediff.py [--lines 50000] [--every 100]
+"""
+import os
+import sys
+import time
+import difflib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execdiff.linediff import diff_stats
+
+
+def difflib_counts(before, after):
+    """The previous engine: build the whole unified diff, then count."""
+    diff = list(difflib.unified_diff(before, after, lineterm=''))
+    added = sum(1 for l in diff if l.startswith('+') and not l.startswith('+++'))
+    removed = sum(1 for l in diff if l.startswith('-') and not l.startswith('---'))
+    return added, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50000)
+    parser.add_argument("--every", type=int, default=100, help="Rewrite one line in this many")
+    args = parser.parse_args()
+
+    before = ['    "key_%d": "value",\n' % i for i in range(args.lines)]
+    after = list(before)
+    for i in range(0, args.lines, args.every):
+        after[i] = '    "key_%d": "changed",\n' % i
+    print("%d lines, %d rewritten" % (args.lines, len(range(0, args.lines, args.every))))
+
+    start = time.perf_counter()
+    old = difflib_counts(before, after)
+    old_t = time.perf_counter() - start
+    print("difflib.unified_diff  +%d/-%d  %9.1f ms" % (old[0], old[1], old_t * 1000))
+
+    start = time.perf_counter()
+    new = diff_stats(before, after, time_budget=60)
+    new_t = time.perf_counter() - start
+    print("linediff.diff_stats   +%d/-%d  %9.1f ms" % (new.added, new.removed, new_t * 1000))
+    print("speedup: %.0fx" % (old_t / new_t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark Trace handles: how long a nested trace takes to start compared
+with a top-level one, and many simultaneous traces on a thread pool, each
+checking that it saw exactly its own changes.
+
+Usage:
+    python benchmarks/bench_nested.py [--files 100000] [--threads 16] [--traces 64] [--repeat 3]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import execdiff
+
+
+def build_tree(root, files, per_dir=200):
+    for i in range(files):
+        d = os.path.join(root, "d%d" % (i // per_dir))
+        if i % per_dir == 0:
+            os.makedirs(d)
+        with open(os.path.join(d, "f%d.txt" % i), "w") as f:
+            f.write("x")
+
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--traces", type=int, default=64, help="Simultaneous traces, one workspace each")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="execdiff-bench-")
+    try:
+        build_tree(root, args.files)
+        # Directories modified within the last 2 s are always relisted
+        time.sleep(2.5)
+
+        def top_level():
+            execdiff.Trace(root, persist=False).start()
+
+        outer = execdiff.Trace(root, persist=False).start()
+
+        def nested():
+            outer.child().start()
+
+        top = best_of(args.repeat, top_level)
+        child = best_of(args.repeat, nested)
+        print("%d files" % args.files)
+        print("top-level start   %8.1f ms" % (top * 1000))
+        print("nested start      %8.1f ms" % (child * 1000))
+
+        def one_trace(i):
+            ws = os.path.join(root, "d%d" % i)
+            with execdiff.Trace(ws, persist=False) as trace:
+                with open(os.path.join(ws, "new%d.txt" % i), "w") as f:
+                    f.write("y")
+                os.remove(os.path.join(ws, "f%d.txt" % (i * 200)))
+            files = trace.diff["files"]
+            return ([f["path"] for f in files["created"]] == ["new%d.txt" % i]
+                    and [f["path"] for f in files["deleted"]] == ["f%d.txt" % (i * 200)]
+                    and not files["modified"])
+
+        traces = min(args.traces, args.files // 200)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(one_trace, range(traces)))
+        elapsed = time.perf_counter() - start
+        print("%d simultaneous traces on %d threads: %.1f ms, all exact: %s"
+              % (traces, args.threads, elapsed * 1000, all(results)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark the in-process package snapshot against the `pip freeze`
+subprocess it replaces.
+
+Usage:
+    python benchmarks/bench_packages.py [--repeat 5]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execdiff.packages import scan_packages
+
+
+def pip_freeze():
+    """The previous backend: one `pip freeze` subprocess per snapshot."""
+    result = subprocess.run([sys.executable, "-m", "pip", "freeze"], capture_output=True, text=True, check=True)
+    lines = result.stdout.strip().split("\n")
+    return set(line for line in lines if line and not line.startswith("-") and "==" in line)
+
+
+def in_process():
+    return set("%s==%s" % (d.name, d.version) for d in scan_packages().values())
+
+
+def bench(label, fn, repeat):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(fn())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-22s %5d packages  %8.2f ms" % (label, count, best * 1000))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    before = bench("pip freeze subprocess", pip_freeze, args.repeat)
+    after = bench("scan_packages", in_process, args.repeat)
+    print("speedup: %.0fx" % (before / after))
+    missing = pip_freeze() - in_process()
+    if missing:
+        print("reported by pip freeze only:", ", ".join(sorted(missing)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Scaling benchmark for the work-stealing parallel walker: snapshot time of
+the same synthetic tree with 1..N walker threads.
+
+Usage:
+    python benchmarks/bench_parallel_walk.py [--files 100000] [--max-workers 8] [--path DIR]
+
+Pass --path to measure an existing tree (e.g. an NFS or overlayfs mount)
+instead of a generated one; parallelism pays off when stat latency, not
+CPU, dominates.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from execdiff.snapshot import scan_workspace
+from bench_snapshot import build_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    root = args.path or tempfile.mkdtemp(prefix="execdiff-bench-")
+    try:
+        if args.path is None:
+            build_tree(root, args.files)
+        reference = scan_workspace(root)
+        baseline = None
+        workers = 1
+        while workers <= args.max_workers:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                files = scan_workspace(root, workers=workers)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            if files.keys() != reference.keys():
+                raise SystemExit("workers=%d produced a different file set" % workers)
+            baseline = baseline or best
+            print("workers=%-3d %8d files  %7.3f s  %10.0f files/s  %5.2fx"
+                  % (workers, len(files), best, len(files) / best, baseline / best))
+            workers *= 2
+    finally:
+        if args.path is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,195 @@
 __version__ = "0.1.6"
-import sysconfig
-import re
-import json
+import threading
 from datetime import datetime
 
+from .ignore import IgnoreMatcher, resolve_ignore
+from .snapshot import list_workspace, scan_workspace
+from .index import index_snapshot, rescan, scan_and_index, scan_incremental
+from .packages import changed_since, normalize_name, scan_packages
+from .hashing import hash_snapshot
+from .columnar import ColumnarSnapshot, iter_changes
+from .stream import ChangeSummary, DiffSpool
+from .actionlog import (action_log_writer, append_entry, append_streamed_entry, flush_action_log, iter_entries,
+                        last_entry, log_path, set_log_policy, tail_entries)
+
 # --- Full Workspace Metadata Snapshot and Action Trace ---
-_action_trace_before = None
+# Traces opened by start_action_trace()/start_trace(): kind -> {thread id: Trace},
+# in the order they were started
+_open = {"action": {}, "window": {}}
+_open_lock = threading.Lock()
 
-def snapshot_workspace_state(workspace):
+def snapshot_workspace_state(workspace, workers=1, ignore=None, incremental=False, update_index=False,
+                             content_hash=False):
     """
     Take a full snapshot of the workspace state: files (mtime, size) and installed packages (name, version).
+    Args:
+        workspace (str): The workspace directory to snapshot.
+        workers (int): Number of threads walking the tree in parallel.
+        ignore: Paths to skip during the walk. None (default) skips execdiff's own
+            .execdiff/ state, .git/ and anything listed in .execdiffignore; True also honours
+            .gitignore files; False skips nothing; a list of gitignore-style patterns
+            adds to the defaults; an IgnoreMatcher is used as is.
+        incremental (bool): Reuse the persistent index under ~/.execdiff/index: only
+            directories whose own mtime changed since it was written are relisted.
+            Files rewritten in place since then keep their indexed stat.
+        update_index (bool): Take a full scan and store it as the workspace's index.
+        content_hash (bool): Also record a BLAKE2b "hash" per file. Digests are cached
+            across runs by (size, mtime_ns, inode), so only files whose stat changed are read.
     Returns:
-        dict: {"files": {relpath: {"mtime": float, "size": int}}, "packages": {name: {"version": str}}}
+        dict: {"files": {relpath: {"mtime": float, "size": int[, "hash": str]}},
+               "packages": {key: {"name": str, "version": str, "location": str, "environment": str}}}
+        Both parts are plain dicts and can be passed to json.dumps(). Package keys
+        are the normalized name, prefixed with "workspace:<dir>:" for virtualenvs
+        found inside the workspace.
     """
     # File snapshot
-    files = {}
-    for root, dirs, filelist in os.walk(workspace):
-        for fname in filelist:
-            fpath = os.path.join(root, fname)
-            relpath = os.path.relpath(fpath, workspace)
-            try:
-                files[relpath] = {
-                    "mtime": os.path.getmtime(fpath),
-                    "size": os.path.getsize(fpath)
-                }
-            except (OSError, IOError):
-                pass
+    matcher = resolve_ignore(workspace, ignore)
+    dirs = {}
+    if incremental:
+        file_stats = scan_incremental(workspace, ignore=matcher, workers=workers, dirs=dirs)
+    elif update_index:
+        file_stats = scan_and_index(workspace, ignore=matcher, workers=workers, dirs=dirs)
+    else:
+        file_stats = scan_workspace(workspace, workers=workers, ignore=matcher, dirs=dirs)
+    hashes = hash_snapshot(workspace, file_stats) if content_hash else None
+    files = ColumnarSnapshot.from_stats(file_stats, hashes, dirs)
 
-    # Package snapshot
-    packages = {}
-    site_packages = sysconfig.get_paths()["purelib"]
-    dist_info_re = re.compile(r"^(?P<name>.+?)-(?P<version>[^-]+)\.dist-info$")
-    try:
-        for entry in os.listdir(site_packages):
-            m = dist_info_re.match(entry)
-            if m:
-                name = m.group("name").replace('_', '-')
-                version = m.group("version")
-                packages[name.lower()] = {"version": version}
-    except Exception:
-        pass
+    return {"files": files.to_dict(), "packages": _package_state(workspace)}
 
-    return {"files": files, "packages": packages}
+
+def _package_state(workspace, paths=None):
+    """
+    Package part of snapshot_workspace_state(): cached per site directory,
+    including virtualenvs inside the workspace. ``paths`` defaults to this
+    interpreter's sys.path.
+    """
+    return {
+        key: {
+            "name": normalize_name(dist.name),
+            "version": dist.version,
+            "location": dist.location,
+            "environment": dist.environment
+        }
+        for key, dist in scan_packages(paths, workspace=workspace).items()
+    }
 
 
-def start_action_trace(workspace="."):
+def start_action_trace(workspace=".", workers=1, ignore=None, incremental=False, content_hash=False):
     """
     Take and store a full workspace metadata snapshot for later diffing.
+    Args:
+        workspace (str): The workspace directory to trace.
+        workers (int): Number of threads walking the tree, here and in stop_action_trace().
+        ignore: Paths to skip, as for snapshot_workspace_state(). Ignored subtrees
+            are pruned during the walk and never stat'ed.
+        incremental (bool): Build the snapshot from the index persisted by the previous
+            incremental stop_action_trace(), relisting only directories that changed.
+            The matching stop_action_trace() always does a full scan and refreshes it.
+        content_hash (bool): Decide "modified" in stop_action_trace() by content digest
+            instead of mtime/size, so touch-only rewrites are not reported and same-tick
+            rewrites that keep the size are not missed.
+
+    Each call takes a fresh snapshot and replaces any trace this thread left
+    open, so traces on different threads don't interfere. Nest traces with
+    Trace.child() instead.
     """
-    global _action_trace_before, _workspace
-    _workspace = workspace
-    _action_trace_before = snapshot_workspace_state(workspace)
+    trace = Trace(workspace, workers=workers, ignore=ignore, incremental=incremental, content_hash=content_hash)
+    _open_trace("action", trace.start())
 
 
-def stop_action_trace():
+def stop_action_trace(summary=False, depth=2):
     """
     Take a new snapshot and compute diff (files: created/modified/deleted, packages: installed/removed/upgraded).
+    Closes the trace started by start_action_trace() on this thread, or if there
+    is none, the one most recently started on any thread.
+    Args:
+        summary (bool): Return only change counts with per-directory rollups
+            (see Trace.stop()); the full diff still goes to the action log.
+        depth (int): Directory depth of the rollups.
     Returns:
         dict: {"files": {...}, "packages": {...}}
     """
-    global _action_trace_before, _workspace
-    if _action_trace_before is None:
+    trace = _close_trace("action")
+    if trace is None:
         raise RuntimeError("start_action_trace() must be called before stop_action_trace()")
-    after = snapshot_workspace_state(_workspace)
-    before = _action_trace_before
+    return trace.stop(summary=summary, depth=depth)
+
+
+def _open_trace(kind, trace):
+    thread = threading.get_ident()
+    with _open_lock:
+        _open[kind].pop(thread, None)
+        _open[kind][thread] = trace
 
-    # File diffs
+
+def _close_trace(kind):
+    with _open_lock:
+        traces = _open[kind]
+        thread = threading.get_ident()
+        if thread not in traces:
+            if not traces:
+                return None
+            # Started on another thread
+            thread = next(reversed(traces))
+        return traces.pop(thread)
+
+
+def _diff_states(before, after):
+    """
+    Diff two snapshot_workspace_state() results.
+    Returns:
+        dict: {"files": {"created", "modified", "deleted"[, "created_dirs", "deleted_dirs"]},
+               "packages": {"installed", "removed", "upgraded"}}
+        For columnar snapshots, "created_dirs" and "deleted_dirs" roll up the
+        outermost directories only one side has: {"path", "files", "bytes"}.
+    """
+    # File diffs: a merge-join for columnar snapshots, lookups for plain
+    # record dicts (as the daemon builds)
     before_files = before["files"]
     after_files = after["files"]
+    if isinstance(before_files, ColumnarSnapshot) and isinstance(after_files, ColumnarSnapshot):
+        files = {"created": [], "modified": [], "deleted": [], "created_dirs": [], "deleted_dirs": []}
+        for kind, record in iter_changes(before_files, after_files, rollups=True):
+            files[kind].append(record)
+    else:
+        created, modified, deleted = _diff_file_records(before_files, after_files)
+        files = {
+            "created": created,
+            "modified": modified,
+            "deleted": deleted
+        }
+
+    diff = {
+        "files": files,
+        "packages": _diff_packages(before["packages"], after["packages"])
+    }
+    return diff
+
+
+def _diff_packages(before_pkgs, after_pkgs):
+    installed = []
+    removed = []
+    upgraded = []
+    for key, a in after_pkgs.items():
+        where = {"environment": a.get("environment"), "location": a.get("location")}
+        if key not in before_pkgs:
+            installed.append({"name": a.get("name", key), "version": a["version"], **where})
+        else:
+            b = before_pkgs[key]
+            if b["version"] != a["version"]:
+                upgraded.append({"name": a.get("name", key), "before_version": b["version"], "after_version": a["version"], **where})
+    for key, b in before_pkgs.items():
+        if key not in after_pkgs:
+            removed.append({"name": b.get("name", key), "version": b["version"],
+                            "environment": b.get("environment"), "location": b.get("location")})
+    return {
+        "installed": installed,
+        "removed": removed,
+        "upgraded": upgraded
+    }
+
+
+def _diff_file_records(before_files, after_files):
     created = []
     modified = []
     deleted = []
@@ -76,53 +198,33 @@ def stop_action_trace():
             created.append({"path": f, **after_files[f]})
         else:
             b, a = before_files[f], after_files[f]
-            if b["mtime"] != a["mtime"] or b["size"] != a["size"]:
-                modified.append({"path": f, "before_mtime": b["mtime"], "after_mtime": a["mtime"], "before_size": b["size"], "after_size": a["size"]})
+            if "hash" in b and "hash" in a:
+                changed = b["hash"] != a["hash"]
+            else:
+                changed = b["mtime"] != a["mtime"] or b["size"] != a["size"]
+            if changed:
+                record = {"path": f, "before_mtime": b["mtime"], "after_mtime": a["mtime"], "before_size": b["size"], "after_size": a["size"]}
+                if "hash" in b and "hash" in a:
+                    record["before_hash"] = b["hash"]
+                    record["after_hash"] = a["hash"]
+                modified.append(record)
     for f in before_files:
         if f not in after_files:
             deleted.append({"path": f, **before_files[f]})
+    return created, modified, deleted
 
-    # Package diffs
-    before_pkgs = before["packages"]
-    after_pkgs = after["packages"]
-    installed = []
-    removed = []
-    upgraded = []
-    for name in after_pkgs:
-        if name not in before_pkgs:
-            installed.append({"name": name, "version": after_pkgs[name]["version"]})
-        else:
-            if before_pkgs[name]["version"] != after_pkgs[name]["version"]:
-                upgraded.append({"name": name, "before_version": before_pkgs[name]["version"], "after_version": after_pkgs[name]["version"]})
-    for name in before_pkgs:
-        if name not in after_pkgs:
-            removed.append({"name": name, "version": before_pkgs[name]["version"]})
 
-    diff = {
-        "files": {
-            "created": created,
-            "modified": modified,
-            "deleted": deleted
-        },
-        "packages": {
-            "installed": installed,
-            "removed": removed,
-            "upgraded": upgraded
-        }
-    }
-
-    _persist_action_log(diff)
-    return diff
-
-
-def _persist_action_log(diff):
+def _persist_action_log(diff, workspace=None):
     """
     Persist the action trace diff to global logs directory.
     Uses EXECDIFF_LOG_DIR env var, or defaults to ~/.execdiff/logs/
+    Args:
+        diff (dict): As returned by stop_action_trace().
+        workspace (str): Workspace the diff belongs to; defaults to ".".
     """
     # Get log directory from env or use home directory
-    log_base = os.environ.get('EXECDIFF_LOG_DIR') or os.path.expanduser('~/.execdiff/logs')
-    log_file = os.path.join(log_base, "actions.jsonl")
+    log_file = log_path()
+    log_base = os.path.dirname(log_file)
 
     try:
         os.makedirs(log_base, exist_ok=True)
@@ -132,41 +234,57 @@ def _persist_action_log(diff):
     try:
         entry = {
             "timestamp": datetime.utcnow().isoformat(),
-            "workspace": os.path.abspath(_workspace),
+            "workspace": os.path.abspath(workspace if workspace is not None else "."),
             "diff": diff
         }
-        with open(log_file, "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        # Buffered with entries from other threads; stop_action_trace flushes
+        action_log_writer(log_file).write(entry, size=0)
+    except Exception:
+        pass
+
+
+def _persist_spooled_diff(spool, diff, workspace):
+    """
+    Append a streamed diff to the action log: the spooled change records go
+    in "files", and the rollups of the summary diff go in "summary".
+    Args:
+        spool (DiffSpool): The change records.
+        diff (dict): The summary diff, as Trace.stop(summary=True) returns it.
+        workspace (str): Workspace the diff belongs to.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    workspace = os.path.abspath(workspace)
+    entry = {
+        "timestamp": timestamp,
+        "workspace": workspace,
+        "diff": {"files": None, "packages": diff["packages"], "summary": diff["files"]}
+    }
+    try:
+        append_streamed_entry(timestamp, workspace, lambda f: spool.write_entry(f, entry), log_path())
     except Exception:
         pass
 """Minimal passive execution tracing library for file system snapshots."""
 
 import os
 import subprocess
+import tempfile
 import time
 
 
-# Module-level variables to store the initial snapshot, workspace, package snapshot, and execution window
-_initial_snapshot = None
-_workspace = "."
-_initial_packages = None
-_execution_start_time = None
-_execution_end_time = None
-
-
-def start_trace(workspace="."):
+def start_trace(workspace=".", ignore=None, content_hash=False):
     """
     Snapshot all files in the specified workspace directory recursively.
-    Stores the snapshot in a module-level variable for later comparison.
+    Stores the snapshot for later comparison; calls pair up as for
+    start_action_trace().
     
     Args:
         workspace (str): The workspace directory to trace. Defaults to ".".
+        ignore: Paths to skip, as for snapshot_workspace_state().
+        content_hash (bool): Decide "modified" in stop_trace() by content digest
+            instead of mtime.
     """
-    global _initial_snapshot, _workspace, _initial_packages, _execution_start_time
-    _workspace = workspace
-    _initial_snapshot = _take_snapshot()
-    _initial_packages = _snapshot_packages()
-    _execution_start_time = time.time()
+    trace = Trace(workspace, ignore=ignore, content_hash=content_hash, window=True)
+    _open_trace("window", trace.start())
 
 
 def stop_trace():
@@ -183,17 +301,27 @@ def stop_trace():
                 }
             }
     """
-    global _execution_end_time
-    if _initial_snapshot is None or _initial_packages is None or _execution_start_time is None:
+    trace = _close_trace("window")
+    if trace is None:
         raise RuntimeError("start_trace() must be called before stop_trace()")
+    return trace.stop()
+
 
-    _execution_end_time = time.time()
-    current_snapshot = _take_snapshot()
-    current_packages = _snapshot_packages()
+def _compare_states(initial, current, start_time, end_time):
+    """
+    Diff two window-trace states (see Trace), keeping only file changes
+    whose mtime falls within the execution window [start_time, end_time].
+
+    Returns:
+        dict: The diff, in the format documented on stop_trace().
+    """
+    _initial_snapshot, _initial_hashes, _initial_packages = initial
+    current_snapshot, current_hashes, current_packages = current
 
-    # Only include files whose mtime falls within the execution window
+    # Only include files whose mtime falls within the execution window;
+    # an unknown mtime (None, see _settle_overlap) never does
     def in_window(mtime):
-        return _execution_start_time <= mtime <= _execution_end_time
+        return mtime is not None and start_time <= mtime <= end_time
 
     # Find newly created files
     created_files = []
@@ -205,13 +333,25 @@ def stop_trace():
                 "mtime": mtime
             })
 
-    # Find modified files (files that existed before but have different mtime)
+    # Find modified files (files that existed before but have different mtime,
+    # or different content in hash mode)
     modified_files = []
     for file_path in sorted(_initial_snapshot.keys()):
         if file_path in current_snapshot:
             before_mtime = _initial_snapshot[file_path]
             after_mtime = current_snapshot[file_path]
-            if after_mtime != before_mtime and in_window(after_mtime):
+            if _initial_hashes is not None and file_path in _initial_hashes and file_path in current_hashes:
+                before_hash = _initial_hashes[file_path]
+                after_hash = current_hashes[file_path]
+                if before_hash != after_hash:
+                    modified_files.append({
+                        "path": file_path,
+                        "before_mtime": before_mtime,
+                        "after_mtime": after_mtime,
+                        "before_hash": before_hash,
+                        "after_hash": after_hash
+                    })
+            elif after_mtime != before_mtime and in_window(after_mtime):
                 modified_files.append({
                     "path": file_path,
                     "before_mtime": before_mtime,
@@ -247,81 +387,386 @@ def stop_trace():
         }
     }
 
-def run_traced(command, workspace="."):
+def run_traced(command, workspace=".", ignore=None, content_hash=False, overlap=False):
     """
     Trace the effects of running a shell command in a subprocess.
     
     Args:
         command (list or str): The command to run (as for subprocess.run)
         workspace (str): The workspace directory to trace. Defaults to ".".
+        ignore: Paths to skip, as for snapshot_workspace_state().
+        content_hash (bool): Compare file contents, as for start_trace().
+        overlap (bool): Launch the command right after a names-only listing
+            of the workspace and take the full "before" snapshot (stats,
+            hashes, packages) while it runs. Files the command touches
+            before the snapshot reaches them are still reported, but a
+            modified one may have a before_mtime of None; see
+            _settle_overlap().
     
     Returns:
         dict: The diff as returned by stop_trace().
     """
-    start_trace(workspace)
-    subprocess.run(command, shell=isinstance(command, str))
-    return stop_trace()
+    trace = Trace(workspace, ignore=ignore, content_hash=content_hash, window=True)
+    if not overlap:
+        trace.start()
+        subprocess.run(command, shell=isinstance(command, str))
+        return trace.stop()
+    names = list_workspace(workspace, ignore=trace.ignore)
+    launch_time = _filesystem_time()
+    proc = subprocess.Popen(command, shell=isinstance(command, str))
+    try:
+        snapshot, hashes, packages = trace._state(trace._scan())
+    finally:
+        proc.wait()
+    trace._before = _settle_overlap(snapshot, hashes, packages, names, launch_time)
+    trace.start_time = launch_time
+    return trace.stop()
 
 
-def _snapshot_packages():
+# Margin for filesystem timestamps, which come from a coarser clock than time.time()
+_OVERLAP_SLACK = 1.0
+
+
+def _filesystem_time():
     """
-    Take a snapshot of installed Python packages using pip freeze.
+    The current time as the filesystem stamps it: the mtime of a new
+    temporary file. File timestamps come from a coarser clock than
+    time.time(), so a write made just after time.time() was read can carry
+    an earlier mtime and fall out of the execution window.
+
     Returns:
-        set: Set of 'package==version' strings.
+        float: Seconds, rounded like the mtimes of snapshots.
     """
     try:
-        result = subprocess.run(["python3", "-m", "pip", "freeze"], capture_output=True, text=True, check=True)
-        lines = result.stdout.strip().split("\n")
-        return set(line for line in lines if line and not line.startswith("-") and "==" in line)
-    except Exception:
-        return set()
+        with tempfile.TemporaryFile() as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+    except OSError:
+        return time.time() - _OVERLAP_SLACK
+    sec, nsec = divmod(mtime_ns, 1000000000)
+    return sec + nsec * 1e-9
 
 
-def _take_snapshot():
+def _settle_overlap(snapshot, hashes, packages, names, launch_time):
     """
-    Take a snapshot of all files in the workspace directory recursively.
-    
+    Correct a "before" state taken while the command was already running.
+
+    ``names`` lists the files that existed at launch. Relative to it:
+    - a file the snapshot found that was not listed was created by the
+      command, so it is dropped from the before state;
+    - a listed file the snapshot saw with an mtime from after launch (minus
+      _OVERLAP_SLACK) may already hold the command's write, and a listed
+      file the snapshot did not find may have been deleted by it: both get
+      an unknown (None) mtime and no digest. stop_trace() then reports
+      them as modified if they changed in the execution window, and never
+      reports the deletion of a file whose old mtime is unknown, as it
+      never reports deleted files that were last written before launch;
+    - a distribution whose metadata was written after launch is dropped
+      from the package set, so it is reported as installed.
+
+    A file rewritten before the snapshot reached it *and* given an mtime
+    from before launch (``touch -d``, ``cp -p``, archive extraction) is not
+    reported; in content-hash mode the normal trace would catch it.
+
     Returns:
-        dict: A dictionary mapping relative file paths to their last modified time.
+        tuple: (file mtimes, file digests or None, package set)
     """
-    file_dict = {}
-    
-    for root, dirs, files in os.walk(_workspace):
-        for file in files:
-            file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(file_path, _workspace)
-            try:
-                mtime = os.path.getmtime(file_path)
-                file_dict[relative_path] = mtime
-            except (OSError, IOError):
-                # Skip files that can't be accessed
+    threshold = launch_time - _OVERLAP_SLACK
+    for relpath in list(snapshot):
+        if relpath not in names:
+            del snapshot[relpath]
+        elif snapshot[relpath] < threshold:
+            continue
+        else:
+            snapshot[relpath] = None
+        if hashes is not None:
+            hashes.pop(relpath, None)
+    for relpath in names.difference(snapshot):
+        snapshot[relpath] = None
+    recent = set(f"{dist.name}=={dist.version}" for dist in changed_since(int(threshold * 1e9)))
+    return snapshot, hashes, packages - recent
+
+
+def _snapshot_packages():
+    """
+    Take a snapshot of installed Python packages from the distribution metadata
+    on this interpreter's sys.path (same output as pip freeze, without the subprocess).
+    Returns:
+        set: Set of 'package==version' strings.
+    """
+    return set(f"{dist.name}=={dist.version}" for dist in scan_packages().values())
+
+
+class _Snapshot:
+    """
+    One walk of a workspace, shared read-only by the traces that use it.
+    ``columns`` is the compact form diffs use. Nested traces rescan against
+    ``index``: the one rescan() returned, or one built from the columns and
+    the ``dirs`` of a full walk on first use.
+    """
+    __slots__ = ("columns", "scan_ns", "_dirs", "_index")
+
+    def __init__(self, columns, scan_ns, dirs=None, index=None):
+        self.columns = columns
+        self.scan_ns = scan_ns
+        self._dirs = dirs
+        self._index = index
+
+    def index(self, ignore):
+        # Threads racing here build equal copies
+        if self._index is None:
+            self._index = index_snapshot(self.columns.stats(), self._dirs, self.scan_ns, ignore)
+        return self._index
+
+
+class _Family:
+    """
+    What a trace shares with the traces nested in it: the newest snapshot
+    any of them took.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = None
+
+    def publish(self, snapshot):
+        with self.lock:
+            if self.latest is None or snapshot.scan_ns >= self.latest.scan_ns:
+                self.latest = snapshot
+
+    def current(self):
+        with self.lock:
+            return self.latest
+
+
+def _matcher_key(matcher):
+    return matcher.key if matcher is not None else None
+
+
+class Trace:
+    """
+    Handle for one trace of a workspace. All its state lives on the handle,
+    so any number of traces can be open at once, on one thread or many.
+
+    Example:
+        with execdiff.Trace("sandbox") as task:
+            for step in plan:
+                with task.child() as t:
+                    agent.run(step)
+                print(t.diff["files"]["modified"])
+        print(task.diff)
+
+    A nested trace (see child()) does not walk the tree to start: it takes
+    the newest snapshot of its family -- the parent's start, or the stop of
+    an earlier nested trace -- and relists only the directories whose mtime
+    changed since. As with ``incremental``, a file rewritten in place between
+    that snapshot and the nested start is attributed to the nested trace.
+    stop() always walks the whole tree, and later nested traces start from
+    its snapshot.
+
+    Args:
+        workspace (str): The workspace directory to trace.
+        workers (int): Number of threads walking the tree.
+        ignore: Paths to skip, as for snapshot_workspace_state().
+        incremental (bool): Start from the persistent index and refresh it
+            on stop(), as for start_action_trace().
+        content_hash (bool): Decide "modified" by content digest.
+        window (bool): Diff as stop_trace() does (mtimes, changes within the
+            execution window, installed packages) instead of as
+            stop_action_trace().
+        persist (bool): Append the diff to the action log on stop(); only
+            for stop_action_trace()-format diffs.
+        parent (Trace): The trace this one is nested in. It only shares
+            snapshots with it for the same workspace and ignore rules.
+    """
+
+    def __init__(self, workspace=".", workers=1, ignore=None, incremental=False, content_hash=False,
+                 window=False, persist=True, parent=None):
+        self.workspace = workspace
+        self.workers = workers
+        self.ignore = resolve_ignore(workspace, ignore)
+        self.incremental = incremental
+        self.content_hash = content_hash
+        self.window = window
+        self.persist = persist
+        self.parent = parent
+        self.diff = None
+        self.start_time = None
+        self._before = None
+        if (parent is not None and os.path.abspath(parent.workspace) == os.path.abspath(workspace)
+                and _matcher_key(parent.ignore) == _matcher_key(self.ignore)):
+            self._family = parent._family
+        else:
+            self.parent = None
+            self._family = _Family()
+
+    def child(self, content_hash=None, window=None, persist=None):
+        """
+        A trace nested in this one, on the same workspace and ignore rules;
+        arguments left as None are inherited.
+
+        Returns:
+            Trace: Not started yet.
+        """
+        return Trace(self.workspace, workers=self.workers, ignore=self.ignore if self.ignore is not None else False,
+                     content_hash=self.content_hash if content_hash is None else content_hash,
+                     window=self.window if window is None else window,
+                     persist=self.persist if persist is None else persist, parent=self)
+
+    def _scan(self, base=None, final=False):
+        index = dirs = None
+        if base is not None:
+            index = rescan(self.workspace, base.index(self.ignore), ignore=self.ignore)
+            files, scan_ns = index.files, index.scan_ns
+        else:
+            scan_ns = time.time_ns()
+            dirs = {}
+            if self.incremental and final:
+                files = scan_and_index(self.workspace, ignore=self.ignore, workers=self.workers, dirs=dirs)
+            elif self.incremental:
+                files = scan_incremental(self.workspace, ignore=self.ignore, workers=self.workers, dirs=dirs)
+            else:
+                files = scan_workspace(self.workspace, workers=self.workers, ignore=self.ignore, dirs=dirs)
+        hashes = hash_snapshot(self.workspace, files) if self.content_hash else None
+        tree = dirs if index is None else {prefix: entry[0] for prefix, entry in index.dirs.items()}
+        snapshot = _Snapshot(ColumnarSnapshot.from_stats(files, hashes, tree), scan_ns, dirs=dirs, index=index)
+        self._family.publish(snapshot)
+        return snapshot
+
+    def _state(self, snapshot):
+        # The columns are shared and never modified; the stop_trace() format
+        # gets fresh dicts, which _settle_overlap() edits
+        if self.window:
+            return snapshot.columns.mtimes(), snapshot.columns.hashes(), _snapshot_packages()
+        return {"files": snapshot.columns, "packages": _package_state(self.workspace)}
+
+    def start(self):
+        """
+        Take the "before" snapshot.
+
+        Returns:
+            Trace: self.
+        """
+        if self._before is not None:
+            raise RuntimeError("Trace already started")
+        base = self._family.current() if self.parent is not None else None
+        self._before = self._state(self._scan(base))
+        self.start_time = _filesystem_time()
+        return self
+
+    def stop(self, summary=False, depth=2):
+        """
+        Take the "after" snapshot and compute the diff.
+
+        Args:
+            summary (bool): Keep no change records: "files" only has counts,
+                the net size change in "bytes", the same per directory in
+                "directories", cut to ``depth`` levels, and the directory
+                rollups "created_dirs" and "deleted_dirs". The full diff is
+                still streamed to the action log. Memory use then no longer
+                grows with the number of changes; see stream().
+            depth (int): Directory depth of the rollups.
+
+        Returns:
+            dict: The diff, in the stop_action_trace() format, or the
+            stop_trace() one for a ``window`` trace. Also stored as ``.diff``.
+        """
+        if summary:
+            for _change in self.stream(depth):
                 pass
-    
-    return file_dict
+            return self.diff
+        if self._before is None:
+            raise RuntimeError("start() must be called before stop()")
+        end_time = time.time()
+        after = self._state(self._scan(final=True))
+        if self.window:
+            self.diff = _compare_states(self._before, after, self.start_time, end_time)
+        else:
+            self.diff = _diff_states(self._before, after)
+            if self.persist:
+                _persist_action_log(self.diff, self.workspace)
+                try:
+                    flush_action_log()
+                except Exception:
+                    pass
+        self._before = None
+        return self.diff
+
+    def stream(self, depth=2):
+        """
+        Take the "after" snapshot and return a generator of the file changes,
+        produced while the merge-join finds them, in path order.
+
+        Once the generator is exhausted, ``.diff`` holds the summary diff
+        (see stop(summary=True)) and, with ``persist``, the full diff has
+        been appended to the action log. Dropping the generator early
+        records nothing.
+
+        Returns:
+            generator: (kind, record) pairs, as from
+            columnar.iter_changes(..., rollups=True).
+        """
+        if self.window:
+            raise RuntimeError("Only stop_action_trace()-format traces can be streamed")
+        if self._before is None:
+            raise RuntimeError("start() must be called before stop()")
+        before, self._before = self._before, None
+        after = self._state(self._scan(final=True))
+        return self._stream(before, after, depth)
+
+    def _stream(self, before, after, depth):
+        summary = ChangeSummary(depth)
+        spool = DiffSpool() if self.persist else None
+        try:
+            for kind, record in iter_changes(before["files"], after["files"], rollups=True):
+                summary.add(kind, record)
+                if spool is not None:
+                    spool.add(kind, record)
+                yield kind, record
+            diff = {"files": summary.to_dict(), "packages": _diff_packages(before["packages"], after["packages"])}
+            if spool is not None:
+                _persist_spooled_diff(spool, diff, self.workspace)
+            self.diff = diff
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.stop()
+        else:
+            self._before = None
+        return False
+
+
+
+def _collapsed(records, rollups):
+    """
+    Summary lines for created or deleted files: one per rolled-up directory,
+    then the files outside of them.
+    """
+    lines = [f"- {d['path']} ({d['files']} files, {d['bytes']} bytes)" for d in rollups]
+    prefixes = tuple(d["path"] for d in rollups)
+    lines.extend(f"- {f['path']}" for f in records if not (prefixes and f["path"].startswith(prefixes)))
+    return lines
 
 
 def last_action_summary(workspace="."):
     """
     Read the latest action trace from global logs and return a human-readable summary.
     Uses EXECDIFF_LOG_DIR env var, or defaults to ~/.execdiff/logs/
+    Directories created or deleted as a whole are listed once, with their
+    file count and size, instead of file by file.
     Returns:
         str: Human-readable summary of the last AI action, or a message if no log exists.
     """
-    log_base = os.environ.get('EXECDIFF_LOG_DIR') or os.path.expanduser('~/.execdiff/logs')
-    log_file = os.path.join(log_base, "actions.jsonl")
-    
-    if not os.path.exists(log_file):
-        return "No action history found."
-    
     try:
-        # Read the last line
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-            if not lines:
-                return "No action history found."
-            last_line = lines[-1].strip()
-        
-        entry = json.loads(last_line)
+        # Only the end of the log is read, however long it has grown
+        entry = last_entry()
+        if entry is None:
+            return "No action history found."
         diff = entry.get("diff", {})
         files = diff.get("files", {})
         packages = diff.get("packages", {})
@@ -334,7 +779,8 @@ def last_action_summary(workspace="."):
         if pkg_installed:
             summary_lines.append("Installed:")
             for pkg in pkg_installed:
-                summary_lines.append(f"- {pkg['name']}=={pkg['version']}")
+                where = f" ({pkg['environment']})" if pkg.get('environment') else ""
+                summary_lines.append(f"- {pkg['name']}=={pkg['version']}{where}")
         
         pkg_upgraded = packages.get("upgraded", [])
         if pkg_upgraded:
@@ -358,15 +804,17 @@ def last_action_summary(workspace="."):
         file_created = files.get("created", [])
         if file_created:
             summary_lines.append("Created:")
-            for f in file_created:
-                summary_lines.append(f"- {f['path']}")
+            summary_lines.extend(_collapsed(file_created, files.get("created_dirs", [])))
         
         file_deleted = files.get("deleted", [])
         if file_deleted:
             summary_lines.append("Deleted:")
-            for f in file_deleted:
-                summary_lines.append(f"- {f['path']}")
+            summary_lines.extend(_collapsed(file_deleted, files.get("deleted_dirs", [])))
         
         return "\n".join(summary_lines) if len(summary_lines) > 1 else "No changes detected."
     except Exception:
         return "Error reading action history."
+
+
+# Native asyncio entry points, built on the helpers above
+from .aio import AsyncTrace, atrace, arun_traced
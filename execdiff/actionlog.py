@@ -0,0 +1,491 @@
+"""
+actionlog.py
+Segmented action trace log (actions.jsonl) and a streaming reader for it.
+
+New entries are appended to ``actions.jsonl``. Once it grows past the
+segment size (or age) it is moved to ``segments/<seq>.jsonl`` and, by
+default, gzip-compressed; retention settings then drop the oldest
+segments. Every segment has a sidecar ``.idx`` file with one short line per
+entry (timestamp, workspace, byte offset), so a query for one workspace or
+time range reads the indexes and seeks straight to the matching entries,
+skipping segments with no match without decompressing them.
+
+Entries are read lazily, one line at a time, either forwards or backwards
+from the end of the log in fixed-size blocks, so the last few entries of a
+log of any size cost a few block reads. Workspace and time filters look at
+the ``timestamp``/``workspace`` fields at the start of each line and only
+decode the full JSON of entries that match.
+"""
+import os
+import re
+import gzip
+import json
+import time
+import shutil
+import atexit
+import threading
+from datetime import datetime
+
+from .logwriter import BatchedWriter, FileLock
+
+__all__ = ['log_path', 'set_log_policy', 'append_entry', 'append_entries', 'append_streamed_entry',
+           'action_log_writer', 'flush_action_log', 'iter_entries', 'tail_entries', 'last_entry']
+
+_BLOCK = 64 * 1024
+_SEGMENT_DIR = "segments"
+_SEGMENT_RE = re.compile(r"^(\d+)\.jsonl(\.gz)?$")
+
+# _persist_action_log writes these two keys first, in this order
+_HEAD_RE = re.compile(rb'^\{"timestamp": "([^"]*)", "workspace": ("(?:[^"\\]|\\.)*")')
+
+_policy = {
+    # Rotate the active log once it reaches this size...
+    "segment_bytes": 16 << 20,
+    # ...or once its first entry is this old (seconds, None = never)
+    "segment_seconds": None,
+    # "gzip" or None
+    "compress": "gzip",
+    # Drop closed segments whose newest entry is older than this
+    "retention_days": None,
+    # Keep at most this many closed segments
+    "max_segments": None,
+}
+
+
+def log_path():
+    """
+    Path of the action log. Uses EXECDIFF_LOG_DIR env var, or defaults to
+    ~/.execdiff/logs/.
+    """
+    log_base = os.environ.get('EXECDIFF_LOG_DIR') or os.path.expanduser('~/.execdiff/logs')
+    return os.path.join(log_base, "actions.jsonl")
+
+
+def set_log_policy(**settings):
+    """
+    Change how the action log is segmented and retained.
+
+    Args:
+        segment_bytes (int): Rotate the active log at this size (default 16 MiB).
+        segment_seconds (float): Also rotate once its first entry is this old.
+        compress (str): "gzip" to compress closed segments, or None.
+        retention_days (float): Delete segments whose last entry is older.
+        max_segments (int): Keep at most this many closed segments.
+    """
+    for key, value in settings.items():
+        if key not in _policy:
+            raise RuntimeError(f"Unknown log policy setting: {key}")
+        if key == "compress" and value not in ("gzip", None):
+            raise RuntimeError(f"Unsupported log compression: {value}")
+        _policy[key] = value
+
+
+def _index_path(data_path):
+    if data_path.endswith(".gz"):
+        data_path = data_path[:-3]
+    return data_path[:-len(".jsonl")] + ".idx"
+
+
+def _segments(path):
+    """
+    Closed segments, oldest first, then the active log:
+    [(data path, index path), ...].
+    """
+    seg_dir = os.path.join(os.path.dirname(path), _SEGMENT_DIR)
+    found = []
+    try:
+        names = os.listdir(seg_dir)
+    except OSError:
+        names = []
+    for name in names:
+        m = _SEGMENT_RE.match(name)
+        if m is not None:
+            found.append((int(m.group(1)), bool(m.group(2)), os.path.join(seg_dir, name)))
+    found.sort()
+    result = []
+    for i, (seq, compressed, data_path) in enumerate(found):
+        # A plain copy left next to its compressed one by an interrupted rotation
+        if not compressed and i + 1 < len(found) and found[i + 1][0] == seq:
+            continue
+        result.append((data_path, _index_path(data_path)))
+    result.append((path, _index_path(path)))
+    return result
+
+
+def _read_index(idx_path):
+    """
+    Returns:
+        list or None: [(timestamp, workspace, offset), ...] or None if the
+        segment has no index (e.g. written by an older execdiff).
+    """
+    try:
+        with open(idx_path, "r", encoding="utf-8") as f:
+            rows = []
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    continue
+                try:
+                    rows.append((parts[0], json.loads(parts[1]), int(parts[2])))
+                except ValueError:
+                    continue
+            # Entries from before the index existed: not usable for seeking
+            if not rows or rows[0][2] != 0:
+                return None
+            return rows
+    except (OSError, IOError):
+        return None
+
+
+def _open_segment(data_path):
+    if data_path.endswith(".gz"):
+        return gzip.open(data_path, "rb")
+    return open(data_path, "rb")
+
+
+def _rotate(path):
+    """
+    Move the active log to the next segment number, compress it and apply
+    retention.
+    """
+    seg_dir = os.path.join(os.path.dirname(path), _SEGMENT_DIR)
+    os.makedirs(seg_dir, exist_ok=True)
+    seqs = [int(m.group(1)) for m in map(_SEGMENT_RE.match, os.listdir(seg_dir)) if m is not None]
+    seq = max(seqs) + 1 if seqs else 1
+    data_path = os.path.join(seg_dir, "%08d.jsonl" % seq)
+    os.replace(path, data_path)
+    try:
+        os.replace(_index_path(path), _index_path(data_path))
+    except OSError:
+        pass
+    if _policy["compress"] == "gzip":
+        tmp = data_path + ".gz.tmp"
+        try:
+            with open(data_path, "rb") as src, gzip.open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, _BLOCK)
+            os.replace(tmp, data_path + ".gz")
+            os.remove(data_path)
+        except (OSError, IOError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    _apply_retention(path)
+
+
+def _apply_retention(path):
+    closed = _segments(path)[:-1]
+    doomed = []
+    max_segments = _policy["max_segments"]
+    if max_segments is not None and len(closed) > max_segments:
+        doomed = closed[:len(closed) - max_segments]
+        closed = closed[len(closed) - max_segments:]
+    retention_days = _policy["retention_days"]
+    if retention_days is not None:
+        cutoff = datetime.utcfromtimestamp(time.time() - retention_days * 86400).isoformat()
+        for data_path, idx_path in closed:
+            rows = _read_index(idx_path)
+            if rows is not None:
+                newest = max(row[0] for row in rows) if rows else ""
+            else:
+                # No index: fall back to the file's age
+                newest = datetime.utcfromtimestamp(os.path.getmtime(data_path)).isoformat()
+            if newest < cutoff:
+                doomed.append((data_path, idx_path))
+    for data_path, idx_path in doomed:
+        for p in (data_path, idx_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def _needs_rotation(path, size):
+    if size >= _policy["segment_bytes"]:
+        return True
+    segment_seconds = _policy["segment_seconds"]
+    if segment_seconds is None or size == 0:
+        return False
+    try:
+        with open(_index_path(path), "r", encoding="utf-8") as f:
+            first = f.readline().split("\t", 1)[0]
+    except (OSError, IOError):
+        return False
+    cutoff = datetime.utcfromtimestamp(time.time() - segment_seconds).isoformat()
+    return bool(first) and first < cutoff
+
+
+def _rotate_if_due(path):
+    # Caller holds the log's FileLock
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if size and _needs_rotation(path, size):
+        _rotate(path)
+
+
+def _write_entries(path, entries):
+    # Caller holds the log's FileLock, so offsets can't shift under us
+    _rotate_if_due(path)
+    data = []
+    index = []
+    with open(path, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        for entry in entries:
+            line = (json.dumps(entry) + "\n").encode("utf-8")
+            data.append(line)
+            index.append("%s\t%s\t%d\n" % (entry.get("timestamp", ""), json.dumps(entry.get("workspace")), offset))
+            offset += len(line)
+        f.write(b"".join(data))
+    with open(_index_path(path), "a", encoding="utf-8") as f:
+        f.write("".join(index))
+
+
+def append_entries(entries, path=None):
+    """
+    Append entries (dicts with "timestamp" and "workspace" first) to the
+    action log and its index in one locked write, rotating the log first if
+    the policy says so.
+    """
+    path = path or log_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with FileLock(path):
+        _write_entries(path, entries)
+
+
+def append_entry(entry, path=None):
+    """
+    Append a single entry; see append_entries().
+    """
+    append_entries([entry], path)
+
+
+def append_streamed_entry(timestamp, workspace, write_line, path=None):
+    """
+    Append one entry too big to build in memory: ``write_line(f)`` writes
+    its JSON line straight into the log file, which stays locked meanwhile.
+    The line must begin with the "timestamp" and "workspace" keys, as
+    json.dumps() of an entry dict does, and end with its only newline.
+    """
+    path = path or log_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Entries still buffered for this log were made earlier: write them first
+    with _writers_lock:
+        writer = _writers.get(os.path.abspath(path))
+    if writer is not None:
+        writer.flush()
+    with FileLock(path):
+        _rotate_if_due(path)
+        with open(path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            write_line(f)
+        with open(_index_path(path), "a", encoding="utf-8") as f:
+            f.write("%s\t%s\t%d\n" % (timestamp, json.dumps(workspace), offset))
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def action_log_writer(path=None):
+    """
+    Shared BatchedWriter for an action log: entries written to it are
+    appended in batches (at most one second later, or on flush).
+    """
+    path = os.path.abspath(path or log_path())
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = _writers[path] = BatchedWriter(path, flush_interval=1.0, max_records=64,
+                                                    write_batch=_write_entries)
+        return writer
+
+
+def flush_action_log():
+    """
+    Write out entries still buffered by action_log_writer().
+    """
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+atexit.register(flush_action_log)
+
+
+def _bound(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Unix timestamp
+    return datetime.utcfromtimestamp(value).isoformat()
+
+
+def _make_filter(workspace, since, until):
+    """
+    Returns:
+        tuple: (decode, keep). decode(line) returns the decoded entry or None
+        if the line doesn't match (or isn't valid JSON); keep(timestamp,
+        workspace) is the same test for index rows; both None if there is
+        nothing to filter on.
+    """
+    if workspace is None and since is None and until is None:
+        return _loads, None
+    workspace = os.path.abspath(workspace) if workspace is not None else None
+    since = _bound(since)
+    until = _bound(until)
+
+    def keep(timestamp, entry_workspace):
+        if since is not None and timestamp < since:
+            return False
+        if until is not None and timestamp >= until:
+            return False
+        return workspace is None or entry_workspace == workspace
+
+    def decode(line):
+        m = _HEAD_RE.match(line)
+        if m is not None:
+            if not keep(m.group(1).decode("utf-8", "replace"), json.loads(m.group(2))):
+                return None
+            return _loads(line)
+        # Written by something else: decode fully and check the fields
+        entry = _loads(line)
+        if entry is None or not keep(entry.get("timestamp", ""), entry.get("workspace")):
+            return None
+        return entry
+    return decode, keep
+
+
+def _loads(line):
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        # A torn line from an interrupted writer
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _lines_backwards(f):
+    """
+    Yield the lines of an open binary file from last to first.
+    """
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    tail = b""
+    while pos > 0:
+        step = min(_BLOCK, pos)
+        pos -= step
+        f.seek(pos)
+        block = f.read(step) + tail
+        lines = block.split(b"\n")
+        # The first piece may be the end of a line starting in an earlier block
+        tail = lines[0]
+        for line in reversed(lines[1:]):
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+def _segment_lines(data_path, reverse):
+    try:
+        f = _open_segment(data_path)
+    except (OSError, IOError):
+        return
+    with f:
+        if not reverse:
+            for line in f:
+                yield line
+        elif data_path.endswith(".gz"):
+            # No cheap backward reads in a gzip stream: one segment at a time
+            for line in reversed(f.readlines()):
+                yield line
+        else:
+            for line in _lines_backwards(f):
+                yield line
+
+
+def _indexed_lines(data_path, offsets, reverse):
+    try:
+        f = _open_segment(data_path)
+    except (OSError, IOError):
+        return
+    with f:
+        if data_path.endswith(".gz"):
+            # Forward seeks only: collect the (few) matching lines, then flip
+            lines = []
+            for offset in sorted(offsets):
+                f.seek(offset)
+                lines.append(f.readline())
+            if reverse:
+                lines.reverse()
+            for line in lines:
+                yield line
+        else:
+            for offset in sorted(offsets, reverse=reverse):
+                f.seek(offset)
+                yield f.readline()
+
+
+def iter_entries(workspace=None, since=None, until=None, reverse=False, path=None):
+    """
+    Lazily iterate over logged actions, across all segments.
+
+    Args:
+        workspace (str): Only entries traced in this workspace.
+        since: Only entries at or after this time (datetime, Unix time, or
+            ISO string; naive datetimes are UTC, as logged).
+        until: Only entries strictly before this time.
+        reverse (bool): Newest first, reading the log backwards.
+        path (str): Active log file, defaulting to log_path().
+
+    Yields:
+        dict: Decoded entries ({"timestamp", "workspace", "diff"}).
+    """
+    decode, keep = _make_filter(workspace, since, until)
+    segments = _segments(path or log_path())
+    if reverse:
+        segments.reverse()
+    for data_path, idx_path in segments:
+        rows = _read_index(idx_path) if keep is not None else None
+        if rows is not None:
+            offsets = [offset for timestamp, entry_workspace, offset in rows if keep(timestamp, entry_workspace)]
+            if not offsets:
+                continue
+            lines = _indexed_lines(data_path, offsets, reverse)
+        else:
+            lines = _segment_lines(data_path, reverse)
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = decode(line)
+            if entry is not None:
+                yield entry
+
+
+def tail_entries(n, workspace=None, since=None, until=None, path=None):
+    """
+    The last ``n`` matching entries, oldest first.
+    """
+    entries = []
+    if n <= 0:
+        return entries
+    for entry in iter_entries(workspace, since, until, reverse=True, path=path):
+        entries.append(entry)
+        if len(entries) >= n:
+            break
+    entries.reverse()
+    return entries
+
+
+def last_entry(workspace=None, path=None):
+    """
+    The most recent matching entry, or None.
+    """
+    for entry in iter_entries(workspace, reverse=True, path=path):
+        return entry
+    return None
@@ -0,0 +1,119 @@
+"""
+aio.py
+asyncio entry points: ``async with atrace(workspace)`` and ``arun_traced``.
+
+The snapshot work (tree walk, optional hashing, package scan) runs in an
+executor, so the event loop keeps serving other tasks while it runs, and
+the command runs as an asyncio subprocess. Each AsyncTrace wraps a window
+Trace, so it keeps its own state and one event loop can trace many
+workspaces at once.
+"""
+import asyncio
+
+from . import Trace
+
+__all__ = ['AsyncTrace', 'atrace', 'arun_traced']
+
+
+class AsyncTrace:
+    """
+    Async context manager tracing one workspace. The diff, in the format
+    returned by stop_trace(), is available as ``.diff`` after the block.
+
+    Args:
+        workspace (str): The workspace directory to trace.
+        ignore: Paths to skip, as for snapshot_workspace_state().
+        content_hash (bool): Compare file contents, as for start_trace().
+        executor: concurrent.futures executor for the snapshot work; None
+            uses the loop's default thread pool.
+    """
+
+    def __init__(self, workspace=".", ignore=None, content_hash=False, executor=None):
+        self.workspace = workspace
+        self.ignore = ignore
+        self.content_hash = content_hash
+        self.executor = executor
+        self.diff = None
+        self._trace = None
+
+    def _open(self):
+        # Resolving the ignore rules reads .execdiffignore/.gitignore files,
+        # so the Trace is built off the loop as well
+        return Trace(self.workspace, ignore=self.ignore, content_hash=self.content_hash, window=True,
+                     persist=False).start()
+
+    async def start(self):
+        """
+        Take the initial snapshot.
+        """
+        if self._trace is not None:
+            raise RuntimeError("Trace already started")
+        loop = asyncio.get_running_loop()
+        self._trace = await loop.run_in_executor(self.executor, self._open)
+
+    async def stop(self):
+        """
+        Take the final snapshot and compute the diff.
+
+        Returns:
+            dict: The diff, also stored as ``.diff``.
+        """
+        if self._trace is None:
+            raise RuntimeError("start() must be called before stop()")
+        trace, self._trace = self._trace, None
+        loop = asyncio.get_running_loop()
+        self.diff = await loop.run_in_executor(self.executor, trace.stop)
+        return self.diff
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.stop()
+        else:
+            # The block failed: don't spend a walk on a diff nobody reads
+            self._trace = None
+        return False
+
+
+def atrace(workspace=".", ignore=None, content_hash=False, executor=None):
+    """
+    Trace a workspace around an ``async with`` block.
+
+    Example:
+        async with execdiff.atrace("sandbox-17") as trace:
+            await agent.step()
+        print(trace.diff["files"]["created"])
+
+    Returns:
+        AsyncTrace: See AsyncTrace for the arguments.
+    """
+    return AsyncTrace(workspace, ignore=ignore, content_hash=content_hash, executor=executor)
+
+
+async def arun_traced(command, workspace=".", ignore=None, content_hash=False, executor=None, **kwargs):
+    """
+    Async run_traced(): run a command as an asyncio subprocess and return
+    the workspace diff it caused.
+
+    Args:
+        command (list or str): The command; a string is run through the shell.
+        workspace (str): The workspace directory to trace. Defaults to ".".
+        ignore: Paths to skip, as for snapshot_workspace_state().
+        content_hash (bool): Compare file contents, as for start_trace().
+        executor: Executor for the snapshot work, as for AsyncTrace.
+        **kwargs: Passed on to asyncio.create_subprocess_exec/_shell
+            (cwd, env, stdout, ...).
+
+    Returns:
+        dict: The diff as returned by stop_trace().
+    """
+    async with atrace(workspace, ignore=ignore, content_hash=content_hash, executor=executor) as trace:
+        if isinstance(command, str):
+            proc = await asyncio.create_subprocess_shell(command, **kwargs)
+        else:
+            proc = await asyncio.create_subprocess_exec(*command, **kwargs)
+        await proc.wait()
+    return trace.diff
@@ -0,0 +1,193 @@
+"""
+blobstore.py
+Content-addressed store for file versions seen during a live trace.
+
+Each distinct content is stored once, zlib-compressed, under its BLAKE2b
+digest (the same digest the hash diff mode uses). Identical versions — the
+same file saved twice, or two files with equal content — share one blob.
+A small header ahead of the compressed data records the uncompressed size,
+so it can be read without inflating the blob.
+"""
+import os
+import zlib
+import struct
+import hashlib
+
+__all__ = ['BlobStore']
+
+_CHUNK = 1 << 20
+_DIGEST_SIZE = 20
+# Magic and uncompressed size. Blobs written before the header existed start
+# straight with the zlib stream (first byte 0x78), so they are told apart.
+_HEADER = struct.Struct("<4sQ")
+_MAGIC = b"\0EDB"
+
+
+class BlobStore:
+    """
+    Blobs live at ``<root>/<first two hex digits>/<rest of digest>``.
+    """
+
+    def __init__(self, root, level=1):
+        self.root = root
+        self.level = level
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def _open(self, digest):
+        """
+        Returns:
+            tuple: (file positioned at the zlib stream, uncompressed size or
+            None for a blob without a header).
+        """
+        f = open(self._path(digest), "rb")
+        header = f.read(_HEADER.size)
+        if len(header) == _HEADER.size:
+            magic, size = _HEADER.unpack(header)
+            if magic == _MAGIC:
+                return f, size
+        f.seek(0)
+        return f, None
+
+    def put_file(self, path):
+        """
+        Store a file's current content, streaming it through the hasher
+        and compressor so memory use stays flat for large files.
+
+        Returns:
+            str: Hex digest of the content, or None if it cannot be read.
+        """
+        h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+        comp = zlib.compressobj(self.level)
+        tmp = os.path.join(self.root, "tmp.%d.%d" % (os.getpid(), id(comp)))
+        try:
+            with open(path, "rb") as src, open(tmp, "wb") as out:
+                out.write(_HEADER.pack(_MAGIC, 0))
+                size = 0
+                while True:
+                    chunk = src.read(_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    h.update(chunk)
+                    out.write(comp.compress(chunk))
+                out.write(comp.flush())
+                out.seek(0)
+                out.write(_HEADER.pack(_MAGIC, size))
+            digest = h.hexdigest()
+            dest = self._path(digest)
+            if os.path.exists(dest):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(tmp, dest)
+            return digest
+        except (OSError, IOError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+
+    def get(self, digest, limit=None):
+        """
+        Args:
+            limit (int): If given, decompress at most ``limit + 1`` bytes, so
+                a result longer than ``limit`` means the content is larger.
+
+        Returns:
+            bytes: The stored content, or None if the blob is missing.
+        """
+        try:
+            f, _size = self._open(digest)
+            with f:
+                if limit is None:
+                    return zlib.decompress(f.read())
+                decomp = zlib.decompressobj()
+                out = []
+                want = limit + 1
+                while want > 0:
+                    chunk = decomp.unconsumed_tail or f.read(_CHUNK)
+                    if not chunk:
+                        break
+                    data = decomp.decompress(chunk, want)
+                    out.append(data)
+                    want -= len(data)
+                    if decomp.eof:
+                        break
+                return b"".join(out)
+        except (OSError, IOError, zlib.error):
+            return None
+
+    def size(self, digest):
+        """
+        Returns:
+            int: Uncompressed size of a blob, from its header, or None if
+            the blob is missing.
+        """
+        try:
+            f, size = self._open(digest)
+            with f:
+                if size is not None:
+                    return size
+                # Written without a header: count the bytes, streamed
+                decomp = zlib.decompressobj()
+                total = 0
+                while True:
+                    chunk = decomp.unconsumed_tail or f.read(_CHUNK)
+                    if not chunk:
+                        break
+                    total += len(decomp.decompress(chunk, _CHUNK))
+                    if decomp.eof:
+                        break
+                return total
+        except (OSError, IOError, zlib.error):
+            return None
+
+    def prune(self, keep):
+        """
+        Delete every blob whose digest is not in ``keep``.
+
+        Returns:
+            int: Number of blobs removed.
+        """
+        removed = 0
+        try:
+            buckets = os.listdir(self.root)
+        except OSError:
+            return 0
+        for bucket in buckets:
+            bucket_path = os.path.join(self.root, bucket)
+            if len(bucket) != 2 or not os.path.isdir(bucket_path):
+                continue
+            for name in os.listdir(bucket_path):
+                if bucket + name not in keep:
+                    try:
+                        os.remove(os.path.join(bucket_path, name))
+                        removed += 1
+                    except OSError:
+                        pass
+            try:
+                os.rmdir(bucket_path)
+            except OSError:
+                pass
+        return removed
+
+    def disk_usage(self):
+        """
+        Returns:
+            int: Total bytes used by stored blobs.
+        """
+        total = 0
+        for root, _dirs, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
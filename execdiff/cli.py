@@ -1,59 +1,117 @@
 
 import argparse
-import execdiff
 import os
-import time
 import threading
-from execdiff.live_trace import TraceSession, ReviewHandler
+from execdiff.live_trace import BASELINE_MODES, LiveConsole, TraceSession, ReviewHandler
+from execdiff.coalesce import Coalescer
+from execdiff.daemon import TraceDaemon, default_socket_path
+from execdiff.ignore import IgnoreMatcher
+from execdiff.watcher import WATCHER_BACKENDS, start_watcher
+
+def stop_coalescer(coalescer):
+    coalescer.stop()
+    m = coalescer.metrics()
+    print(f"Events: {m['received']} received, {m['emitted']} processed, {m['coalesced']} merged.")
 
 def main():
     parser = argparse.ArgumentParser(prog="execdiff", description="ExecDiff CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     trace_parser = subparsers.add_parser("trace", help="Trace workspace changes during AI actions")
+    trace_parser.add_argument("--watcher", choices=WATCHER_BACKENDS, default="auto",
+                              help="Change detection backend (default: inotify on Linux, polling elsewhere)")
+    trace_parser.add_argument("--interval", type=float, default=1.0,
+                              help="Poll interval in seconds for the polling backend")
+    trace_parser.add_argument("--quiet", type=float, default=0.1,
+                              help="Seconds a file must stay unchanged before its change is processed")
+    trace_parser.add_argument("--workers", type=int, default=4,
+                              help="Threads reading and diffing changed files")
+    trace_parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN",
+                              help="Ignore paths matching a gitignore-style pattern (repeatable)")
+    trace_parser.add_argument("--gitignore", action="store_true",
+                              help="Also skip paths ignored by .gitignore files")
+    trace_parser.add_argument("--no-ignore", action="store_true",
+                              help="Watch everything, including .execdiffignore'd paths")
+    trace_parser.add_argument("--baseline", choices=BASELINE_MODES, default="blobs",
+                              help="How starting file contents are kept: read into the blob store, "
+                                   "or cloned to .execdiff/baseline with a copy-on-write strategy")
+
+    subparsers.add_parser("view", help="Follow the live progress of a trace running in another terminal")
+
+    daemon_parser = subparsers.add_parser("daemon", help="Serve warm begin/end-action traces for many workspaces "
+                                                         "over a Unix socket")
+    daemon_parser.add_argument("--socket", default=None,
+                               help=f"Socket path (default: $EXECDIFF_SOCKET or {default_socket_path()})")
+    daemon_parser.add_argument("--watcher", choices=WATCHER_BACKENDS, default="auto",
+                               help="Change detection backend for registered workspaces")
+    daemon_parser.add_argument("--interval", type=float, default=1.0,
+                               help="Poll interval in seconds for the polling backend")
 
     args = parser.parse_args()
 
+    if args.command == "view":
+        # Out-of-process viewer: tails the progress file the tracer writes
+        console = LiveConsole(os.path.join(".execdiff", "live", "progress.jsonl"), [], threading.Lock())
+        try:
+            console.run()
+        except KeyboardInterrupt:
+            print()
+        return
+
+    if args.command == "daemon":
+        daemon = TraceDaemon(args.socket, backend=args.watcher, interval=args.interval)
+        print(f"execdiff daemon listening on {daemon.socket_path}. Press Ctrl+C to stop.")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            print("\nDaemon stopped.")
+        return
+
     if args.command == "trace":
         print("Tracing is ON. Live progress and review enabled. Press Ctrl+C to stop.")
-        session = TraceSession(workspace=".")
+        if args.no_ignore:
+            ignore = False
+        else:
+            ignore = IgnoreMatcher(".", patterns=args.ignore, gitignore=args.gitignore)
+        session = TraceSession(workspace=".", ignore=ignore, baseline=args.baseline,
+                               workers=args.workers)
+
+        # Settled file changes go into the session, which pairs deletes
+        # and creates into renames. Until the baseline is in they are held,
+        # then handed over in order.
+        early = []
+        early_lock = threading.Lock()
+
+        def on_settled(event_type, relpath):
+            with early_lock:
+                if early is not None:
+                    early.append((event_type, relpath))
+                    return
+            session.submit_change(relpath, event_type)
+
+        # Bursts of writes to one file are merged before anything is read
+        coalescer = Coalescer(on_settled, quiet=args.quiet)
+
+        # Watches can run out when new directories appear mid-trace
+        def on_fallback(error):
+            print(f"{error}; watching with the poll backend from now on.")
+
+        # Watch first, then capture the baseline: a change in between is
+        # seen by one or the other
+        watcher = start_watcher(session.workspace, coalescer.submit, backend=args.watcher,
+                                interval=args.interval, ignore=session.ignore, on_fallback=on_fallback)
         session.start()
+        with early_lock:
+            for event_type, relpath in early:
+                session.submit_change(relpath, event_type)
+            early = None
+        report = session.baseline_report
+        if report is not None:
+            used = ", ".join(f"{name} x{count}" for name, count in sorted(report.strategies.items()))
+            print(f"Baseline: {report.files} files ({report.bytes} bytes, {report.copied_bytes} copied) "
+                  f"in {report.seconds:.2f}s via {used or 'nothing'}.")
         review = ReviewHandler(session)
-
-        # Monitor for file changes in a background thread
-        def trace_worker():
-            # Take initial snapshot
-            prev_snapshot = {}
-            for root, dirs, files in os.walk(session.workspace):
-                for fname in files:
-                    fpath = os.path.join(root, fname)
-                    relpath = os.path.relpath(fpath, session.workspace)
-                    try:
-                        prev_snapshot[relpath] = os.path.getmtime(fpath)
-                    except Exception:
-                        pass
-            while session.running:
-                time.sleep(1)
-                for root, dirs, files in os.walk(session.workspace):
-                    for fname in files:
-                        fpath = os.path.join(root, fname)
-                        relpath = os.path.relpath(fpath, session.workspace)
-                        try:
-                            mtime = os.path.getmtime(fpath)
-                        except Exception:
-                            continue
-                        if relpath not in prev_snapshot:
-                            prev_snapshot[relpath] = mtime
-                        elif mtime != prev_snapshot[relpath]:
-                            # File modified
-                            before_path = session.snapshot_before(relpath, fpath)
-                            # Wait a moment to ensure after is written
-                            time.sleep(0.1)
-                            session.enrich_and_log_change(relpath, before_path, fpath)
-                            prev_snapshot[relpath] = mtime
-
-        trace_thread = threading.Thread(target=trace_worker, daemon=True)
-        trace_thread.start()
+        print(f"Watching with the {watcher.backend} backend.")
 
         # Main thread: handle user input for review
         try:
@@ -61,18 +119,20 @@ def main():
                 cmd = input()
                 if cmd.strip() == '':
                     print("Stopping trace...")
+                    watcher.stop()
+                    stop_coalescer(coalescer)
                     session.stop()
-                    trace_thread.join(timeout=1)
                     print("Trace stopped.")
                     break
                 if cmd.strip().startswith('r '):
                     try:
-                        n = int(cmd.strip().split()[1])
-                        review.review(n)
+                        numbers = [int(x) for x in cmd.strip().split()[1:3]]
+                        review.review(*numbers)
                     except Exception:
-                        print('Usage: r <n>')
+                        print('Usage: r <n> [m]')
         except KeyboardInterrupt:
             print("\nStopping trace...")
+            watcher.stop()
+            stop_coalescer(coalescer)
             session.stop()
-            trace_thread.join(timeout=1)
             print("Trace stopped.")
\ No newline at end of file
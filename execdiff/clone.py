@@ -0,0 +1,165 @@
+"""
+clone.py
+Cheap full-workspace baselines: copy-on-write clones of every file.
+
+Each file is cloned with the first strategy the filesystem accepts, in
+this order. "auto" prefers a real before-image over a cheap one: a hard
+link is only used where neither clone nor copy_range works.
+
+- ``reflink``: FICLONE ioctl (btrfs, XFS, bcachefs, ...). The clone shares
+  extents with the original until either is written; constant time and no
+  extra space per file.
+- ``copy_range``: ``os.copy_file_range``. The kernel copies without a round
+  trip through user space, and filesystems that support it (NFS 4.2, CIFS,
+  XFS/btrfs on recent kernels) turn it into a server-side copy or reflink.
+  Elsewhere it copies every byte.
+- ``hardlink``: ``os.link``. Constant time and space, but the baseline *is*
+  the workspace file, so a program rewriting the file in place (instead of
+  writing a new file and renaming it over) changes the baseline too. Such
+  baselines are detected as lost by comparing their mtime and size with
+  the ones recorded at link time. A same-size rewrite within the same mtime
+  tick as the link is the one case this cannot see.
+- ``copy``: plain ``shutil.copyfile``.
+
+A strategy that fails with an "unsupported" error is not retried for the
+rest of the tree.
+"""
+import os
+import time
+import errno
+import shutil
+from collections import namedtuple
+
+__all__ = ['CLONE_STRATEGIES', 'Cloner', 'BaselineReport', 'clone_tree']
+
+CLONE_STRATEGIES = ('reflink', 'copy_range', 'hardlink', 'copy')
+
+# _IOW(0x94, 9, int) from linux/fs.h
+_FICLONE = 0x40049409
+
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL,
+                errno.ENOSYS, errno.ENOTTY, errno.EPERM, errno.EMLINK}
+
+BaselineReport = namedtuple("BaselineReport", "strategies files bytes copied_bytes seconds")
+BaselineReport.__doc__ = """
+Cost of capturing a baseline.
+
+``strategies`` maps strategy name to the number of files cloned with it;
+``copied_bytes`` counts data that may have been duplicated (everything
+cloned with copy_range or copy; reflinks and hard links cost none).
+"""
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+
+
+def _copy_range(src, dst):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range not available")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        while remaining > 0:
+            n = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+            if n == 0:
+                break
+            remaining -= n
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _copy(src, dst):
+    shutil.copyfile(src, dst)
+
+
+_FUNCS = {'reflink': _reflink, 'copy_range': _copy_range, 'hardlink': _hardlink, 'copy': _copy}
+
+
+class Cloner:
+    """
+    Clones single files, remembering which strategies the target
+    filesystem rejected.
+
+    Args:
+        strategy (str): "auto" to try every strategy in CLONE_STRATEGIES
+            order, or one strategy name to use that one only.
+    """
+
+    def __init__(self, strategy="auto"):
+        if strategy == "auto":
+            self.strategies = list(CLONE_STRATEGIES)
+        elif strategy in CLONE_STRATEGIES:
+            self.strategies = [strategy]
+        else:
+            raise RuntimeError(f"Unknown clone strategy: {strategy}")
+
+    def clone(self, src, dst):
+        """
+        Clone ``src`` to ``dst`` (which must not exist).
+
+        Returns:
+            str: Strategy used.
+
+        Raises:
+            OSError: If every remaining strategy failed.
+        """
+        error = None
+        for name in list(self.strategies):
+            try:
+                _FUNCS[name](src, dst)
+                return name
+            except OSError as e:
+                error = e
+                try:
+                    os.remove(dst)
+                except OSError:
+                    pass
+                # Unsupported here: don't try it again for the rest of the tree
+                if e.errno in _UNSUPPORTED and len(self.strategies) > 1:
+                    self.strategies.remove(name)
+        raise error or OSError(errno.ENOSYS, "no clone strategy left")
+
+
+def clone_tree(workspace, files, dest, strategy="auto"):
+    """
+    Clone the given workspace files under ``dest``, replacing its contents.
+
+    Args:
+        workspace (str): Workspace root.
+        files (dict): {relpath: FileStat} as returned by scan_workspace().
+        dest (str): Baseline directory; should be on the workspace's
+            filesystem for reflinks and hard links to work.
+        strategy (str): See Cloner.
+
+    Returns:
+        tuple: ({relpath: strategy used}, BaselineReport). Files that could
+        not be cloned are left out.
+    """
+    started = time.perf_counter()
+    shutil.rmtree(dest, ignore_errors=True)
+    cloner = Cloner(strategy)
+    used = {}
+    counts = {}
+    total = copied = 0
+    made = set()
+    for relpath, st in files.items():
+        target = os.path.join(dest, relpath)
+        parent = os.path.dirname(target)
+        if parent not in made:
+            os.makedirs(parent, exist_ok=True)
+            made.add(parent)
+        try:
+            name = cloner.clone(os.path.join(workspace, relpath), target)
+        except OSError:
+            continue
+        used[relpath] = name
+        counts[name] = counts.get(name, 0) + 1
+        total += st.size
+        if name in ('copy_range', 'copy'):
+            copied += st.size
+    report = BaselineReport(counts, len(used), total, copied, time.perf_counter() - started)
+    return used, report
@@ -0,0 +1,143 @@
+"""
+coalesce.py
+Debounce stage between change detection and enrichment.
+
+Editors and code generators write the same file many times in a few
+milliseconds. The Coalescer collects raw watcher events per path and emits
+one event once the path has been quiet for ``quiet`` seconds (or, for a file
+that never settles, ``max_delay`` seconds after its first event). Event
+types are merged so the emitted one describes the net change:
+
+    CREATE + MODIFY  -> CREATE
+    CREATE + DELETE  -> nothing
+    DELETE + CREATE  -> MODIFY
+    MODIFY + DELETE  -> DELETE
+
+Submitting never blocks on enrichment, so the detection loop never sleeps.
+"""
+import time
+import heapq
+import threading
+
+__all__ = ['Coalescer']
+
+_MERGE = {
+    ("CREATE", "MODIFY"): "CREATE",
+    ("CREATE", "CREATE"): "CREATE",
+    ("CREATE", "DELETE"): None,
+    ("MODIFY", "CREATE"): "MODIFY",
+    ("MODIFY", "MODIFY"): "MODIFY",
+    ("MODIFY", "DELETE"): "DELETE",
+    ("DELETE", "CREATE"): "MODIFY",
+    ("DELETE", "MODIFY"): "MODIFY",
+    ("DELETE", "DELETE"): "DELETE",
+}
+
+
+class Coalescer:
+    """
+    Args:
+        callback (callable): callback(event_type, relpath), called from the
+            coalescer's thread once per settled path.
+        quiet (float): Seconds without new events before a path is emitted.
+        max_delay (float): Upper bound on how long a path's first event can
+            be held back.
+    """
+
+    def __init__(self, callback, quiet=0.1, max_delay=2.0):
+        self.callback = callback
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.received = 0
+        self.emitted = 0
+        self.cancelled = 0
+        # relpath -> [event type or None, first time, seq]
+        self._pending = {}
+        # (due time, seq, relpath); stale entries are skipped on pop
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, event_type, relpath):
+        """
+        Record a raw event; returns immediately.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.received += 1
+            self._seq += 1
+            entry = self._pending.get(relpath)
+            if entry is None:
+                entry = self._pending[relpath] = [event_type, now, self._seq]
+            else:
+                if entry[0] is None:
+                    # Created and deleted earlier in this window: start over
+                    entry[0] = "CREATE" if event_type != "DELETE" else None
+                else:
+                    entry[0] = _MERGE.get((entry[0], event_type), event_type)
+                entry[2] = self._seq
+            due = min(now + self.quiet, entry[1] + self.max_delay)
+            heapq.heappush(self._heap, (due, self._seq, relpath))
+            if self._heap[0][1] == self._seq:
+                self._cond.notify()
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Raw events received, events emitted, paths whose events
+            cancelled out (created then deleted), and events that did not
+            lead to an emission of their own (merged or cancelled).
+        """
+        with self._cond:
+            return {
+                "received": self.received,
+                "emitted": self.emitted,
+                "cancelled": self.cancelled,
+                "coalesced": self.received - self.emitted - len(self._pending),
+            }
+
+    def _take_due(self, now, flush):
+        due = []
+        while self._heap and (flush or self._heap[0][0] <= now):
+            _when, seq, relpath = heapq.heappop(self._heap)
+            entry = self._pending.get(relpath)
+            if entry is None or entry[2] != seq:
+                # Superseded by a later event for the same path
+                continue
+            del self._pending[relpath]
+            if entry[0] is None:
+                self.cancelled += 1
+            else:
+                self.emitted += 1
+                due.append((entry[0], relpath))
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                due = self._take_due(time.monotonic(), not self._running)
+                running = self._running
+            for event_type, relpath in due:
+                try:
+                    self.callback(event_type, relpath)
+                except Exception:
+                    pass
+            if not running:
+                return
+
+    def stop(self, timeout=None):
+        """
+        Emit everything still pending and stop the thread.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
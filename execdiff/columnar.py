@@ -0,0 +1,371 @@
+"""
+columnar.py
+Compact, array-backed file snapshots and a merge-join diff over them.
+
+A ColumnarSnapshot keeps the relpaths in one sorted list, interned so the
+before and after snapshots of a trace share their strings, and the stat
+fields in parallel ``array('q')`` columns. That is roughly a third of the
+memory of a {relpath: {"mtime", "size"}} dict. It is a read-only Mapping of
+relpath to FileRecord, which reads like those record dicts, so callers
+written against the dicts keep working. Two snapshots are diffed by walking
+both path lists in order, without building any lookup table.
+
+Since the paths under a directory are contiguous in sorted order, a subtree
+is a slice of the columns. The diff skips subtrees whose slices are equal
+on both sides and can report a subtree that only one side has as a whole.
+"""
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from .snapshot import FileStat
+
+__all__ = ['ColumnarSnapshot', 'FileRecord', 'iter_changes', 'diff_snapshots']
+
+
+def _seconds(mtime_ns):
+    # Same float as FileStat.mtime
+    sec, nsec = divmod(mtime_ns, 1000000000)
+    return sec + nsec * 1e-9
+
+
+class FileRecord(Mapping):
+    """
+    One file of a ColumnarSnapshot. Reads like the record dicts it
+    replaces: ``record["mtime"]``, ``record["size"]``, ``record.get("hash")``,
+    ``{**record}``.
+    """
+    __slots__ = ("mtime_ns", "size", "ino", "hash")
+
+    def __init__(self, mtime_ns, size, ino, hash=None):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.ino = ino
+        self.hash = hash
+
+    @property
+    def mtime(self):
+        return _seconds(self.mtime_ns)
+
+    def __getitem__(self, key):
+        if key == "mtime":
+            return self.mtime
+        if key == "size":
+            return self.size
+        if key == "hash" and self.hash is not None:
+            return self.hash
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield "mtime"
+        yield "size"
+        if self.hash is not None:
+            yield "hash"
+
+    def __len__(self):
+        return 2 if self.hash is None else 3
+
+    def __repr__(self):
+        return "FileRecord(%r)" % dict(self)
+
+
+def _subtree_end(prefix):
+    # First string sorting after every path that starts with prefix
+    return prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def _ancestors(relpath):
+    # "a/b/c.py" -> "a/", "a/b/"
+    k = relpath.find(os.sep)
+    while k >= 0:
+        yield relpath[:k + 1]
+        k = relpath.find(os.sep, k + 1)
+
+
+class ColumnarSnapshot(Mapping):
+    """
+    Read-only {relpath: FileRecord} mapping stored column-wise.
+
+    Attributes:
+        paths (list): Sorted relpaths.
+        mtime_ns, size, ino, mode (array): One entry per path.
+        digests (list): Hex content digest per path (None where the file
+            could not be read), or None when the snapshot has no hashes.
+        dirs (dict): {dir relpath + os.sep: mtime_ns} for every directory
+            walked, "" being the root, or None when the scan did not
+            record them.
+    """
+    __slots__ = ("paths", "mtime_ns", "size", "ino", "mode", "digests", "dirs")
+
+    def __init__(self, paths, mtime_ns, size, ino, mode, digests=None, dirs=None):
+        self.paths = paths
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.ino = ino
+        self.mode = mode
+        self.digests = digests
+        self.dirs = dirs
+
+    @classmethod
+    def from_stats(cls, files, hashes=None, dirs=None):
+        """
+        Args:
+            files (dict): {relpath: FileStat}, as from scan_workspace().
+            hashes (dict): {relpath: hex digest}, as from hash_snapshot().
+            dirs (dict): {dir relpath prefix: FileStat}, as filled by
+                scan_workspace(..., dirs=...), or {prefix: mtime_ns}.
+
+        Returns:
+            ColumnarSnapshot
+        """
+        paths = sorted(map(sys.intern, files))
+        stats = [files[relpath] for relpath in paths]
+        if dirs is not None:
+            dirs = {sys.intern(prefix): getattr(st, "mtime_ns", st) for prefix, st in dirs.items()}
+        return cls(
+            paths,
+            array("q", [st.mtime_ns for st in stats]),
+            array("q", [st.size for st in stats]),
+            array("q", [st.ino for st in stats]),
+            array("q", [st.mode for st in stats]),
+            [hashes.get(relpath) for relpath in paths] if hashes is not None else None,
+            dirs,
+        )
+
+    def _find(self, relpath):
+        i = bisect_left(self.paths, relpath)
+        if i < len(self.paths) and self.paths[i] == relpath:
+            return i
+        return -1
+
+    def subtree(self, prefix, lo=0):
+        """
+        Args:
+            prefix (str): Dir relpath + os.sep.
+            lo (int): Position to search from.
+
+        Returns:
+            tuple: (start, end) positions in ``paths`` of the files under
+            ``prefix``; start == end when there are none.
+        """
+        start = bisect_left(self.paths, prefix, lo)
+        return start, bisect_left(self.paths, _subtree_end(prefix), start)
+
+    def has_dir(self, prefix):
+        """
+        Returns:
+            bool: Whether the directory ``prefix`` (relpath + os.sep) was
+            there. Without ``dirs``, whether any file is under it.
+        """
+        if self.dirs is not None:
+            return prefix in self.dirs
+        start, end = self.subtree(prefix)
+        return start < end
+
+    def record(self, i):
+        """
+        Returns:
+            FileRecord: The file at position ``i`` of ``paths``.
+        """
+        return FileRecord(self.mtime_ns[i], self.size[i], self.ino[i],
+                          self.digests[i] if self.digests is not None else None)
+
+    def __getitem__(self, relpath):
+        i = self._find(relpath)
+        if i < 0:
+            raise KeyError(relpath)
+        return self.record(i)
+
+    def __contains__(self, relpath):
+        return self._find(relpath) >= 0
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def stats(self):
+        """
+        Returns:
+            dict: {relpath: FileStat}, as scan_workspace() returned it.
+        """
+        return {
+            relpath: FileStat(mtime_ns, size, ino, mode)
+            for relpath, mtime_ns, size, ino, mode in zip(self.paths, self.mtime_ns, self.size, self.ino, self.mode)
+        }
+
+    def mtimes(self):
+        """
+        Returns:
+            dict: {relpath: mtime in seconds}.
+        """
+        return {relpath: _seconds(mtime_ns) for relpath, mtime_ns in zip(self.paths, self.mtime_ns)}
+
+    def hashes(self):
+        """
+        Returns:
+            dict or None: {relpath: hex digest} for the files that have one.
+        """
+        if self.digests is None:
+            return None
+        return {relpath: digest for relpath, digest in zip(self.paths, self.digests) if digest is not None}
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: Plain {relpath: {"mtime", "size"[, "hash"]}} dicts, e.g.
+            for JSON.
+        """
+        return {relpath: dict(self.record(i)) for i, relpath in enumerate(self.paths)}
+
+
+def _entry(snapshot, i):
+    entry = {"path": snapshot.paths[i], "mtime": _seconds(snapshot.mtime_ns[i]), "size": snapshot.size[i]}
+    if snapshot.digests is not None and snapshot.digests[i] is not None:
+        entry["hash"] = snapshot.digests[i]
+    return entry
+
+
+def _same_rows(before, after, i, j, n):
+    # Sufficient for "no change" under either rule of iter_changes()
+    if before.paths[i:i + n] != after.paths[j:j + n]:
+        return False
+    if before.mtime_ns[i:i + n] != after.mtime_ns[j:j + n] or before.size[i:i + n] != after.size[j:j + n]:
+        return False
+    if before.digests is not None and after.digests is not None:
+        return before.digests[i:i + n] == after.digests[j:j + n]
+    return True
+
+
+def _unchanged_run(before, after, i, j, relpath, tried):
+    """
+    Number of rows from (i, j) on that can be skipped: the rest of the
+    outermost directory of ``relpath`` that is unchanged on both sides.
+    Directories whose own mtime changed, or that were compared once
+    already, are not tried.
+    """
+    bdirs, adirs = before.dirs, after.dirs
+    for prefix in _ancestors(relpath):
+        if prefix in tried:
+            continue
+        tried.add(prefix)
+        if bdirs is not None and adirs is not None and bdirs.get(prefix) != adirs.get(prefix):
+            # Entries were added, removed or renamed right in it
+            continue
+        end = _subtree_end(prefix)
+        n = bisect_left(before.paths, end, i) - i
+        if n == bisect_left(after.paths, end, j) - j and _same_rows(before, after, i, j, n):
+            return n
+    return 0
+
+
+def _only_subtree(relpath, other):
+    # Outermost directory of relpath that ``other`` does not have
+    for prefix in _ancestors(relpath):
+        if not other.has_dir(prefix):
+            return prefix
+    return None
+
+
+def _rollup(snapshot, prefix, start, end):
+    return {"path": prefix, "files": end - start, "bytes": sum(snapshot.size[start:end])}
+
+
+def _one_sided(kind, snapshot, other, i, rollups):
+    # The file at i, which other lacks, or all of the outermost directory of
+    # it that other lacks. Returns the position after them.
+    prefix = _only_subtree(snapshot.paths[i], other)
+    if prefix is None:
+        yield kind, _entry(snapshot, i)
+        return i + 1
+    end = snapshot.subtree(prefix, i)[1]
+    if rollups:
+        yield kind + "_dirs", _rollup(snapshot, prefix, i, end)
+    for k in range(i, end):
+        yield kind, _entry(snapshot, k)
+    return end
+
+
+def iter_changes(before, after, rollups=False):
+    """
+    Merge-join two ColumnarSnapshots, yielding each change as soon as it is
+    found, in path order.
+
+    A file is modified if its digest changed when both sides have one, and
+    otherwise if its mtime or size changed. Directories whose rows are
+    equal on both sides are skipped as a whole.
+
+    Args:
+        rollups (bool): Also yield a ("created_dirs", rollup) or
+            ("deleted_dirs", rollup) pair ahead of the files of each
+            directory that only one side has (only the outermost one), with
+            rollup = {"path": dir relpath + os.sep, "files": n, "bytes": n}.
+
+    Yields:
+        tuple: (kind, record): kind is "created", "modified" or "deleted"
+        and record is the change record in the stop_action_trace() format.
+    """
+    bp, ap = before.paths, after.paths
+    bm, am = before.mtime_ns, after.mtime_ns
+    bs, as_ = before.size, after.size
+    bd, ad = before.digests, after.digests
+    if bp == ap and bm == am and bs == as_ and (bd is None or ad is None or bd == ad):
+        # Nothing was created, deleted, touched or resized
+        return
+    nb, na = len(bp), len(ap)
+    sep = os.sep
+    i = j = 0
+    parent = ""
+    depth = 0
+    tried = set()
+    while i < nb and j < na:
+        b = bp[i]
+        a = ap[j]
+        if b == a:
+            k = a.rfind(sep) + 1
+            if k != depth or not a.startswith(parent):
+                # First file of another directory: try to skip its subtree
+                parent = a[:k]
+                depth = k
+                n = _unchanged_run(before, after, i, j, a, tried)
+                if n:
+                    i += n
+                    j += n
+                    continue
+            if bd is not None and ad is not None and bd[i] is not None and ad[j] is not None:
+                changed = bd[i] != ad[j]
+            else:
+                changed = bm[i] != am[j] or bs[i] != as_[j]
+            if changed:
+                record = {"path": a, "before_mtime": _seconds(bm[i]), "after_mtime": _seconds(am[j]),
+                          "before_size": bs[i], "after_size": as_[j]}
+                if bd is not None and ad is not None and bd[i] is not None and ad[j] is not None:
+                    record["before_hash"] = bd[i]
+                    record["after_hash"] = ad[j]
+                yield "modified", record
+            i += 1
+            j += 1
+        elif b < a:
+            i = yield from _one_sided("deleted", before, after, i, rollups)
+        else:
+            j = yield from _one_sided("created", after, before, j, rollups)
+    while i < nb:
+        i = yield from _one_sided("deleted", before, after, i, rollups)
+    while j < na:
+        j = yield from _one_sided("created", after, before, j, rollups)
+
+def diff_snapshots(before, after):
+    """
+    Collect iter_changes() into lists.
+
+    Returns:
+        tuple: (created, modified, deleted) lists of change records, sorted
+        by path, in the stop_action_trace() format.
+    """
+    changes = {"created": [], "modified": [], "deleted": []}
+    for kind, record in iter_changes(before, after):
+        changes[kind].append(record)
+    return changes["created"], changes["modified"], changes["deleted"]
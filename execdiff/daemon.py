@@ -0,0 +1,444 @@
+"""
+daemon.py
+Long-lived trace daemon: warm per-workspace state served over a Unix socket.
+
+``start_action_trace``/``stop_action_trace`` walk the whole workspace twice
+per action. The daemon instead keeps
+a WorkspaceSession per registered workspace: one walk at registration, then
+a watcher keeps every file's stat current. Beginning an action only marks a
+point in time; while it is open, the first event for a path saves that
+path's previous stat. Ending the action diffs just those paths, so its cost
+depends on how much changed, not on the size of the tree. Any number of
+workspaces, and any number of overlapping actions per workspace, can be
+traced at once.
+
+Protocol: one JSON object per line in each direction over the socket.
+
+    {"op": "register", "workspace": path, "ignore": ...} -> {"ok": true, "files": n}
+    {"op": "begin", "workspace": path, "path": [...]}    -> {"ok": true, "action": id}
+    {"op": "end", "action": id, "persist": true}         -> {"ok": true, "diff": {...}}
+    {"op": "unregister", "workspace": path}              -> {"ok": true}
+    {"op": "status"}                                     -> {"ok": true, "workspaces": {...}}
+
+Failures answer {"ok": false, "error": message}. ``begin`` registers an
+unknown workspace on the fly. Registering a workspace again with other
+ignore rules fails; an ``ignore`` of null keeps the registered ones.
+``path`` is the client's sys.path, which packages are scanned from (the
+daemon's own when absent). Diffs have the stop_action_trace() format and
+are appended to the action log unless ``persist`` is false.
+"""
+import os
+import sys
+import json
+import stat
+import socket
+import itertools
+import threading
+import socketserver
+
+from . import _diff_states, _matcher_key, _package_state, _persist_action_log
+from .actionlog import flush_action_log
+from .columnar import ColumnarSnapshot, _ancestors
+from .ignore import resolve_ignore
+from .snapshot import FileStat, scan_workspace
+from .watcher import start_watcher
+
+__all__ = ['WorkspaceSession', 'TraceDaemon', 'DaemonClient', 'default_socket_path']
+
+
+def default_socket_path():
+    """
+    Socket path from EXECDIFF_SOCKET, or ~/.execdiff/daemon.sock.
+    """
+    path = os.environ.get("EXECDIFF_SOCKET")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".execdiff", "daemon.sock")
+
+
+class WorkspaceSession:
+    """
+    Live index of one workspace and the actions open on it.
+
+    Args:
+        workspace (str): Directory to index.
+        ignore: Ignore rules, as accepted by resolve_ignore().
+        backend (str): Watcher backend, as for start_watcher().
+        interval (float): Poll interval for the polling backend.
+    """
+
+    def __init__(self, workspace, ignore=None, backend="auto", interval=1.0):
+        self.workspace = os.path.abspath(workspace)
+        self.ignore = resolve_ignore(self.workspace, ignore)
+        self.lock = threading.Lock()
+        # relpath -> FileStat; None until the initial walk is in
+        self.files = None
+        # Dir relpath prefixes ("a/b/") known to exist
+        self.dirs = set()
+        # Paths with events that arrived during the initial walk
+        self._early = set()
+        # action id -> {relpath: FileStat or None before the action touched it}
+        self.actions = {}
+        # action id -> {dir prefix: whether it existed before the action changed it}
+        self._dirs_before = {}
+        # action id -> (sys.path to scan packages from, package state at begin)
+        self._packages = {}
+        # Watch first, then walk: a change during the walk is seen by one or the other
+        self.watcher = start_watcher(self.workspace, self._on_event, backend=backend, interval=interval,
+                                     ignore=self.ignore)
+        dirs = {}
+        files = scan_workspace(self.workspace, ignore=self.ignore, dirs=dirs)
+        with self.lock:
+            self.files = files
+            self.dirs = set(dirs)
+            for relpath in self._early:
+                self._update(relpath)
+            self._early = set()
+
+    def _stat(self, relpath):
+        try:
+            st = os.stat(os.path.join(self.workspace, relpath))
+        except OSError:
+            return None
+        if stat.S_ISDIR(st.st_mode):
+            return None
+        return FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+
+    def _update(self, relpath):
+        # Caller holds the lock. Stat'ing under it keeps the newest stat last.
+        old = self.files.get(relpath)
+        for touched in self.actions.values():
+            if relpath not in touched:
+                touched[relpath] = old
+        st = self._stat(relpath)
+        if st is None:
+            self.files.pop(relpath, None)
+            # Its directories may be gone too (rm -r); the innermost first
+            for prefix in reversed(list(_ancestors(relpath))):
+                if prefix not in self.dirs or os.path.isdir(os.path.join(self.workspace, prefix)):
+                    break
+                self._set_dir(prefix, False)
+        else:
+            self.files[relpath] = st
+            for prefix in _ancestors(relpath):
+                if prefix not in self.dirs:
+                    self._set_dir(prefix, True)
+
+    def _set_dir(self, prefix, present):
+        # Caller holds the lock
+        for before in self._dirs_before.values():
+            if prefix not in before:
+                before[prefix] = prefix in self.dirs
+        if present:
+            self.dirs.add(prefix)
+        else:
+            self.dirs.discard(prefix)
+
+    def _on_event(self, event_type, relpath):
+        with self.lock:
+            if self.files is None:
+                self._early.add(relpath)
+            else:
+                self._update(relpath)
+
+    def begin(self, action, paths=None):
+        """
+        Open an action. Changes made before the call are not part of it.
+
+        Args:
+            paths (list): sys.path of the client, to scan packages from;
+                None for the daemon's own.
+        """
+        self.watcher.sync()
+        packages = _package_state(self.workspace, paths)
+        with self.lock:
+            self.actions[action] = {}
+            self._dirs_before[action] = {}
+            self._packages[action] = (paths, packages)
+
+    def end(self, action):
+        """
+        Close an action. The watcher reports writes to files that are still
+        open and touch-only mtime changes, so the diff matches what
+        stop_action_trace() would report for the same changes, including
+        the created_dirs/deleted_dirs rollups.
+
+        Returns:
+            dict: The diff, in the stop_action_trace() format.
+        """
+        self.watcher.sync()
+        with self.lock:
+            touched = self.actions.pop(action)
+            dirs_before = self._dirs_before.pop(action)
+            paths, before_packages = self._packages.pop(action)
+            current = {relpath: self.files.get(relpath) for relpath in touched}
+            prefixes = {prefix for relpath in touched for prefix in _ancestors(relpath)}
+            before_dirs = {prefix for prefix in prefixes if dirs_before.get(prefix, prefix in self.dirs)}
+            # A directory removed after its last file's event was handled
+            # raised no event of its own
+            for prefix in prefixes:
+                present = os.path.isdir(os.path.join(self.workspace, prefix))
+                if present != (prefix in self.dirs):
+                    self._set_dir(prefix, present)
+            after_dirs = prefixes & self.dirs
+        before = {"files": _columns(touched, before_dirs), "packages": before_packages}
+        after = {"files": _columns(current, after_dirs), "packages": _package_state(self.workspace, paths)}
+        return _diff_states(before, after)
+
+    def status(self):
+        with self.lock:
+            return {
+                "files": len(self.files or ()),
+                "actions": len(self.actions),
+                "backend": self.watcher.backend,
+            }
+
+    def close(self):
+        self.watcher.stop()
+
+
+def _columns(stats, dirs):
+    # The touched paths only; the dirs are the ones that tell a created or
+    # deleted directory from an existing one
+    files = {relpath: st for relpath, st in stats.items() if st is not None}
+    return ColumnarSnapshot.from_stats(files, dirs=dict.fromkeys(dirs, 0))
+
+
+def _check_ignore(session, ignore):
+    if ignore is None:
+        return
+    if _matcher_key(resolve_ignore(session.workspace, ignore)) != _matcher_key(session.ignore):
+        raise RuntimeError("%s is registered with other ignore rules; unregister it first" % session.workspace)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.trace_daemon.handle(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class TraceDaemon:
+    """
+    Serves WorkspaceSessions over a Unix domain socket.
+
+    Args:
+        socket_path (str): Where to listen; defaults to default_socket_path().
+        backend (str): Watcher backend for new workspaces.
+        interval (float): Poll interval for the polling backend.
+    """
+
+    def __init__(self, socket_path=None, backend="auto", interval=1.0):
+        self.socket_path = socket_path or default_socket_path()
+        self.backend = backend
+        self.interval = interval
+        self.sessions = {}
+        # action id -> session
+        self.actions = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._server = None
+
+    def register(self, workspace, ignore=None):
+        """
+        Session for a workspace, created on first use. ``ignore`` None keeps
+        the rules it was registered with; other rules raise RuntimeError.
+        """
+        workspace = os.path.abspath(workspace)
+        with self.lock:
+            session = self.sessions.get(workspace)
+        if session is not None:
+            _check_ignore(session, ignore)
+            return session
+        # Walks the workspace, without holding up requests for other ones;
+        # later actions on it are warm
+        session = WorkspaceSession(workspace, ignore=ignore, backend=self.backend, interval=self.interval)
+        with self.lock:
+            winner = self.sessions.setdefault(workspace, session)
+        if winner is not session:
+            # Registered concurrently by another request
+            session.close()
+            _check_ignore(winner, ignore)
+        return winner
+
+    def unregister(self, workspace):
+        workspace = os.path.abspath(workspace)
+        with self.lock:
+            session = self.sessions.pop(workspace, None)
+            if session is not None:
+                for action in list(session.actions):
+                    self.actions.pop(action, None)
+        if session is not None:
+            session.close()
+
+    def handle(self, request):
+        """
+        Serve one protocol request.
+
+        Returns:
+            dict: The response.
+        """
+        op = request.get("op")
+        if op == "register":
+            session = self.register(request["workspace"], request.get("ignore"))
+            return {"ok": True, "files": session.status()["files"]}
+        if op == "begin":
+            session = self.register(request["workspace"], request.get("ignore"))
+            action = "%d-%d" % (os.getpid(), next(self._ids))
+            session.begin(action, request.get("path"))
+            with self.lock:
+                self.actions[action] = session
+            return {"ok": True, "action": action}
+        if op == "end":
+            with self.lock:
+                session = self.actions.pop(request.get("action"), None)
+            if session is None:
+                raise RuntimeError("Unknown action: %s" % request.get("action"))
+            diff = session.end(request["action"])
+            if request.get("persist", True):
+                _persist_action_log(diff, session.workspace)
+                flush_action_log()
+            return {"ok": True, "diff": diff}
+        if op == "unregister":
+            self.unregister(request["workspace"])
+            return {"ok": True}
+        if op == "status":
+            with self.lock:
+                sessions = list(self.sessions.values())
+            return {"ok": True, "workspaces": {s.workspace: s.status() for s in sessions}}
+        raise RuntimeError("Unknown op: %s" % op)
+
+    def _claim_socket(self):
+        if not os.path.exists(self.socket_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # Left behind by a daemon that died
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError("A daemon is already listening on %s" % self.socket_path)
+
+    def serve_forever(self):
+        """
+        Listen until shutdown() is called (from another thread).
+        """
+        self._claim_socket()
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.trace_daemon = self
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+            with self.lock:
+                sessions = list(self.sessions.values())
+                self.sessions = {}
+                self.actions = {}
+            for session in sessions:
+                session.close()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class DaemonClient:
+    """
+    Client for a running TraceDaemon. One connection, shared by threads.
+
+    Example:
+        client = DaemonClient()
+        action = client.begin_action("/work/sandbox-3")
+        ...  # the agent acts
+        diff = client.end_action(action)
+
+    Args:
+        socket_path (str): Defaults to default_socket_path().
+        timeout (float): Socket timeout in seconds.
+    """
+
+    def __init__(self, socket_path=None, timeout=60.0):
+        self.socket_path = socket_path or default_socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+        self._file = self._sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def call(self, op, **fields):
+        """
+        Send one request and return its response; raises RuntimeError if
+        the daemon reports a failure.
+        """
+        fields["op"] = op
+        with self._lock:
+            self._file.write(json.dumps(fields).encode("utf-8") + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise RuntimeError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Daemon request failed"))
+        return response
+
+    def register(self, workspace, ignore=None):
+        return self.call("register", workspace=os.path.abspath(workspace), ignore=ignore)["files"]
+
+    def unregister(self, workspace):
+        self.call("unregister", workspace=os.path.abspath(workspace))
+
+    def begin_action(self, workspace=".", ignore=None, path=None):
+        """
+        Args:
+            path (list): Where packages are scanned for, defaulting to this
+                process's sys.path.
+
+        Returns:
+            str: Action id to pass to end_action().
+        """
+        if path is None:
+            path = sys.path
+        return self.call("begin", workspace=os.path.abspath(workspace), ignore=ignore,
+                         path=[os.path.abspath(p) for p in path])["action"]
+
+    def end_action(self, action, persist=True):
+        """
+        Returns:
+            dict: The diff, as stop_action_trace() returns it.
+        """
+        return self.call("end", action=action, persist=persist)["diff"]
+
+    def status(self):
+        return self.call("status")["workspaces"]
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
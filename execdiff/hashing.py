@@ -0,0 +1,151 @@
+"""
+hashing.py
+Content digests for the opt-in hash diff mode.
+
+Files are hashed with BLAKE2b, reading large files through ``mmap`` and
+smaller ones in 1 MiB chunks. Digests are cached across runs keyed on the
+file's (size, mtime_ns, inode): a file whose stat tuple is unchanged is never
+re-read. Like git's racy-index check, a cached digest is only trusted if the
+file's mtime is safely older than the moment it was hashed, so a rewrite in
+the same mtime tick as the hash is still caught.
+"""
+import os
+import mmap
+import time
+import marshal
+import hashlib
+import threading
+
+from .index import index_path
+
+__all__ = ['hash_file', 'DigestCache', 'hash_snapshot']
+
+_MAGIC = b"EXECDIFF-HASH\x01\n"
+_CHUNK = 1 << 20
+_MMAP_THRESHOLD = 8 << 20
+_DIGEST_SIZE = 20
+_RACY_NS = 2 * 1000000000
+
+
+def hash_file(path):
+    """
+    BLAKE2b digest of a file's content.
+
+    Returns:
+        bytes: The digest, or None if the file cannot be read.
+    """
+    h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= _MMAP_THRESHOLD:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        h.update(mm)
+                    return h.digest()
+                except (ValueError, OSError):
+                    # Not mappable (special file, some network filesystems)
+                    f.seek(0)
+            buf = bytearray(_CHUNK)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+    except (OSError, IOError):
+        return None
+    return h.digest()
+
+
+class DigestCache:
+    """
+    On-disk digest cache for one workspace:
+    {relpath: (size, mtime_ns, ino, digest, hashed_ns)}.
+    """
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.path = index_path(workspace, ".hashes")
+        self.entries = {}
+        self.hashed = 0
+        self.reused = 0
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(_MAGIC)) == _MAGIC:
+                    self.entries = marshal.loads(f.read())
+        except (OSError, IOError, ValueError, EOFError, TypeError):
+            self.entries = {}
+
+    def lookup(self, relpath, st):
+        """
+        Cached digest for a file whose FileStat still matches, else None.
+        """
+        cached = self.entries.get(relpath)
+        if (cached is not None and cached[0] == st.size and cached[1] == st.mtime_ns
+                and cached[2] == st.ino and st.mtime_ns < cached[4] - _RACY_NS):
+            return cached[3]
+        return None
+
+    def record(self, relpath, st, digest, hashed_ns):
+        """
+        Remember a digest computed by the caller; ``hashed_ns`` is
+        time.time_ns() taken before the content was read.
+        """
+        self.entries[relpath] = (st.size, st.mtime_ns, st.ino, digest, hashed_ns)
+
+    def digest(self, relpath, st):
+        """
+        Digest for a file given its FileStat, hashing only on a cache miss.
+        """
+        digest = self.lookup(relpath, st)
+        if digest is not None:
+            self.reused += 1
+            return digest
+        hashed_ns = time.time_ns()
+        digest = hash_file(os.path.join(self.workspace, relpath))
+        if digest is not None:
+            self.hashed += 1
+            self.record(relpath, st, digest, hashed_ns)
+        return digest
+
+    def save(self, keep=None):
+        """
+        Write the cache back, keeping only the paths in ``keep`` if given.
+        """
+        entries = self.entries
+        if keep is not None:
+            entries = {k: v for k, v in entries.items() if k in keep}
+        tmp = "%s.%d.%d.tmp" % (self.path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(_MAGIC)
+                f.write(marshal.dumps(entries))
+            os.replace(tmp, self.path)
+        except (OSError, IOError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def hash_snapshot(workspace, files):
+    """
+    Digest every file of a snapshot, reusing cached digests whose stat
+    tuple is unchanged, and persist the cache.
+
+    Args:
+        files (dict): {relpath: FileStat} as returned by scan_workspace().
+
+    Returns:
+        dict: {relpath: hex digest}; unreadable files are left out.
+    """
+    cache = DigestCache(workspace)
+    digests = {}
+    for relpath, st in files.items():
+        digest = cache.digest(relpath, st)
+        if digest is not None:
+            digests[relpath] = digest.hex()
+    cache.save(keep=files)
+    return digests
@@ -0,0 +1,261 @@
+"""
+ignore.py
+Compiled ignore rules (.gitignore / .execdiffignore semantics) applied while
+the workspace is walked, so excluded subtrees are never listed or stat'ed.
+"""
+import os
+import re
+
+__all__ = ['IgnoreMatcher', 'resolve_ignore', 'resolve_live_ignore', 'IGNORE_FILE', 'DEFAULT_IGNORE_PATTERNS']
+
+IGNORE_FILE = ".execdiffignore"
+GITIGNORE_FILE = ".gitignore"
+
+# execdiff's own state is never part of a trace, and git's object store is
+# rarely what an action means to change but can hold most of the files
+DEFAULT_IGNORE_PATTERNS = (".execdiff/", ".git/")
+
+
+class _Rule:
+    """
+    A run of consecutive patterns from one source sharing polarity and
+    dir-only flag, folded into a single regex.
+    """
+    __slots__ = ("base", "regex", "negate", "dir_only")
+
+    def __init__(self, base, regex, negate, dir_only):
+        self.base = base
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+
+
+def _translate(pattern):
+    """
+    Translate one gitignore glob (already stripped of '!' and trailing '/')
+    into a regex source matched against a '/'-separated relative path.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                at_start = i == 0 or pattern[i - 1] == "/"
+                after = pattern[i + 2:i + 3]
+                if at_start and after == "/":
+                    out.append("(?:.*/)?")
+                    i += 3
+                    continue
+                if at_start and i + 2 == n:
+                    out.append(".*")
+                    i += 2
+                    continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif c == "[":
+            j = pattern.find("]", i + 2 if pattern[i + 1:i + 2] in ("!", "^", "]") else i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    source = "".join(out)
+    return source if anchored else "(?:.*/)?" + source
+
+
+def _parse_line(line):
+    """
+    Returns:
+        tuple or None: (regex source, negate, dir_only), or None for blanks/comments.
+    """
+    line = line.rstrip("\n").rstrip("\r")
+    # Trailing spaces are dropped unless escaped
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    return _translate(line), negate, dir_only
+
+
+def _compile(patterns, base):
+    """
+    Fold an ordered pattern list into as few _Rule objects as possible.
+    """
+    rules = []
+    run = []
+    key = None
+    for pattern in patterns:
+        parsed = _parse_line(pattern)
+        if parsed is None:
+            continue
+        source, negate, dir_only = parsed
+        if (negate, dir_only) != key and run:
+            rules.append(_Rule(base, re.compile("(?:%s)\\Z" % "|".join(run)), key[0], key[1]))
+            run = []
+        key = (negate, dir_only)
+        run.append(source)
+    if run:
+        rules.append(_Rule(base, re.compile("(?:%s)\\Z" % "|".join(run)), key[0], key[1]))
+    return tuple(rules)
+
+
+def _read_patterns(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.readlines()
+    except (OSError, IOError):
+        return []
+
+
+class IgnoreMatcher:
+    """
+    Ignore rules for one workspace.
+
+    Rules are kept as per-directory chains: a directory's chain is its
+    parent's plus the patterns of its own .gitignore (when enabled). The
+    last matching rule wins, deeper files override shallower ones, and an
+    ignored directory is pruned so nothing below it can be re-included —
+    the same semantics as git.
+
+    Args:
+        workspace (str): Workspace root the patterns are relative to.
+        patterns (iterable): Extra patterns, applied after .execdiffignore.
+        gitignore (bool): Honour .gitignore files at every level.
+        execdiffignore (bool): Honour the workspace's .execdiffignore file.
+        defaults (bool): Include DEFAULT_IGNORE_PATTERNS.
+    """
+
+    def __init__(self, workspace=".", patterns=(), gitignore=False, execdiffignore=True, defaults=True):
+        self.workspace = workspace
+        self.gitignore = gitignore
+        root_patterns = list(DEFAULT_IGNORE_PATTERNS) if defaults else []
+        if execdiffignore:
+            root_patterns += _read_patterns(os.path.join(workspace, IGNORE_FILE))
+        root_patterns += list(patterns)
+        self.root_rules = _compile(root_patterns, "")
+        # Identifies the rule set, e.g. to tell whether a stored index still applies
+        self.key = (bool(gitignore), tuple(p.strip() for p in root_patterns if p.strip()))
+        # dir relpath prefix ("" or "a/b/") -> rule chain, for is_ignored()
+        self._chains = {}
+
+    def child_rules(self, rules, prefix, names):
+        """
+        Rule chain for a directory being listed, given its parent's chain and
+        the names it contains. Used by the walker: no extra syscalls unless
+        the directory actually has a .gitignore.
+        """
+        if self.gitignore and GITIGNORE_FILE in names:
+            path = os.path.join(self.workspace, prefix, GITIGNORE_FILE)
+            return rules + _compile(_read_patterns(path), prefix)
+        return rules
+
+    def match(self, rules, relpath, is_dir):
+        """
+        Decide a path against a rule chain from child_rules()/root_rules.
+        """
+        if not rules:
+            return False
+        for rule in reversed(rules):
+            if rule.dir_only and not is_dir:
+                continue
+            rel = relpath[len(rule.base):]
+            if os.sep != "/":
+                rel = rel.replace(os.sep, "/")
+            if rule.regex.match(rel):
+                return not rule.negate
+        return False
+
+    def _chain_for(self, prefix):
+        chain = self._chains.get(prefix)
+        if chain is None:
+            if not prefix:
+                chain = self.root_rules
+            else:
+                parent = prefix[:-1].rpartition(os.sep)[0]
+                chain = self._chain_for(parent + os.sep if parent else "")
+            if self.gitignore:
+                path = os.path.join(self.workspace, prefix, GITIGNORE_FILE)
+                chain = chain + _compile(_read_patterns(path), prefix)
+            self._chains[prefix] = chain
+        return chain
+
+    def is_ignored(self, relpath, is_dir=False):
+        """
+        Check a single workspace-relative path, including whether any of its
+        parent directories is ignored.
+        """
+        parts = relpath.split(os.sep)
+        prefix = ""
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if self.match(self._chain_for(prefix), prefix + part, is_dir or not last):
+                return True
+            prefix += part + os.sep
+        return False
+
+
+def resolve_ignore(workspace, ignore=None):
+    """
+    Normalise the ``ignore`` argument accepted by the tracing entry points.
+
+    Args:
+        workspace (str): Workspace root.
+        ignore: None for the defaults (execdiff's own state, .git/ and
+            .execdiffignore), True to also honour .gitignore files, False to
+            ignore nothing, an iterable of extra patterns, or a ready
+            IgnoreMatcher.
+
+    Returns:
+        IgnoreMatcher or None: None means nothing is ignored.
+    """
+    if ignore is False:
+        return None
+    if isinstance(ignore, IgnoreMatcher):
+        return ignore
+    if ignore is None:
+        return IgnoreMatcher(workspace)
+    if ignore is True:
+        return IgnoreMatcher(workspace, gitignore=True)
+    if isinstance(ignore, str):
+        ignore = [ignore]
+    return IgnoreMatcher(workspace, patterns=ignore)
+
+
+def resolve_live_ignore(workspace, ignore=None):
+    """
+    resolve_ignore() for a live trace, which writes its blob store and
+    progress file under .execdiff/: that directory stays ignored even with
+    ignore=False, or the trace would record its own writes as changes, and
+    store them again, without end.
+
+    Returns:
+        IgnoreMatcher
+    """
+    matcher = resolve_ignore(workspace, ignore)
+    if matcher is None:
+        return IgnoreMatcher(workspace, patterns=(".execdiff/",), execdiffignore=False, defaults=False)
+    return matcher
@@ -0,0 +1,306 @@
+"""
+index.py
+Persistent snapshot index so back-to-back action traces don't rescan an
+unchanged tree.
+
+The index stores, per directory, the directory's own stat plus the stats of
+its files, sorted by path. An incremental scan stats every directory but
+only lists (and stats the files of) directories whose mtime or inode
+changed; everything else is taken from the index.
+
+A directory's mtime changes when entries are created, deleted or renamed in
+it, not when an existing file is rewritten in place. An incremental scan
+therefore misses in-place rewrites made *since the index was written*;
+execdiff only uses it for the "before" side of an action trace and always
+takes the "after" side with a full scan, so changes made during the traced
+action itself are never missed.
+
+The same reuse works against a snapshot held in memory (MemoryIndex and
+rescan()), which is how nested Trace handles start without a full walk.
+"""
+import os
+import time
+import stat
+import marshal
+import hashlib
+import threading
+
+from .snapshot import FileStat, scan_workspace, _scan_dir
+
+__all__ = ['index_path', 'load_index', 'save_index', 'scan_and_index', 'scan_incremental', 'MemoryIndex',
+           'index_snapshot', 'rescan']
+
+_MAGIC = b"EXECDIFF-IDX\x01\n"
+
+# Directories modified this close to the previous scan may have changed
+# again within the same mtime tick, so they are always relisted.
+_RACY_NS = 2 * 1000000000
+
+
+class SnapshotIndex:
+    """
+    Loaded index: ``dirs`` maps dir relpath prefix to
+    (mtime_ns, ino, [subdir names], [(name, mtime_ns, size, ino, mode), ...]).
+    """
+    __slots__ = ("dirs", "scan_ns", "ignore_key")
+
+    def __init__(self, dirs, scan_ns, ignore_key):
+        self.dirs = dirs
+        self.scan_ns = scan_ns
+        self.ignore_key = ignore_key
+
+
+def index_path(workspace, suffix=".idx"):
+    """
+    Per-workspace state file. Uses EXECDIFF_INDEX_DIR env var, or
+    defaults to ~/.execdiff/index/.
+    """
+    base = os.environ.get('EXECDIFF_INDEX_DIR') or os.path.expanduser('~/.execdiff/index')
+    key = hashlib.sha1(os.fsencode(os.path.abspath(workspace))).hexdigest()[:20]
+    return os.path.join(base, key + suffix)
+
+
+def _ignore_key(ignore):
+    return ignore.key if ignore is not None else None
+
+
+def load_index(workspace, ignore=None):
+    """
+    Returns:
+        SnapshotIndex or None: None if missing, unreadable, or built with
+        different ignore rules.
+    """
+    try:
+        with open(index_path(workspace), "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            payload = marshal.loads(f.read())
+    except (OSError, IOError, ValueError, EOFError, TypeError):
+        return None
+    if payload.get("workspace") != os.path.abspath(workspace):
+        return None
+    ignore_key = payload.get("ignore")
+    if ignore_key != _ignore_key(ignore):
+        return None
+    return SnapshotIndex(payload["dirs"], payload["scan_ns"], ignore_key)
+
+
+def save_index(workspace, files, dirs, scan_ns, ignore=None):
+    """
+    Persist a snapshot taken with scan_workspace(..., dirs=...).
+
+    Args:
+        files (dict): {relpath: FileStat}
+        dirs (dict): {dir relpath prefix: FileStat}
+        scan_ns (int): time.time_ns() taken just before the scan started.
+    """
+    grouped = {}
+    for prefix, st in dirs.items():
+        grouped[prefix] = (st.mtime_ns, st.ino, [], [])
+    for prefix in dirs:
+        if prefix:
+            parent, _, name = prefix[:-1].rpartition(os.sep)
+            entry = grouped.get(parent + os.sep if parent else "")
+            if entry is not None:
+                entry[2].append(name)
+    for relpath in sorted(files):
+        parent, _, name = relpath.rpartition(os.sep)
+        entry = grouped.get(parent + os.sep if parent else "")
+        if entry is not None:
+            st = files[relpath]
+            entry[3].append((name, st.mtime_ns, st.size, st.ino, st.mode))
+    payload = {
+        "workspace": os.path.abspath(workspace),
+        "ignore": _ignore_key(ignore),
+        "scan_ns": scan_ns,
+        "dirs": grouped,
+    }
+    path = index_path(workspace)
+    # Per thread as well: traces on several threads may save at once
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(marshal.dumps(payload))
+        os.replace(tmp, path)
+    except (OSError, IOError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def scan_and_index(workspace, ignore=None, workers=1, dirs=None):
+    """
+    Full scan of the workspace that also refreshes its index.
+
+    Args:
+        dirs (dict): If given, filled as by scan_workspace().
+
+    Returns:
+        dict: {relpath: FileStat}, exactly as scan_workspace().
+    """
+    scan_ns = time.time_ns()
+    if dirs is None:
+        dirs = {}
+    files = scan_workspace(workspace, workers=workers, ignore=ignore, dirs=dirs)
+    save_index(workspace, files, dirs, scan_ns, ignore=ignore)
+    return files
+
+
+def scan_incremental(workspace, ignore=None, workers=1, dirs=None):
+    """
+    Snapshot the workspace reusing its index: directories whose own mtime
+    and inode are unchanged are not relisted and their files not re-stat'ed.
+    Falls back to scan_and_index() when there is no usable index.
+
+    Args:
+        dirs (dict): If given, filled as by scan_workspace().
+
+    Returns:
+        dict: {relpath: FileStat}, as scan_workspace().
+    """
+    index = load_index(workspace, ignore)
+    if index is None:
+        return scan_and_index(workspace, ignore=ignore, workers=workers, dirs=dirs)
+    scan_ns = time.time_ns()
+    trusted_before = index.scan_ns - _RACY_NS
+    try:
+        st = os.stat(workspace)
+    except OSError:
+        return {}
+    files = {}
+    if dirs is None:
+        dirs = {}
+    dirs[""] = FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+    rescanned = False
+    stack = [("", ignore.root_rules if ignore is not None else ())]
+    while stack:
+        prefix, rules = stack.pop()
+        current = dirs[prefix]
+        old = index.dirs.get(prefix)
+        if (old is None or old[0] != current.mtime_ns or old[1] != current.ino
+                or current.mtime_ns >= trusted_before):
+            rescanned = True
+            subdirs = []
+            _scan_dir(os.path.join(workspace, prefix), prefix, ignore, rules, files, subdirs, dirs)
+            stack.extend((subprefix, subrules) for _path, subprefix, subrules in subdirs)
+            continue
+        _mtime_ns, _ino, subdir_names, entries = old
+        if ignore is not None and ignore.gitignore:
+            rules = ignore.child_rules(rules, prefix, {entry[0] for entry in entries})
+        for name, mtime_ns, size, ino, mode in entries:
+            files[prefix + name] = FileStat(mtime_ns, size, ino, mode)
+        for name in subdir_names:
+            subprefix = prefix + name + os.sep
+            try:
+                st = os.lstat(os.path.join(workspace, subprefix))
+            except OSError:
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+            dirs[subprefix] = FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+            stack.append((subprefix, rules))
+    if rescanned:
+        save_index(workspace, files, dirs, scan_ns, ignore=ignore)
+    return files
+
+
+class MemoryIndex:
+    """
+    Snapshot held in memory for rescan(): ``files`` is {relpath: FileStat}
+    as from scan_workspace(), and ``dirs`` maps dir relpath prefix to
+    (mtime_ns, ino, [subdir names], [file relpaths]). Never modified once
+    built, so snapshots rescanned from one another share entries.
+    """
+    __slots__ = ("files", "dirs", "scan_ns", "ignore_key")
+
+    def __init__(self, files, dirs, scan_ns, ignore_key):
+        self.files = files
+        self.dirs = dirs
+        self.scan_ns = scan_ns
+        self.ignore_key = ignore_key
+
+
+def index_snapshot(files, dirs, scan_ns, ignore=None):
+    """
+    Index a snapshot taken with scan_workspace(..., dirs=...) in memory.
+
+    Args:
+        files (dict): {relpath: FileStat}
+        dirs (dict): {dir relpath prefix: FileStat}
+        scan_ns (int): time.time_ns() taken just before the scan started.
+
+    Returns:
+        MemoryIndex
+    """
+    grouped = {prefix: (st.mtime_ns, st.ino, [], []) for prefix, st in dirs.items()}
+    for prefix in dirs:
+        if prefix:
+            parent, _, name = prefix[:-1].rpartition(os.sep)
+            entry = grouped.get(parent + os.sep if parent else "")
+            if entry is not None:
+                entry[2].append(name)
+    for relpath in files:
+        parent = relpath.rpartition(os.sep)[0]
+        entry = grouped.get(parent + os.sep if parent else "")
+        if entry is not None:
+            entry[3].append(relpath)
+    return MemoryIndex(files, grouped, scan_ns, _ignore_key(ignore))
+
+
+def rescan(workspace, index, ignore=None):
+    """
+    Snapshot the workspace relative to a MemoryIndex, as scan_incremental()
+    does with the persisted index. Unchanged directories keep their entries,
+    and their files the very FileStat objects of ``index``.
+
+    Args:
+        index (MemoryIndex): Built with the same ignore rules.
+
+    Returns:
+        MemoryIndex: The new snapshot.
+    """
+    scan_ns = time.time_ns()
+    trusted_before = index.scan_ns - _RACY_NS
+    files = {}
+    grouped = {}
+    result = MemoryIndex(files, grouped, scan_ns, _ignore_key(ignore))
+    try:
+        st = os.stat(workspace)
+    except OSError:
+        return result
+    old_files = index.files
+    stack = [("", st.st_mtime_ns, st.st_ino, ignore.root_rules if ignore is not None else ())]
+    while stack:
+        prefix, mtime_ns, ino, rules = stack.pop()
+        old = index.dirs.get(prefix)
+        if old is None or old[0] != mtime_ns or old[1] != ino or mtime_ns >= trusted_before:
+            listed = {}
+            subdirs = []
+            subdir_stats = {}
+            _scan_dir(os.path.join(workspace, prefix), prefix, ignore, rules, listed, subdirs, subdir_stats)
+            files.update(listed)
+            grouped[prefix] = (mtime_ns, ino, [subprefix[len(prefix):-1] for _path, subprefix, _rules in subdirs],
+                               list(listed))
+            for _path, subprefix, subrules in subdirs:
+                sub = subdir_stats[subprefix]
+                stack.append((subprefix, sub.mtime_ns, sub.ino, subrules))
+            continue
+        grouped[prefix] = old
+        _mtime_ns, _ino, subdir_names, relpaths = old
+        if ignore is not None and ignore.gitignore:
+            rules = ignore.child_rules(rules, prefix, {relpath[len(prefix):] for relpath in relpaths})
+        for relpath in relpaths:
+            files[relpath] = old_files[relpath]
+        for name in subdir_names:
+            subprefix = prefix + name + os.sep
+            try:
+                st = os.lstat(os.path.join(workspace, subprefix))
+            except OSError:
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+            stack.append((subprefix, st.st_mtime_ns, st.st_ino, rules))
+    return result
@@ -0,0 +1,331 @@
+"""
+linediff.py
+Line diffs for live-trace events, bounded in size and time.
+
+Lines are interned to integer ids and matched the way ``git diff
+--patience`` does: common head and tail are stripped, lines that occur
+exactly once on both sides are used as anchors (longest increasing
+subsequence), and only the stretches between anchors are searched with
+Myers' O(ND) algorithm. Scattered edits in a large file therefore cost
+roughly linear time instead of O(N*D). Counting added/removed lines never
+builds diff text; ``unified_diff`` formats the same match like difflib.
+
+Both give up gracefully: inputs larger than ``max_bytes`` or containing NUL
+bytes are reported as rewritten by the caller (see is_binary), and a search
+that exceeds ``max_edits`` edits in one stretch or ``time_budget`` seconds
+overall falls back to a multiset estimate (stats) or a short notice
+(unified diff) instead of stalling the caller.
+"""
+import time
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+__all__ = ['DiffStats', 'is_binary', 'diff_stats', 'unified_diff',
+           'DEFAULT_MAX_BYTES', 'DEFAULT_MAX_EDITS', 'DEFAULT_TIME_BUDGET']
+
+DEFAULT_MAX_BYTES = 8 << 20
+DEFAULT_MAX_EDITS = 100000
+DEFAULT_TIME_BUDGET = 0.5
+
+# Review output keeps the whole search in memory, so it gets a tighter cap
+_REVIEW_MAX_EDITS = 5000
+
+_BINARY_SNIFF = 8192
+
+DiffStats = namedtuple("DiffStats", "added removed exact")
+DiffStats.__doc__ = """
+Line counts of a diff. ``exact`` is False when the budget ran out and the
+counts are a multiset estimate (lines whose number of occurrences changed)
+rather than the result of a match.
+"""
+
+
+def is_binary(data):
+    """
+    Same heuristic as git and diff: a NUL byte near the start.
+    """
+    return b"\0" in data[:_BINARY_SNIFF]
+
+
+def _intern(a_lines, b_lines):
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return a, b
+
+
+def _myers(a, b, max_d, deadline, trace=None):
+    """
+    Shortest edit distance between two id lists, or None if it exceeds
+    max_d or the deadline passes. With ``trace`` given, the V array of
+    every round is appended to it for _backtrack().
+    """
+    n, m = len(a), len(b)
+    max_d = min(max_d, n + m)
+    off = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            i = k + off
+            if k == -d or (k != d and v[i - 1] < v[i + 1]):
+                x = v[i + 1]
+            else:
+                x = v[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[i] = x
+            if x >= n and y >= m:
+                if trace is not None:
+                    trace.append(v[off - d:off + d + 1])
+                return d
+        if trace is not None:
+            trace.append(v[off - d:off + d + 1])
+        if d & 15 == 15 and time.perf_counter() > deadline:
+            return None
+    return None
+
+
+def _backtrack(trace, n, m):
+    """
+    Matching blocks (i, j, size) of the path found by _myers(), in order.
+    """
+    blocks = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        prev = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and prev[k - 1 + d - 1] < prev[k + 1 + d - 1]):
+            prev_k = k + 1
+            prev_x = prev[prev_k + d - 1]
+            mid_x = prev_x
+        else:
+            prev_k = k - 1
+            prev_x = prev[prev_k + d - 1]
+            mid_x = prev_x + 1
+        if x > mid_x:
+            blocks.append((mid_x, mid_x - k, x - mid_x))
+        x, y = prev_x, prev_x - prev_k
+    if x > 0:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def _unique_lcs(a, b, a0, a1, b0, b1):
+    """
+    Patience anchors: (i, j) pairs of lines unique on both sides, forming
+    the longest run that is in order on both.
+    """
+    counts = {}
+    for i in range(a0, a1):
+        entry = counts.get(a[i])
+        counts[a[i]] = [i, -1, 1] if entry is None else [entry[0], -1, entry[2] + 1]
+    for j in range(b0, b1):
+        entry = counts.get(b[j])
+        if entry is not None and entry[2] == 1:
+            entry[1] = j if entry[1] == -1 else -2
+    pairs = sorted((i, j) for i, j, c in counts.values() if c == 1 and j >= 0)
+    if not pairs:
+        return []
+    # Longest increasing subsequence on j, by patience sorting
+    tails = []
+    tail_idx = []
+    back = [-1] * len(pairs)
+    for n, (_i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(n)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = n
+        back[n] = tail_idx[pos - 1] if pos else -1
+    result = []
+    n = tail_idx[-1]
+    while n != -1:
+        result.append(pairs[n])
+        n = back[n]
+    result.reverse()
+    return result
+
+
+def _match(a, b, max_edits, deadline, keep_blocks):
+    """
+    Match two id lists.
+
+    Returns:
+        tuple: (number of equal lines, matching blocks (i, j, size) in order
+        if keep_blocks else []).
+
+    Raises:
+        _BudgetExceeded: A stretch needed more than max_edits edits, or the
+            deadline passed.
+    """
+    equal = 0
+    blocks = []
+    stack = [(False, 0, len(a), 0, len(b))]
+    while stack:
+        is_block, a0, a1, b0, b1 = stack.pop()
+        if is_block:
+            # Equal tail of an enclosing stretch, emitted after its content
+            blocks.append((a0, b0, a1))
+            continue
+        head = 0
+        while a0 + head < a1 and b0 + head < b1 and a[a0 + head] == b[b0 + head]:
+            head += 1
+        if head:
+            equal += head
+            if keep_blocks:
+                blocks.append((a0, b0, head))
+            a0 += head
+            b0 += head
+        tail = 0
+        while a0 < a1 - tail and b0 < b1 - tail and a[a1 - 1 - tail] == b[b1 - 1 - tail]:
+            tail += 1
+        if tail:
+            equal += tail
+            a1 -= tail
+            b1 -= tail
+            if keep_blocks:
+                stack.append((True, a1, tail, b1, None))
+        if a0 == a1 or b0 == b1:
+            continue
+        if time.perf_counter() > deadline:
+            raise _BudgetExceeded()
+        anchors = _unique_lcs(a, b, a0, a1, b0, b1)
+        if anchors:
+            equal += len(anchors)
+            # Stretches between anchors, pushed in reverse so they pop in order
+            ends = anchors[1:] + [(a1, b1)]
+            for (i, j), (next_i, next_j) in reversed(list(zip(anchors, ends))):
+                stack.append((False, i + 1, next_i, j + 1, next_j))
+                stack.append((True, i, 1, j, None))
+            stack.append((False, a0, anchors[0][0], b0, anchors[0][1]))
+            continue
+        sub_a, sub_b = a[a0:a1], b[b0:b1]
+        if set(sub_a).isdisjoint(sub_b):
+            # Nothing in common: a full replace, no search needed
+            continue
+        trace = [] if keep_blocks else None
+        d = _myers(sub_a, sub_b, max_edits, deadline, trace)
+        if d is None:
+            raise _BudgetExceeded()
+        equal += (len(sub_a) + len(sub_b) - d) // 2
+        if keep_blocks:
+            blocks.extend((i + a0, j + b0, size) for i, j, size in _backtrack(trace, len(sub_a), len(sub_b)))
+    return equal, blocks
+
+
+def _estimate(a, b):
+    ca, cb = Counter(a), Counter(b)
+    return sum((cb - ca).values()), sum((ca - cb).values())
+
+
+def diff_stats(before_lines, after_lines, max_edits=DEFAULT_MAX_EDITS, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Count added and removed lines without materialising the diff.
+
+    Returns:
+        DiffStats: Counts of the match, or an estimate if the budget ran out.
+    """
+    a, b = _intern(before_lines, after_lines)
+    try:
+        equal, _blocks = _match(a, b, max_edits, time.perf_counter() + time_budget, False)
+    except _BudgetExceeded:
+        added, removed = _estimate(a, b)
+        return DiffStats(added, removed, False)
+    return DiffStats(len(b) - equal, len(a) - equal, True)
+
+
+def _opcodes(blocks, n, m):
+    merged = []
+    for block in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == block[0] and merged[-1][1] + merged[-1][2] == block[1]:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + block[2])
+        else:
+            merged.append(block)
+    blocks = merged
+    ops = []
+    i = j = 0
+    for ai, bj, size in blocks + [(n, m, 0)]:
+        if i < ai and j < bj:
+            ops.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            ops.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            ops.append(('insert', i, ai, j, bj))
+        if size:
+            ops.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return ops
+
+
+def _grouped(ops, n=3):
+    # Same hunk grouping as difflib.SequenceMatcher.get_grouped_opcodes
+    if not ops:
+        ops = [('equal', 0, 1, 0, 1)]
+    if ops[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = ops[0]
+        ops[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if ops[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = ops[-1]
+        ops[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group = []
+    for tag, i1, i2, j1, j2 in ops:
+        if tag == 'equal' and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _range(start, stop):
+    length = stop - start
+    if length == 1:
+        return '%d' % (start + 1)
+    if not length:
+        start -= 1
+    return '%d,%d' % (start + 1, length)
+
+
+def unified_diff(before_lines, after_lines, fromfile='', tofile='', n=3,
+                 max_edits=_REVIEW_MAX_EDITS, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Unified diff of two line lists, formatted like difflib.unified_diff.
+
+    Yields:
+        str: Diff lines, or a single notice line if the budget ran out.
+    """
+    a, b = _intern(before_lines, after_lines)
+    try:
+        _equal, blocks = _match(a, b, max_edits, time.perf_counter() + time_budget, True)
+    except _BudgetExceeded:
+        yield ('(diff too large to show: more than %d changed lines in a row or %.1fs of work)\n'
+               % (max_edits, time_budget))
+        return
+    started = False
+    for group in _grouped(_opcodes(blocks, len(a), len(b)), n):
+        if not started:
+            started = True
+            yield '--- %s\n' % fromfile
+            yield '+++ %s\n' % tofile
+        first, last = group[0], group[-1]
+        yield '@@ -%s +%s @@\n' % (_range(first[1], last[2]), _range(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in before_lines[i1:i2]:
+                    yield ' ' + line
+                continue
+            for line in before_lines[i1:i2]:
+                yield '-' + line
+            for line in after_lines[j1:j2]:
+                yield '+' + line
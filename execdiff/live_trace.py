@@ -1,5 +1,5 @@
 __all__ = [
-    'TraceSession', 'ChangeEvent', 'ReviewHandler', 'LiveConsole'
+    'TraceSession', 'ChangeEvent', 'EventBus', 'EnrichmentPool', 'ReviewHandler', 'LiveConsole', 'BASELINE_MODES'
 ]
 """
 live_trace.py
@@ -8,14 +8,32 @@ Implements live progress update and review system for execdiff trace.
 import os
 import time
 import threading
-import shutil
-import difflib
 import json
+import zlib
 from datetime import datetime
 from queue import Queue
 
+from .blobstore import BlobStore
+from .clone import CLONE_STRATEGIES, clone_tree
+from .hashing import DigestCache, hash_file
+from .ignore import resolve_live_ignore
+from .logwriter import BatchedWriter
+from .linediff import DEFAULT_MAX_BYTES, DEFAULT_TIME_BUDGET, diff_stats, is_binary, unified_diff
+from .renames import RenameDetector
+from .snapshot import scan_workspace
+
+BASELINE_MODES = ('blobs', 'auto') + CLONE_STRATEGIES
+
+# Version placeholder for a file whose baseline is still the clone under
+# .execdiff/baseline and has not been read into the blob store yet
+_CLONED = '@baseline'
+# Version placeholder for a file that existed but whose content is unknown:
+# its hard-linked baseline was rewritten in place along with the file
+_LOST = '@lost'
+
 class ChangeEvent:
-    def __init__(self, time_str, event_type, target, lines, functions, imports, risk, intensity):
+    def __init__(self, time_str, event_type, target, lines, functions, imports, risk, intensity,
+                 before=None, after=None, source=None):
         self.time = time_str
         self.type = event_type
         self.target = target
@@ -24,6 +42,11 @@ class ChangeEvent:
         self.imports = imports
         self.risk = risk
         self.intensity = intensity
+        # Blob digests of the versions this change goes from/to (None = absent)
+        self.before = before
+        self.after = after
+        # Old path of a RENAME
+        self.source = source
     def to_dict(self):
         return {
             "time": self.time,
@@ -33,52 +56,417 @@ class ChangeEvent:
             "functions": self.functions,
             "imports": self.imports,
             "risk": self.risk,
-            "intensity": self.intensity
+            "intensity": self.intensity,
+            "before": self.before,
+            "after": self.after,
+            "source": self.source
         }
 
+class EventBus:
+    """
+    In-process fan-out of ChangeEvent objects: each subscriber gets its own
+    queue and sees every event published after it subscribed, with no
+    polling and no JSON round trip. close() puts None on every queue.
+    """
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+    def subscribe(self):
+        q = Queue()
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            q.put(event)
+    def close(self):
+        with self._lock:
+            subscribers = self._subscribers
+            self._subscribers = []
+        for q in subscribers:
+            q.put(None)
+
+class EnrichmentPool:
+    """
+    Runs change enrichment (reading, storing and diffing versions) on worker
+    threads so a large file never holds up detection.
+
+    Paths are sharded over the workers, so changes to one path are handled
+    one at a time in submission order. Finished events are released to the
+    session in submission order too: a slow change delays when later events
+    appear in the history, but not their detection or enrichment. Each
+    worker's queue is bounded; submit() blocks while it is full. A rename
+    is sharded by its new path.
+    """
+    def __init__(self, session, workers=4, max_pending=1024):
+        self.session = session
+        self.queues = [Queue(maxsize=max(1, max_pending // workers)) for _ in range(workers)]
+        self._submit_lock = threading.Lock()
+        self._done = threading.Condition()
+        self._next_seq = 0
+        self._release_seq = 0
+        self._finished = {}
+        self.threads = []
+        for q in self.queues:
+            t = threading.Thread(target=self._work, args=(q,), daemon=True)
+            t.start()
+            self.threads.append(t)
+    def submit(self, relpath, source=None):
+        # Detection time is taken now, not when a worker gets to it
+        time_str = datetime.now().strftime('%H:%M:%S')
+        q = self.queues[zlib.crc32(relpath.encode('utf-8', 'surrogateescape')) % len(self.queues)]
+        with self._submit_lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            q.put((seq, relpath, source, time_str))
+    def _work(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            seq, relpath, source, time_str = item
+            event = None
+            try:
+                if source is not None:
+                    before, after = self.session.record_rename(source, relpath)
+                    event = self.session.enrich_change(relpath, before, after, time_str, source=source)
+                else:
+                    before, after = self.session.record_version(relpath)
+                    if before != after:
+                        event = self.session.enrich_change(relpath, before, after, time_str)
+            except Exception:
+                pass
+            self._finish(seq, event)
+    def _finish(self, seq, event):
+        with self._done:
+            self._finished[seq] = event
+            while self._release_seq in self._finished:
+                ready = self._finished.pop(self._release_seq)
+                self._release_seq += 1
+                if ready is not None:
+                    self.session.log_event(ready)
+            self._done.notify_all()
+    def join(self, timeout=None):
+        # Wait until everything submitted so far has been released
+        with self._submit_lock:
+            target = self._next_seq
+        with self._done:
+            return self._done.wait_for(lambda: self._release_seq >= target, timeout)
+    def stop(self, timeout=None):
+        self.join(timeout)
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join(timeout)
+
 class TraceSession:
-    def __init__(self, workspace="."):
+    """
+    Live trace state: version history per file plus the change events.
+
+    Args:
+        workspace (str): Directory being traced.
+        ignore: Ignore rules, as accepted by resolve_ignore(). The session's own
+            .execdiff/ directory is ignored even with ignore=False.
+        baseline (str): How the starting content is captured. "blobs" reads
+            every file into the blob store. Any other mode clones the tree
+            to .execdiff/baseline using that strategy ("auto" takes the
+            first the filesystem supports, see clone.py); a file's clone
+            is only read when the file first changes.
+        max_diff_bytes (int): Versions larger than this, or binary ones, are
+            not diffed; their change is reported as "rewritten, N bytes".
+        diff_time_budget (float): Seconds a single diff may take before its
+            line counts are estimated instead (shown with a leading "~").
+        workers (int): Enrichment threads used by submit_change().
+        rename_window (float): Seconds a DELETE or CREATE waits for its
+            counterpart before it is reported on its own. Pairs are matched
+            by (inode, size), or by content among same-size files, and
+            reported as one RENAME.
+    """
+    def __init__(self, workspace=".", ignore=None, baseline="blobs",
+                 max_diff_bytes=DEFAULT_MAX_BYTES, diff_time_budget=DEFAULT_TIME_BUDGET, workers=4,
+                 rename_window=0.5):
+        if baseline not in BASELINE_MODES:
+            raise RuntimeError(f"Unknown baseline mode: {baseline}")
         self.workspace = workspace
-        self.snapshots_dir = os.path.join(".execdiff", "snapshots")
+        # Never includes .execdiff/: pass it on to the watcher
+        self.ignore = resolve_live_ignore(workspace, ignore)
+        self.baseline = baseline
+        self.max_diff_bytes = max_diff_bytes
+        self.diff_time_budget = diff_time_budget
+        self.workers = workers
+        self.rename_window = rename_window
+        self.pool = None
+        self.renames = None
+        self.baseline_dir = os.path.join(".execdiff", "baseline")
+        # relpath -> (mtime_ns, size) of hard-linked baselines
+        self.baseline_links = {}
+        # Files whose hard-linked baseline was overwritten in place
+        self.baseline_lost = set()
+        self.baseline_report = None
+        self.blobs_dir = os.path.join(".execdiff", "blobs")
         self.live_dir = os.path.join(".execdiff", "live")
         self.progress_file = os.path.join(self.live_dir, "progress.jsonl")
-        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self.progress_writer = None
         os.makedirs(self.live_dir, exist_ok=True)
-        self.event_queue = Queue()
+        self.blobs = BlobStore(self.blobs_dir)
+        # relpath -> blob digests of every version seen, oldest first (None = absent)
+        self.versions = {}
+        # relpath -> (inode, size, mtime_ns) as last seen, for rename pairing
+        self.file_ids = {}
+        # Live subscribers (the console); progress.jsonl is for other processes
+        self.events = EventBus()
         self.event_history = []
         self.lock = threading.Lock()
         self.running = False
     def start(self):
+        self.capture_baseline()
         self.running = True
         # Clear progress file at the start of each trace session
         with open(self.progress_file, 'w', encoding='utf-8'):
             pass
+        self._open_progress()
+        self.pool = EnrichmentPool(self, workers=self.workers)
+        self.renames = RenameDetector(self._dispatch, self._identify_deleted, self._identify_created,
+                                      self._digest_created, window=self.rename_window)
         # Start background thread for live console
-        self.console = LiveConsole(self.progress_file, self.event_history, self.lock)
+        self.console = LiveConsole(self.progress_file, self.event_history, self.lock,
+                                   events=self.events.subscribe())
         self.console_thread = threading.Thread(target=self.console.run, daemon=True)
         self.console_thread.start()
     def stop(self):
         self.running = False
+        if self.renames is not None:
+            # Unpaired creates/deletes go to the pool before it drains
+            self.renames.stop()
+            self.renames = None
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+        self.flush()
+        # Let the console drain what was published before printing the footer
+        self.events.close()
+        self.console_thread.join(timeout=2)
         self.console.stop()
-    def enrich_and_log_change(self, relpath, before_path, after_path):
+        if self.progress_writer is not None:
+            self.progress_writer.close()
+            self.progress_writer = None
+    def flush(self):
+        # Write out buffered progress events
+        if self.progress_writer is not None:
+            self.progress_writer.flush()
+    def _open_progress(self):
+        if self.progress_writer is None:
+            # One open descriptor, events appended in small locked batches
+            self.progress_writer = BatchedWriter(self.progress_file, flush_interval=0.1)
+        return self.progress_writer
+    def capture_baseline(self):
+        # Store the starting content of every file as its first version.
+        # Files whose stat matches the digest cache and whose blob survives
+        # from an earlier session are not read again.
+        stats = scan_workspace(self.workspace, ignore=self.ignore)
+        with self.lock:
+            self.file_ids = {relpath: (st.ino, st.size, st.mtime_ns) for relpath, st in stats.items()}
+        if self.baseline != 'blobs':
+            return self._clone_baseline(stats)
+        cache = DigestCache(self.workspace)
+        versions = {}
+        for relpath, st in stats.items():
+            digest = cache.lookup(relpath, st)
+            digest = digest.hex() if digest is not None else None
+            if digest is None or not self.blobs.has(digest):
+                hashed_ns = time.time_ns()
+                digest = self.blobs.put_file(os.path.join(self.workspace, relpath))
+                if digest is None:
+                    continue
+                cache.record(relpath, st, bytes.fromhex(digest), hashed_ns)
+            versions[relpath] = [digest]
+        cache.save(keep=stats)
+        with self.lock:
+            self.versions = versions
+        # Blobs from earlier sessions that no current file refers to
+        self.blobs.prune(set(history[0] for history in versions.values()))
+    def _clone_baseline(self, stats):
+        strategy = 'auto' if self.baseline == 'auto' else self.baseline
+        used, self.baseline_report = clone_tree(self.workspace, stats, self.baseline_dir, strategy)
+        links = {}
+        for relpath, name in used.items():
+            if name == 'hardlink':
+                # ctime is no use here: unlinking the workspace copy bumps it too
+                try:
+                    st = os.stat(os.path.join(self.baseline_dir, relpath))
+                except OSError:
+                    continue
+                links[relpath] = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            self.versions = {relpath: [_CLONED] for relpath in used}
+            self.baseline_links = links
+            self.baseline_lost = set()
+        self.blobs.prune(set())
+    def _read_clone(self, relpath):
+        # Move a file's cloned baseline into the blob store
+        path = os.path.join(self.baseline_dir, relpath)
+        stamp = self.baseline_links.get(relpath)
+        if stamp is not None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or (st.st_mtime_ns, st.st_size) != stamp:
+                # The hard link shares the workspace file's inode, which was rewritten in place
+                self.baseline_lost.add(relpath)
+                return _LOST
+        return self.blobs.put_file(path)
+    def record_version(self, relpath):
+        # Store the file's current content as its newest version.
+        # Returns (previous digest, current digest); None means absent.
+        with self.lock:
+            history = self.versions.get(relpath)
+            cloned = bool(history) and history[-1] == _CLONED
+        if cloned:
+            digest = self._read_clone(relpath)
+            with self.lock:
+                if history[-1] == _CLONED:
+                    history[-1] = digest
+        path = os.path.join(self.workspace, relpath)
+        ident = self._stat_id(path)
+        digest = self.blobs.put_file(path) if ident is not None else None
+        with self.lock:
+            if ident is None:
+                self.file_ids.pop(relpath, None)
+            else:
+                self.file_ids[relpath] = ident
+            history = self.versions.setdefault(relpath, [])
+            before = history[-1] if history else None
+            if not history or digest != before:
+                history.append(digest)
+        return before, digest
+    def record_rename(self, source, relpath):
+        # Move source's version history to relpath, then record relpath's
+        # current content. A file whose (inode, size, mtime) did not change
+        # in the move is not read again.
+        with self.lock:
+            history = self.versions.pop(source, None) or []
+            old_ident = self.file_ids.pop(source, None)
+            cloned = bool(history) and history[-1] == _CLONED
+        if cloned:
+            digest = self._read_clone(source)
+            with self.lock:
+                if history[-1] == _CLONED:
+                    history[-1] = digest
+        path = os.path.join(self.workspace, relpath)
+        ident = self._stat_id(path)
+        before = history[-1] if history else None
+        if ident is not None and ident == old_ident and before not in (None, _LOST):
+            digest = before
+        else:
+            digest = self.blobs.put_file(path) if ident is not None else None
+        with self.lock:
+            if ident is not None:
+                self.file_ids[relpath] = ident
+            if not history or digest != before:
+                history.append(digest)
+            self.versions[relpath] = history
+        return before, digest
+    def _stat_id(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.stat.S_ISREG(st.st_mode):
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    def _identify_deleted(self, relpath):
+        with self.lock:
+            ident = self.file_ids.get(relpath)
+            history = self.versions.get(relpath)
+            digest = history[-1] if history and history[-1] not in (_CLONED, _LOST) else None
+        if ident is None:
+            return None
+        return (ident[0], ident[1], digest)
+    def _identify_created(self, relpath):
+        return self._stat_id(os.path.join(self.workspace, relpath))
+    def _digest_created(self, relpath):
+        digest = hash_file(os.path.join(self.workspace, relpath))
+        return digest.hex() if digest is not None else None
+    def _dispatch(self, event_type, relpath, source):
+        # RenameDetector output: renames carry their old path
+        pool = self.pool
+        if pool is not None:
+            pool.submit(relpath, source if event_type == 'RENAME' else None)
+    def read_version(self, digest):
+        # Lines of a stored version; an absent version reads as empty.
+        # None if the version is binary or over max_diff_bytes.
+        if digest is None:
+            return []
+        data = self.blobs.get(digest, limit=self.max_diff_bytes)
+        if data is None:
+            return []
+        if len(data) > self.max_diff_bytes or is_binary(data):
+            return None
+        return data.decode('utf-8', errors='ignore').splitlines(keepends=True)
+    def version_size(self, digest):
+        if digest is None:
+            return 0
+        return self.blobs.size(digest) or 0
+    def submit_change(self, relpath, event_type='MODIFY'):
+        # Queue a detected change for enrichment; returns without waiting.
+        # Deletes and creates first go through rename pairing.
+        if self.pool is None:
+            raise RuntimeError("Trace session is not started")
+        # The session's own writes, whatever watcher reported them
+        if relpath.startswith('.execdiff/'):
+            return
+        self.renames.submit(event_type, relpath)
+    def enrich_and_log_change(self, relpath, before, after):
+        # Synchronous enrich + log, bypassing the pool
+        event = self.enrich_change(relpath, before, after)
+        if event is not None:
+            self.log_event(event)
+        return event
+    def enrich_change(self, relpath, before, after, time_str=None, source=None):
+        # Build the ChangeEvent for a version change without recording it.
+        # The type follows from the versions: no before is a CREATE, no
+        # after a DELETE; with a source path it is a RENAME. A lost
+        # baseline (_LOST) is a before-image that existed but can't be read.
         # Ignore internal execdiff files
         if relpath.startswith('.execdiff/'):
             return None
-        # Read before and after
-        with open(before_path, 'r', encoding='utf-8', errors='ignore') as f:
-            before_lines = f.readlines()
-        with open(after_path, 'r', encoding='utf-8', errors='ignore') as f:
-            after_lines = f.readlines()
-        diff = list(difflib.unified_diff(before_lines, after_lines, lineterm=''))
-        # Count lines added/removed
-        lines_added = sum(1 for l in diff if l.startswith('+') and not l.startswith('+++'))
-        lines_removed = sum(1 for l in diff if l.startswith('-') and not l.startswith('---'))
-        # Count new functions/imports in after
-        functions_added = sum(1 for l in after_lines if l.strip().startswith('def '))
-        imports_added = sum(1 for l in after_lines if l.strip().startswith('import '))
-        # File size delta
-        size_before = os.path.getsize(before_path)
-        size_after = os.path.getsize(after_path)
+        if source is not None:
+            event_type = 'RENAME'
+        elif before is None:
+            event_type = 'CREATE'
+        elif after is None:
+            event_type = 'DELETE'
+        else:
+            event_type = 'MODIFY'
+        # Read before and after versions from the blob store; a file moved
+        # without changes has nothing to read or diff
+        lost = before == _LOST
+        if lost:
+            # The file existed, but its old content is gone; review() explains why
+            before = None
+        before_lines = self.read_version(before) if before != after and not lost else []
+        after_lines = self.read_version(after) if before != after and not lost else []
+        if lost:
+            lines = 'baseline unavailable'
+            lines_added = functions_added = imports_added = 0
+        elif before_lines is None or after_lines is None:
+            # Binary or too large to diff
+            lines = f'rewritten, {self.version_size(after)} bytes'
+            lines_added = functions_added = imports_added = 0
+        else:
+            stats = diff_stats(before_lines, after_lines, time_budget=self.diff_time_budget)
+            lines_added, lines_removed = stats.added, stats.removed
+            lines = f'+{lines_added}/-{lines_removed}' if stats.exact else f'~+{lines_added}/-{lines_removed}'
+            # Count new functions/imports in after
+            functions_added = sum(1 for l in after_lines if l.strip().startswith('def '))
+            imports_added = sum(1 for l in after_lines if l.strip().startswith('import '))
         risk = 'low'
         if '.env' in relpath or 'Dockerfile' in relpath:
             risk = 'high'
@@ -88,203 +476,120 @@ class TraceSession:
         intensity = lines_added * 1 + functions_added * 3 + imports_added * 5
         # Event
         event = ChangeEvent(
-            time_str=datetime.now().strftime('%H:%M:%S'),
-            event_type='MODIFY',
+            time_str=time_str or datetime.now().strftime('%H:%M:%S'),
+            event_type=event_type,
             target=relpath,
-            lines=f'+{lines_added}/-{lines_removed}',
+            lines=lines,
             functions=f'+{functions_added}',
             imports=f'+{imports_added}',
             risk=risk,
-            intensity=intensity
+            intensity=intensity,
+            before=before,
+            after=after,
+            source=source
         )
+        return event
+    def log_event(self, event):
+        # Add an enriched event to the history, the live console and progress.jsonl
         with self.lock:
             self.event_history.append(event)
-        with open(self.progress_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(event.to_dict()) + '\n')
+        self.events.publish(event)
+        self._open_progress().write((json.dumps(event.to_dict()) + '\n').encode('utf-8'))
         return event
-    def snapshot_before(self, relpath, src_path):
-        # Ignore internal execdiff files
-        if relpath.startswith('.execdiff/'):
-            return None
-        dest = os.path.join(self.snapshots_dir, relpath + '.before')
-        os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.copy2(src_path, dest)
-        return dest
     def get_event_history(self):
         with self.lock:
             return list(self.event_history)
 
-        class ChangeEvent:
-            def __init__(self, time_str, event_type, target, lines, functions, imports, risk, intensity):
-                self.time = time_str
-                self.type = event_type
-                self.target = target
-                self.lines = lines
-                self.functions = functions
-                self.imports = imports
-                self.risk = risk
-                self.intensity = intensity
-            def to_dict(self):
-                return {
-                    "time": self.time,
-                    "type": self.type,
-                    "target": self.target,
-                    "lines": self.lines,
-                    "functions": self.functions,
-                    "imports": self.imports,
-                    "risk": self.risk,
-                    "intensity": self.intensity
-                }
-
-        class TraceSession:
-            def __init__(self, workspace="."):
-                self.workspace = workspace
-                self.snapshots_dir = os.path.join(".execdiff", "snapshots")
-                self.live_dir = os.path.join(".execdiff", "live")
-                self.progress_file = os.path.join(self.live_dir, "progress.jsonl")
-                os.makedirs(self.snapshots_dir, exist_ok=True)
-                os.makedirs(self.live_dir, exist_ok=True)
-                self.event_queue = Queue()
-                self.event_history = []
-                self.lock = threading.Lock()
-                self.running = False
-            def start(self):
-                self.running = True
-                # Clear progress file at the start of each trace session
-                with open(self.progress_file, 'w', encoding='utf-8'):
-                    pass
-                # Start background thread for live console
-                self.console = LiveConsole(self.progress_file, self.event_history, self.lock)
-                self.console_thread = threading.Thread(target=self.console.run, daemon=True)
-                self.console_thread.start()
-            def stop(self):
-                self.running = False
-                self.console.stop()
-            def enrich_and_log_change(self, relpath, before_path, after_path):
-                # Ignore internal execdiff files
-                if relpath.startswith('.execdiff/'):
-                    return None
-                # Read before and after
-                with open(before_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    before_lines = f.readlines()
-                with open(after_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    after_lines = f.readlines()
-                diff = list(difflib.unified_diff(before_lines, after_lines, lineterm=''))
-                # Count lines added/removed
-                lines_added = sum(1 for l in diff if l.startswith('+') and not l.startswith('+++'))
-                lines_removed = sum(1 for l in diff if l.startswith('-') and not l.startswith('---'))
-                # Count new functions/imports in after
-                functions_added = sum(1 for l in after_lines if l.strip().startswith('def '))
-                imports_added = sum(1 for l in after_lines if l.strip().startswith('import '))
-                # File size delta
-                size_before = os.path.getsize(before_path)
-                size_after = os.path.getsize(after_path)
-                # Risk
-                risk = 'low'
-                if '.env' in relpath or 'Dockerfile' in relpath:
-                    risk = 'high'
-                elif 'settings.py' in relpath or 'requirements.txt' in relpath:
-                    risk = 'medium'
-                # Intensity
-                intensity = lines_added * 1 + functions_added * 3 + imports_added * 5
-                # Event
-                event = ChangeEvent(
-                    time_str=datetime.now().strftime('%H:%M:%S'),
-                    event_type='MODIFY',
-                    target=relpath,
-                    lines=f'+{lines_added}/-{lines_removed}',
-                    functions=f'+{functions_added}',
-                    imports=f'+{imports_added}',
-                    risk=risk,
-                    intensity=intensity
-                )
-                with self.lock:
-                    self.event_history.append(event)
-                with open(self.progress_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(event.to_dict()) + '\n')
-                return event
-            def snapshot_before(self, relpath, src_path):
-                # Ignore internal execdiff files
-                if relpath.startswith('.execdiff/'):
-                    return None
-                dest = os.path.join(self.snapshots_dir, relpath + '.before')
-                os.makedirs(os.path.dirname(dest), exist_ok=True)
-                shutil.copy2(src_path, dest)
-                return dest
-            def get_event_history(self):
-                with self.lock:
-                    return list(self.event_history)
-
-        class LiveConsole:
-            def __init__(self, progress_file, event_history, lock):
-                self.progress_file = progress_file
-                self.event_history = event_history
-                self.lock = lock
-                self.running = True
-            def stop(self):
-                self.running = False
-                if hasattr(self, 'header_printed') and self.header_printed:
-                    print('\033[1m' + '└' + '─'*10 + '┴' + '─'*10 + '┴' + '─'*22 + '┘\033[0m')
-                self.print_summary()
-            def print_summary(self):
-                # Print a summary of all changes (deduplicated, only file paths)
-                with self.lock:
-                    events = [e for e in self.event_history if not e.target.startswith('.execdiff/')]
-                if not events:
-                    print("No changes detected.")
+class LiveConsole:
+    """
+    Prints a table row per change. In-process it reads ChangeEvents from an
+    EventBus subscription (``events``); without one it tails progress_file,
+    for viewers running in another process.
+    """
+    def __init__(self, progress_file, event_history, lock, events=None):
+        self.progress_file = progress_file
+        self.event_history = event_history
+        self.lock = lock
+        self.events = events
+        self.running = True
+        self.header_printed = False
+    def stop(self):
+        self.running = False
+        if hasattr(self, 'header_printed') and self.header_printed:
+            print('\033[1m' + '└' + '─'*10 + '┴' + '─'*10 + '┴' + '─'*22 + '┘\033[0m')
+        self.print_summary()
+    def print_summary(self):
+        # Print a summary of all changes (deduplicated, only file paths)
+        with self.lock:
+            events = [e for e in self.event_history if not e.target.startswith('.execdiff/')]
+        if not events:
+            print("No changes detected.")
+            return
+        print("\nSummary of changes:")
+        by_type = {'MODIFY': set(), 'CREATE': set(), 'DELETE': set(), 'RENAME': set()}
+        for e in events:
+            target = f'{e.source} -> {e.target}' if e.type == 'RENAME' else e.target
+            by_type.get(e.type, set()).add(target)
+        if by_type['CREATE']:
+            print("Created:")
+            for t in sorted(by_type['CREATE']):
+                print(f"- {t}")
+        if by_type['MODIFY']:
+            print("Modified:")
+            for t in sorted(by_type['MODIFY']):
+                print(f"- {t}")
+        if by_type['DELETE']:
+            print("Deleted:")
+            for t in sorted(by_type['DELETE']):
+                print(f"- {t}")
+        if by_type['RENAME']:
+            print("Renamed:")
+            for t in sorted(by_type['RENAME']):
+                print(f"- {t}")
+    def print_row(self, event):
+        # Skip internal execdiff files
+        if event['target'].startswith('.execdiff/'):
+            return
+        if not self.header_printed:
+            print(
+                '\033[1m'  # Bold
+                '┌' + '─'*10 + '┬' + '─'*10 + '┬' + '─'*22 + '┐\n'
+                '│' + f"{'Time':^10}" + '│' + f"{'Change':^10}" + '│' + f"{'Target':^22}" + '│\n'
+                '├' + '─'*10 + '┼' + '─'*10 + '┼' + '─'*22 + '┤\033[0m'
+            )
+            self.header_printed = True
+        # Color and symbol logic
+        type_color = {'MODIFY': '\033[94m✏️ ', 'CREATE': '\033[92m➕', 'DELETE': '\033[91m➖',
+                      'RENAME': '\033[93m↪ '}.get(event['type'], '\033[0m')
+        # Print row with box drawing (no lines/risk/score)
+        print(
+            f"│{event['time']:^10}│"
+            f"{type_color}{event['type']:^8}\033[0m │"
+            f"{event['target'][:20]:^22}│"
+        )
+    def run(self):
+        if self.events is not None:
+            # Pushed events: printed as soon as they are published
+            while True:
+                event = self.events.get()
+                if event is None:
                     return
-                print("\nSummary of changes:")
-                by_type = {'MODIFY': set(), 'CREATE': set(), 'DELETE': set()}
-                for e in events:
-                    by_type.get(e.type, set()).add(e.target)
-                if by_type['CREATE']:
-                    print("Created:")
-                    for t in sorted(by_type['CREATE']):
-                        print(f"- {t}")
-                if by_type['MODIFY']:
-                    print("Modified:")
-                    for t in sorted(by_type['MODIFY']):
-                        print(f"- {t}")
-                if by_type['DELETE']:
-                    print("Deleted:")
-                    for t in sorted(by_type['DELETE']):
-                        print(f"- {t}")
-            def run(self):
-                last_pos = 0
-                self.header_printed = False
-                header = (
-                    '\033[1m'  # Bold
-                    '┌' + '─'*10 + '┬' + '─'*10 + '┬' + '─'*22 + '┐\n'
-                    '│' + f"{'Time':^10}" + '│' + f"{'Change':^10}" + '│' + f"{'Target':^22}" + '│\n'
-                    '├' + '─'*10 + '┼' + '─'*10 + '┼' + '─'*22 + '┤\033[0m'
-                )
-                while self.running:
-                    try:
-                        with open(self.progress_file, 'r', encoding='utf-8') as f:
-                            f.seek(last_pos)
-                            while True:
-                                line = f.readline()
-                                if not line:
-                                    break
-                                event = json.loads(line)
-                                # Skip internal execdiff files
-                                if event['target'].startswith('.execdiff/'):
-                                    continue
-                                if not self.header_printed:
-                                    print(header)
-                                    self.header_printed = True
-                                # Color and symbol logic
-                                type_color = {'MODIFY': '\033[94m✏️ ', 'CREATE': '\033[92m➕', 'DELETE': '\033[91m➖'}.get(event['type'], '\033[0m')
-                                # Print row with box drawing (no lines/risk/score)
-                                print(
-                                    f"│{event['time']:^10}│"
-                                    f"{type_color}{event['type']:^8}\033[0m │"
-                                    f"{event['target'][:20]:^22}│"
-                                )
-                            last_pos = f.tell()
-                    except FileNotFoundError:
-                        pass
-                    time.sleep(0.5)
+                self.print_row(event.to_dict())
+        last_pos = 0
+        while self.running:
+            try:
+                with open(self.progress_file, 'r', encoding='utf-8') as f:
+                    f.seek(last_pos)
+                    while True:
+                        line = f.readline()
+                        if not line or not line.endswith('\n'):
+                            # Stop before a line whose batch is still being written
+                            break
+                        last_pos = f.tell()
+                        self.print_row(json.loads(line))
+            except FileNotFoundError:
+                pass
+            time.sleep(0.5)
 
 
 # --- ReviewHandler moved to top-level ---
@@ -292,21 +597,31 @@ class TraceSession:
 class ReviewHandler:
     def __init__(self, session):
         self.session = session
-    def review(self, n):
+    def review(self, n, m=None):
+        # Diff change n's before/after versions, or with m given, the
+        # version produced by change n against the one produced by change m
         events = self.session.get_event_history()
-        if n < 1 or n > len(events):
+        if n < 1 or n > len(events) or (m is not None and (m < 1 or m > len(events))):
             print('Invalid change number')
             return
         event = events[n-1]
-        relpath = event.target
-        before_path = os.path.join(self.session.snapshots_dir, relpath + '.before')
-        after_path = os.path.join(self.session.workspace, relpath)
+        if m is None:
+            old, new = event.before, event.after
+            fromfile, tofile = f'{event.target}@before', f'{event.target}@{n}'
+        else:
+            other = events[m-1]
+            old, new = event.after, other.after
+            fromfile, tofile = f'{event.target}@{n}', f'{other.target}@{m}'
+        if m is None and old is None and event.target in self.session.baseline_lost:
+            print(f'Before-image of {event.target} is unavailable: its hard-linked baseline was overwritten in place')
         try:
-            with open(before_path, 'r', encoding='utf-8', errors='ignore') as f:
-                before_lines = f.readlines()
-            with open(after_path, 'r', encoding='utf-8', errors='ignore') as f:
-                after_lines = f.readlines()
-            diff = difflib.unified_diff(before_lines, after_lines, fromfile=relpath+'.before', tofile=relpath, lineterm='')
+            before_lines = self.session.read_version(old)
+            after_lines = self.session.read_version(new)
+            if before_lines is None or after_lines is None:
+                print(f'Binary or large file: {tofile} rewritten, {self.session.version_size(new)} bytes')
+                return
+            diff = unified_diff(before_lines, after_lines, fromfile=fromfile, tofile=tofile,
+                                time_budget=self.session.diff_time_budget)
             print(''.join(diff))
         except Exception as e:
             print(f'Error during review: {e}')
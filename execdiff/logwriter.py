@@ -0,0 +1,174 @@
+"""
+logwriter.py
+Batched, lock-protected appends to the JSONL files execdiff writes.
+
+A BatchedWriter keeps its file open and buffers records, writing them in
+one go when the batch is full, when the flush interval elapses, or on
+flush()/close(). Each batch is written under an ``fcntl`` advisory lock on
+a ``<file>.lock`` sidecar, so batches from concurrent processes (several
+agents sharing one log) never interleave, and with the file opened in
+append mode every batch lands at the current end of the file.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): appends are still atomic per write call
+    fcntl = None
+
+__all__ = ['FileLock', 'BatchedWriter']
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on ``<path>.lock``, usable as a context manager.
+    Also serialises threads of this process, since flock() locks held
+    through different descriptors of one process would not.
+    """
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path + ".lock"
+        with FileLock._thread_locks_guard:
+            self._thread_lock = FileLock._thread_locks.setdefault(os.path.abspath(self.path), threading.Lock())
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+        return False
+
+
+class BatchedWriter:
+    """
+    Buffer records and append them to a file in locked batches.
+
+    Args:
+        path (str): File to append to.
+        flush_interval (float): Seconds a record may wait in the buffer;
+            None to only flush on size or explicitly.
+        max_records (int): Flush as soon as this many records are buffered.
+        max_bytes (int): Flush as soon as the buffer holds this many bytes.
+        write_batch (callable): write_batch(path, records) performs the
+            write while the lock is held. By default the records must be
+            bytes lines and are appended through a descriptor kept open
+            between batches (reopened if the file is replaced or removed).
+    """
+
+    def __init__(self, path, flush_interval=1.0, max_records=256, max_bytes=1 << 20, write_batch=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.write_batch = write_batch or self._append_lines
+        self._file = None
+        self.lock = FileLock(path)
+        self.records_written = 0
+        self.batches_written = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        # Keeps batches in order when flushes race
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        if flush_interval is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def write(self, record, size=None):
+        """
+        Buffer one record. ``size`` is its approximate size in bytes,
+        defaulting to len(record).
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Writer is closed")
+            self._pending.append(record)
+            self._pending_bytes += len(record) if size is None else size
+            full = len(self._pending) >= self.max_records or self._pending_bytes >= self.max_bytes
+            if len(self._pending) == 1:
+                self._cond.notify()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write everything buffered so far.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending
+                self._pending = []
+                self._pending_bytes = 0
+            if not batch:
+                return
+            with self.lock:
+                self.write_batch(self.path, batch)
+            self.records_written += len(batch)
+            self.batches_written += 1
+
+    def close(self):
+        """
+        Flush and stop the background flusher. Further writes raise.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append_lines(self, path, lines):
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if self._file is not None and (st is None or os.fstat(self._file.fileno()).st_ino != st.st_ino):
+            # Rotated, truncated by replacement, or deleted under us
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._file = open(path, "ab")
+        self._file.write(b"".join(lines))
+        self._file.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Give the batch time to fill up
+                self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except (OSError, IOError):
+                pass
@@ -0,0 +1,269 @@
+"""
+packages.py
+In-process snapshot of installed Python distributions.
+
+Reads ``*.dist-info`` / ``*.egg-info`` metadata straight from every
+directory on ``sys.path`` of the running interpreter instead of spawning
+``pip freeze``. Only the metadata headers (up to the first blank line) are
+read, never the long description.
+
+Listings are cached per directory, keyed on the directory's mtime and
+inode: installing, upgrading or removing a distribution always adds or
+removes a metadata directory, so an unchanged stamp means an unchanged
+listing. A snapshot where no directory changed costs one ``stat`` per
+site directory and returns the previous result as is.
+"""
+import os
+import re
+import sys
+import glob
+import site
+import time
+import threading
+from collections import namedtuple
+
+__all__ = ['Distribution', 'scan_packages', 'normalize_name', 'environment_paths', 'changed_since']
+
+Distribution = namedtuple("Distribution", "name version location environment")
+
+# Listings of directories modified this recently are not trusted by the
+# cache: a second change within the same mtime tick would go unnoticed.
+_RACY_NS = 2 * 1000000000
+
+_cache_lock = threading.Lock()
+# path -> ((mtime_ns, ino), [Distribution, ...])
+_dir_cache = {}
+# (tuple of (path, environment, stamp)) -> merged packages dict
+_merged_cache = [None, None]
+
+_NORMALIZE_RE = re.compile(r"[-_.]+")
+_DIST_INFO_RE = re.compile(r"^(?P<name>.+?)-(?P<version>[^-]+)\.dist-info$")
+_EGG_INFO_RE = re.compile(r"^(?P<name>.+?)(?:-(?P<version>[^-]+)(?:-py\d+(?:\.\d+)*)?)?\.egg-info$")
+
+
+def normalize_name(name):
+    """
+    PEP 503 project name normalisation: 'Foo_Bar.baz' -> 'foo-bar-baz'.
+    """
+    return _NORMALIZE_RE.sub("-", name).lower()
+
+
+def _read_headers(path):
+    """
+    Return (Name, Version) from a METADATA/PKG-INFO file, reading only
+    the header block.
+    """
+    name = version = None
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    break
+                if line.startswith("Name:"):
+                    name = line[5:].strip()
+                elif line.startswith("Version:"):
+                    version = line[8:].strip()
+                if name and version:
+                    break
+    except (OSError, IOError):
+        pass
+    return name, version
+
+
+def _scan_dir(path, environment, since_ns=None):
+    """
+    Yield Distribution records for the metadata directories in one
+    sys.path entry; with since_ns, only those modified at or after it.
+    """
+    try:
+        entries = os.listdir(path)
+    except OSError:
+        return
+    for entry in entries:
+        if since_ns is not None:
+            if not entry.endswith((".dist-info", ".egg-info")):
+                continue
+            try:
+                if os.lstat(os.path.join(path, entry)).st_mtime_ns < since_ns:
+                    continue
+            except OSError:
+                continue
+        if entry.endswith(".dist-info"):
+            m = _DIST_INFO_RE.match(entry)
+            meta = os.path.join(path, entry, "METADATA")
+        elif entry.endswith(".egg-info"):
+            m = _EGG_INFO_RE.match(entry)
+            meta = os.path.join(path, entry)
+            if os.path.isdir(meta):
+                meta = os.path.join(meta, "PKG-INFO")
+        else:
+            continue
+        name, version = _read_headers(meta)
+        # Fall back to the directory name if the metadata is unreadable
+        if m is not None:
+            name = name or m.group("name")
+            version = version or m.group("version")
+        if name and version:
+            yield Distribution(name, version, path, environment)
+
+
+def _classify(path):
+    """
+    Label a sys.path directory with the environment it belongs to.
+    """
+    if sys.prefix != sys.base_prefix and _is_under(path, sys.prefix):
+        return "venv"
+    try:
+        user_site = site.getusersitepackages()
+    except Exception:
+        user_site = None
+    if user_site and _is_under(path, user_site):
+        return "user"
+    if _is_under(path, sys.base_prefix) or _is_under(path, sys.base_exec_prefix):
+        return "system"
+    return "path"
+
+
+def _is_under(path, root):
+    root = os.path.abspath(root)
+    return path == root or path.startswith(root + os.sep)
+
+
+def _workspace_venvs(workspace):
+    """
+    Site-packages directories of virtualenvs created directly inside the
+    workspace (any child directory containing a pyvenv.cfg).
+    """
+    found = []
+    try:
+        children = sorted(os.listdir(workspace))
+    except OSError:
+        return found
+    for child in children:
+        root = os.path.join(workspace, child)
+        if not os.path.isfile(os.path.join(root, "pyvenv.cfg")):
+            continue
+        dirs = glob.glob(os.path.join(root, "lib", "python*", "site-packages"))
+        dirs += glob.glob(os.path.join(root, "Lib", "site-packages"))
+        for path in sorted(dirs):
+            found.append((os.path.abspath(path), "workspace:" + child))
+    return found
+
+
+def environment_paths(paths=None, workspace=None):
+    """
+    Directories to scan, in shadowing order, with their environment label.
+
+    Args:
+        paths (list): Import path of the primary environment, defaulting
+            to sys.path of the running interpreter.
+        workspace (str): If given, virtualenvs directly inside it are added
+            as extra environments, labelled "workspace:<dir>".
+
+    Returns:
+        list: (abspath, label) with label one of "venv", "user", "system",
+        "path" or "workspace:<dir>".
+    """
+    if paths is None:
+        paths = sys.path
+    result = []
+    seen = set()
+    for path in paths:
+        path = os.path.abspath(path or os.curdir)
+        if path in seen or not os.path.isdir(path):
+            continue
+        seen.add(path)
+        result.append((path, _classify(path)))
+    if workspace is not None:
+        for path, label in _workspace_venvs(workspace):
+            if path not in seen:
+                seen.add(path)
+                result.append((path, label))
+    return result
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino)
+
+
+def _listing(path, environment, stamp, now_ns, cache):
+    """
+    Distributions in one directory, rescanned only if its stamp changed.
+    """
+    if not cache:
+        return list(_scan_dir(path, environment))
+    with _cache_lock:
+        cached = _dir_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    dists = list(_scan_dir(path, environment))
+    # Don't cache listings a same-tick modification could invalidate
+    cacheable = stamp is not None and stamp[0] < now_ns - _RACY_NS
+    with _cache_lock:
+        _dir_cache[path] = (stamp if cacheable else None, dists)
+    return dists
+
+
+def scan_packages(paths=None, workspace=None, cache=True):
+    """
+    Snapshot the distributions importable from the given paths.
+
+    Args:
+        paths (list): Directories to scan, defaulting to sys.path of the
+            running interpreter. Earlier entries shadow later ones, as for
+            imports.
+        workspace (str): Also scan virtualenvs found directly inside it.
+        cache (bool): Reuse per-directory listings whose mtime/inode did
+            not change. When nothing changed the previous result object is
+            returned unchanged, so treat it as read-only.
+
+    Returns:
+        dict: {key: Distribution(name, version, location, environment)}.
+        Keys are normalized names for the primary environment and
+        "<label>:<normalized name>" for workspace virtualenvs, so the
+        same project can be reported once per environment.
+    """
+    envs = environment_paths(paths, workspace)
+    stamps = tuple((path, label, _stamp(path)) for path, label in envs)
+    if cache:
+        with _cache_lock:
+            if _merged_cache[0] == stamps and all(stamp is not None for _p, _l, stamp in stamps):
+                return _merged_cache[1]
+    now_ns = time.time_ns()
+    packages = {}
+    for path, label, stamp in stamps:
+        prefix = label + ":" if label.startswith("workspace:") else ""
+        for dist in _listing(path, label, stamp, now_ns, cache):
+            packages.setdefault(prefix + normalize_name(dist.name), dist)
+    if cache:
+        # Only reuse the merged result if every listing was cacheable
+        with _cache_lock:
+            trusted = all(_dir_cache.get(path, (None,))[0] is not None for path, _l, _s in stamps)
+            _merged_cache[:] = [stamps if trusted else None, packages]
+    return packages
+
+
+def changed_since(since_ns, paths=None, workspace=None):
+    """
+    Distributions whose metadata was written at or after ``since_ns``, e.g.
+    installed or upgraded while a snapshot was being taken. Only directories
+    whose own mtime is that recent are listed.
+
+    Args:
+        since_ns (int): Wall-clock time in nanoseconds.
+        paths (list): As for scan_packages().
+        workspace (str): As for scan_packages().
+
+    Returns:
+        list: Distribution records, uncached.
+    """
+    found = []
+    for path, label in environment_paths(paths, workspace):
+        stamp = _stamp(path)
+        if stamp is not None and stamp[0] >= since_ns:
+            found.extend(_scan_dir(path, label, since_ns))
+    return found
@@ -0,0 +1,241 @@
+"""
+renames.py
+Pairs DELETE and CREATE events into renames.
+
+A rename shows up as a delete of the old path and a create of the new one,
+in either order. The RenameDetector holds unmatched deletes and creates and
+pairs them by (inode, size) — what ``mv`` and ``git mv`` preserve — or, when
+the inode changed (copy + delete, editors that rewrite), by content digest
+among files of the same size. Whatever is still unpaired once no delete or
+create has arrived for ``window`` seconds is passed on as a plain CREATE or
+DELETE, so the two halves of a long mass move still meet even when the
+events trickle in behind a busy enrichment pool.
+
+Pairing is a dict lookup per event, so a mass move of 10k files costs 10k
+lookups and produces 10k RENAME events rather than 20k creates and deletes.
+A new file is hashed at most once, and never while the detector's lock is
+held.
+"""
+import time
+import threading
+
+__all__ = ['RenameDetector']
+
+
+class _Held:
+    """
+    Unpaired events of one kind, in arrival order, indexed for pairing.
+    """
+
+    def __init__(self):
+        # relpath -> [held since, inode, size, digest]
+        self.events = {}
+        # (inode, size), size and (size, digest) -> {relpath: None}, oldest first
+        self.by_ident = {}
+        self.by_size = {}
+        self.by_digest = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, relpath, since, inode, size, digest):
+        self.events[relpath] = [since, inode, size, digest]
+        self.by_ident.setdefault((inode, size), {})[relpath] = None
+        self.by_size.setdefault(size, {})[relpath] = None
+        if digest is not None:
+            self.by_digest.setdefault((size, digest), {})[relpath] = None
+
+    def remove(self, relpath):
+        _since, inode, size, digest = self.events.pop(relpath)
+        _discard(self.by_ident, (inode, size), relpath)
+        _discard(self.by_size, size, relpath)
+        if digest is not None:
+            _discard(self.by_digest, (size, digest), relpath)
+
+    def set_digest(self, relpath, digest):
+        event = self.events.get(relpath)
+        if event is None or event[3] is not None or digest is None:
+            return
+        event[3] = digest
+        self.by_digest.setdefault((event[2], digest), {})[relpath] = None
+
+    def take(self, index, key):
+        """
+        Remove and return the oldest event filed under ``key``, or None.
+        """
+        paths = index.get(key)
+        if not paths:
+            return None
+        relpath = next(iter(paths))
+        self.remove(relpath)
+        return relpath
+
+    def undigested(self, size):
+        return [relpath for relpath in self.by_size.get(size, ()) if self.events[relpath][3] is None]
+
+
+def _discard(index, key, relpath):
+    paths = index[key]
+    del paths[relpath]
+    if not paths:
+        del index[key]
+
+
+class RenameDetector:
+    """
+    Args:
+        callback (callable): callback(event_type, relpath, source), with
+            event_type one of MODIFY/CREATE/DELETE/RENAME and source the old
+            path of a RENAME (else None).
+        identify_deleted (callable): relpath -> (inode, size, digest) of a
+            file as last seen before it was deleted, or None if unknown.
+        identify_created (callable): relpath -> (inode, size) of a new file,
+            or None if it is already gone.
+        digest_created (callable): relpath -> content digest of a new file;
+            only called when a same-size delete is waiting.
+        window (float): Seconds without deletes or creates after which
+            unpaired events are passed on.
+        max_delay (float): Upper bound on how long one event is held.
+    """
+
+    def __init__(self, callback, identify_deleted, identify_created, digest_created, window=0.5, max_delay=10.0):
+        self.callback = callback
+        self.identify_deleted = identify_deleted
+        self.identify_created = identify_created
+        self.digest_created = digest_created
+        self.window = window
+        self.max_delay = max_delay
+        self._last = 0.0
+        self.renames = 0
+        self._deletes = _Held()
+        self._creates = _Held()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, event_type, relpath):
+        """
+        Route one settled event; MODIFY passes straight through.
+        """
+        if event_type == "DELETE":
+            ident = self.identify_deleted(relpath)
+            if ident is None:
+                return self.callback("DELETE", relpath, None)
+            source, dest = relpath, self._pair_delete(relpath, ident)
+            if dest is None:
+                return
+        elif event_type == "CREATE":
+            ident = self.identify_created(relpath)
+            if ident is None:
+                return self.callback("CREATE", relpath, None)
+            dest, source = relpath, self._pair_create(relpath, ident[0], ident[1])
+            if source is None:
+                return
+        else:
+            return self.callback(event_type, relpath, None)
+        self.renames += 1
+        self.callback("RENAME", dest, source)
+
+    def _pair_delete(self, relpath, ident):
+        """
+        Take the waiting create that ``relpath`` was renamed to, or hold the
+        delete and return None.
+        """
+        inode, size, digest = ident
+        with self._cond:
+            self._last = time.monotonic()
+            dest = self._creates.take(self._creates.by_ident, (inode, size))
+            if dest is not None or digest is None:
+                return dest or self._hold(self._deletes, relpath, inode, size, digest)
+            dest = self._creates.take(self._creates.by_digest, (size, digest))
+            if dest is not None:
+                return dest
+            pending = self._creates.undigested(size)
+            if not pending:
+                return self._hold(self._deletes, relpath, inode, size, digest)
+        # Different inode: fall back to comparing content. Each new file is
+        # hashed once; its digest stays filed for later deletes.
+        digests = [(path, self.digest_created(path)) for path in pending]
+        with self._cond:
+            for path, created_digest in digests:
+                self._creates.set_digest(path, created_digest)
+            dest = (self._creates.take(self._creates.by_ident, (inode, size))
+                    or self._creates.take(self._creates.by_digest, (size, digest)))
+            return dest or self._hold(self._deletes, relpath, inode, size, digest)
+
+    def _pair_create(self, relpath, inode, size):
+        """
+        Take the waiting delete that was renamed to ``relpath``, or hold the
+        create and return None.
+        """
+        with self._cond:
+            self._last = time.monotonic()
+            source = self._deletes.take(self._deletes.by_ident, (inode, size))
+            if source is not None or size not in self._deletes.by_size:
+                return source or self._hold(self._creates, relpath, inode, size, None)
+        # Different inode: fall back to comparing content
+        digest = self.digest_created(relpath)
+        with self._cond:
+            source = self._deletes.take(self._deletes.by_ident, (inode, size))
+            if source is None and digest is not None:
+                source = self._deletes.take(self._deletes.by_digest, (size, digest))
+            return source or self._hold(self._creates, relpath, inode, size, digest)
+
+    def _hold(self, table, relpath, inode, size, digest):
+        # Caller holds the lock; returns None, for "no partner"
+        table.add(relpath, self._last, inode, size, digest)
+        if len(self._deletes) + len(self._creates) == 1:
+            self._cond.notify()
+        return None
+
+    def _next_due(self):
+        # When the next unpaired event is passed on, or None if none are held
+        oldest = None
+        for table in (self._deletes, self._creates):
+            if table:
+                first = next(iter(table.events.values()))[0]
+                oldest = first if oldest is None else min(oldest, first)
+        if oldest is None:
+            return None
+        return min(self._last + self.window, oldest + self.max_delay)
+
+    def _expired(self, now, flush):
+        out = []
+        quiet = flush or now >= self._last + self.window
+        for event_type, table in (("DELETE", self._deletes), ("CREATE", self._creates)):
+            for relpath in list(table.events):
+                if not quiet and table.events[relpath][0] + self.max_delay > now:
+                    # Held in arrival order: the rest are younger still
+                    break
+                table.remove(relpath)
+                out.append((event_type, relpath))
+        return out
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    due = self._next_due()
+                    now = time.monotonic()
+                    if due is not None and due <= now:
+                        break
+                    self._cond.wait(due - now if due is not None else None)
+                due = self._expired(time.monotonic(), not self._running)
+                running = self._running
+            for event_type, relpath in due:
+                try:
+                    self.callback(event_type, relpath, None)
+                except Exception:
+                    pass
+            if not running:
+                return
+
+    def stop(self, timeout=None):
+        """
+        Pass on everything still unpaired and stop the thread.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
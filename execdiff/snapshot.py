@@ -0,0 +1,195 @@
+"""
+snapshot.py
+Single-pass workspace snapshot engine shared by every execdiff tracer.
+
+The tree is walked with ``os.scandir`` and each file is stat'ed exactly once;
+directory/file classification comes from the ``readdir`` entry type, so
+directories cost no extra syscall.
+"""
+import os
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['FileStat', 'scan_workspace', 'list_workspace']
+
+
+class FileStat(namedtuple("FileStat", "mtime_ns size ino mode")):
+    """
+    Stat fields captured per file: mtime in nanoseconds, size, inode, mode.
+    """
+    __slots__ = ()
+
+    @property
+    def mtime(self):
+        """Modification time in seconds, as returned by os.path.getmtime."""
+        sec, nsec = divmod(self.mtime_ns, 1000000000)
+        return sec + nsec * 1e-9
+
+
+def _scan_dir(dirpath, prefix, ignore, rules, files, subdirs, dirs=None):
+    """
+    Stat the files of one directory into ``files`` and queue its
+    subdirectories as (path, relpath prefix, ignore rules) onto ``subdirs``.
+    Ignored entries are dropped here, before any stat. When ``dirs`` is a
+    dict, queued subdirectories are stat'ed into it as well.
+    """
+    try:
+        with os.scandir(dirpath) as it:
+            entries = list(it)
+    except OSError:
+        return
+    if ignore is not None and ignore.gitignore:
+        rules = ignore.child_rules(rules, prefix, {entry.name for entry in entries})
+    for entry in entries:
+        relpath = prefix + entry.name
+        try:
+            if entry.is_dir():
+                if not entry.is_symlink() and (ignore is None or not ignore.match(rules, relpath, True)):
+                    if dirs is not None:
+                        st = entry.stat(follow_symlinks=False)
+                        dirs[relpath + os.sep] = FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+                    subdirs.append((entry.path, relpath + os.sep, rules))
+                continue
+            if ignore is not None and ignore.match(rules, relpath, False):
+                continue
+            st = entry.stat()
+        except OSError:
+            continue
+        files[relpath] = FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+
+
+def _scan_parallel(workspace, ignore, workers, dirs):
+    """
+    Work-stealing walk: every worker runs depth-first on its own deque and,
+    when that runs dry, steals the oldest (shallowest, usually largest)
+    pending directory from another worker.
+    """
+    deques = [deque() for _ in range(workers)]
+    results = [{} for _ in range(workers)]
+    dir_results = [{} if dirs is not None else None for _ in range(workers)]
+    deques[0].append((workspace, "", ignore.root_rules if ignore is not None else ()))
+    # Directories queued or being scanned; the walk is over when it hits 0
+    state = {"pending": 1}
+    cond = threading.Condition()
+
+    def steal(me):
+        for offset in range(1, workers):
+            try:
+                return deques[(me + offset) % workers].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def run(me):
+        local = deques[me]
+        files = results[me]
+        while True:
+            try:
+                item = local.pop()
+            except IndexError:
+                item = steal(me)
+            if item is None:
+                with cond:
+                    if state["pending"] == 0:
+                        return
+                    cond.wait(0.005)
+                continue
+            subdirs = []
+            _scan_dir(item[0], item[1], ignore, item[2], files, subdirs, dir_results[me])
+            with cond:
+                state["pending"] += len(subdirs) - 1
+                local.extend(subdirs)
+                if subdirs or state["pending"] == 0:
+                    cond.notify_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(run, i) for i in range(workers)]:
+            future.result()
+
+    files = results[0]
+    for other in results[1:]:
+        files.update(other)
+    if dirs is not None:
+        for other in dir_results:
+            dirs.update(other)
+    return files
+
+
+def scan_workspace(workspace, workers=1, ignore=None, dirs=None):
+    """
+    Snapshot every file under the workspace with one stat per file.
+
+    Symlinks to files are followed (like os.path.getmtime); symlinked
+    directories are not descended into (like os.walk). Entries that vanish
+    or cannot be stat'ed during the walk are skipped.
+
+    Args:
+        workspace (str): Root directory to scan.
+        workers (int): Number of walker threads. Values above 1 split
+            subtrees across a work-stealing thread pool, which pays off when
+            stat latency dominates (NFS, overlayfs, cold caches).
+        ignore (IgnoreMatcher): Rules pruned during the walk; ignored
+            directories are never listed. None scans everything.
+        dirs (dict): If given, filled with {dir relpath + os.sep: FileStat}
+            for every directory walked, the root being "".
+
+    Returns:
+        dict: {relpath: FileStat}
+    """
+    if dirs is not None:
+        try:
+            st = os.stat(workspace)
+        except OSError:
+            return {}
+        dirs[""] = FileStat(st.st_mtime_ns, st.st_size, st.st_ino, st.st_mode)
+    if workers > 1:
+        return _scan_parallel(workspace, ignore, workers, dirs)
+    files = {}
+    # (absolute dir path, relpath prefix, ignore rules) still to visit
+    stack = [(workspace, "", ignore.root_rules if ignore is not None else ())]
+    while stack:
+        dirpath, prefix, rules = stack.pop()
+        _scan_dir(dirpath, prefix, ignore, rules, files, stack, dirs)
+    return files
+
+
+def list_workspace(workspace, ignore=None):
+    """
+    Relative paths of the files scan_workspace() would visit, from the
+    directory listings alone: no file is stat'ed, so this is much cheaper
+    than a snapshot and serves as a consistent record of which names
+    existed at a point in time.
+
+    Args:
+        workspace (str): Root directory to list.
+        ignore (IgnoreMatcher): Rules pruned during the walk, as for
+            scan_workspace().
+
+    Returns:
+        set: Relative file paths. Unlike scan_workspace(), entries that
+        cannot be stat'ed (dangling symlinks) are included.
+    """
+    names = set()
+    stack = [(workspace, "", ignore.root_rules if ignore is not None else ())]
+    while stack:
+        dirpath, prefix, rules = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        if ignore is not None and ignore.gitignore:
+            rules = ignore.child_rules(rules, prefix, {entry.name for entry in entries})
+        for entry in entries:
+            relpath = prefix + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if not entry.is_symlink() and (ignore is None or not ignore.match(rules, relpath, True)):
+                    stack.append((entry.path, relpath + os.sep, rules))
+            elif ignore is None or not ignore.match(rules, relpath, False):
+                names.add(relpath)
+    return names
@@ -0,0 +1,150 @@
+"""
+stream.py
+Streaming diffs: change records are used up as the merge-join produces them,
+so a trace that creates millions of files never holds its diff in memory.
+
+ChangeSummary counts changes overall and per directory, and keeps the
+rollups of directories created or deleted as a whole. DiffSpool parks the
+full change records on temporary files, one per kind, and writes them out
+as one action log entry in the usual stop_action_trace() format. Both use
+memory that depends on the number of directories, not of changes.
+"""
+import os
+import json
+import tempfile
+
+__all__ = ['ChangeSummary', 'DiffSpool']
+
+_KINDS = ("created", "modified", "deleted")
+# Rollups from iter_changes(..., rollups=True), one per directory
+_DIR_KINDS = ("created_dirs", "deleted_dirs")
+
+
+def _rollup_dir(relpath, depth):
+    parts = relpath.split(os.sep)[:-1][:depth]
+    return os.sep.join(parts) + os.sep if parts else ""
+
+
+def _size_delta(kind, record):
+    if kind == "created":
+        return record["size"]
+    if kind == "deleted":
+        return -record["size"]
+    return record["after_size"] - record["before_size"]
+
+
+class ChangeSummary:
+    """
+    Change counts, overall and rolled up per directory, added one record at
+    a time.
+
+    Args:
+        depth (int): Changes are rolled up into their directory, cut to at
+            most this many levels: with depth=2, "a/b/c/x.py" counts under
+            "a/b/". Files at the root count under "".
+    """
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self.counts = dict.fromkeys(_KINDS, 0)
+        self.bytes = 0
+        self.directories = {}
+        self.subtrees = {kind: [] for kind in _DIR_KINDS}
+
+    def add(self, kind, record):
+        if kind in self.subtrees:
+            # Its files follow one by one
+            self.subtrees[kind].append(record)
+            return
+        delta = _size_delta(kind, record)
+        self.counts[kind] += 1
+        self.bytes += delta
+        directory = _rollup_dir(record["path"], self.depth)
+        rollup = self.directories.get(directory)
+        if rollup is None:
+            rollup = self.directories[directory] = {"created": 0, "modified": 0, "deleted": 0, "bytes": 0}
+        rollup[kind] += 1
+        rollup["bytes"] += delta
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: {"created": n, "modified": n, "deleted": n, "bytes": net
+            size change, "directories": {dir: {"created", "modified",
+            "deleted", "bytes"}}, "created_dirs": [...], "deleted_dirs":
+            [...]}, directories sorted by path.
+        """
+        return dict(self.counts, bytes=self.bytes,
+                    directories={d: dict(r) for d, r in sorted(self.directories.items())},
+                    **{kind: list(rollups) for kind, rollups in self.subtrees.items()})
+
+
+# Stands in for the diff's "files" while the rest of an entry is serialised
+_PLACEHOLDER = "\x00execdiff-files\x00"
+# Records serialised per json.dumps() call
+_BATCH = 1024
+
+
+class DiffSpool:
+    """
+    Change records held on temporary files until write_entry(). Close it
+    (or use it as a context manager) to remove the files.
+    """
+
+    def __init__(self):
+        self._files = {kind: tempfile.TemporaryFile() for kind in _KINDS + _DIR_KINDS}
+        self._pending = {kind: [] for kind in _KINDS + _DIR_KINDS}
+        self.counts = dict.fromkeys(_KINDS + _DIR_KINDS, 0)
+
+    def add(self, kind, record):
+        pending = self._pending[kind]
+        pending.append(record)
+        if len(pending) >= _BATCH:
+            self._spill(kind)
+
+    def _spill(self, kind):
+        pending = self._pending[kind]
+        if not pending:
+            return
+        f = self._files[kind]
+        if self.counts[kind]:
+            f.write(b", ")
+        # One call for the batch, without its brackets
+        f.write(json.dumps(pending)[1:-1].encode("utf-8"))
+        self.counts[kind] += len(pending)
+        del pending[:]
+
+    def write_entry(self, out, entry):
+        """
+        Write ``entry`` as one JSON line to the binary file ``out``, with the
+        spooled records as its ``entry["diff"]["files"]``.
+        """
+        diff = dict(entry["diff"], files=_PLACEHOLDER)
+        head, tail = json.dumps(dict(entry, diff=diff)).split(json.dumps(_PLACEHOLDER), 1)
+        out.write(head.encode("utf-8"))
+        for kind in _KINDS + _DIR_KINDS:
+            self._spill(kind)
+        for n, kind in enumerate(_KINDS + _DIR_KINDS):
+            out.write(('%s"%s": [' % ("{" if n == 0 else ", ", kind)).encode("utf-8"))
+            f = self._files[kind]
+            f.seek(0)
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                out.write(chunk)
+            out.write(b"]")
+        out.write(b"}")
+        out.write(tail.encode("utf-8"))
+        out.write(b"\n")
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
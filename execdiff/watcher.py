@@ -0,0 +1,458 @@
+"""
+watcher.py
+Pluggable file change watchers feeding the live trace pipeline.
+
+Two backends are available:
+
+- ``InotifyWatcher`` (Linux): one inotify watch per directory, events are
+  delivered by the kernel as they happen. Idle CPU cost is zero; the only
+  full traversal is the one at ``start()`` that registers the watches.
+- ``PollingWatcher`` (everywhere): re-walks the workspace every ``interval``
+  seconds and stats every file once. CPU cost grows linearly with the number of
+  files (roughly one ``stat`` per file per interval), and changes that are
+  undone between two polls are never seen.
+
+Both call ``callback(event_type, relpath)`` from their own thread with
+``event_type`` one of ``"CREATE"``, ``"MODIFY"`` or ``"DELETE"``, and both
+offer ``sync()``: once it returns, every change made before the call has
+been delivered (for the polling backend this costs a walk).
+"""
+import os
+import sys
+import time
+import errno
+import ctypes
+import select
+import struct
+import threading
+
+from .ignore import resolve_ignore
+from .snapshot import scan_workspace
+
+__all__ = [
+    'PollingWatcher', 'InotifyWatcher', 'start_watcher', 'WATCHER_BACKENDS'
+]
+
+WATCHER_BACKENDS = ('auto', 'inotify', 'poll')
+
+def _walk_stats(workspace, ignore):
+    """
+    Snapshot the workspace as {relpath: (mtime_ns, size)}.
+    """
+    return {
+        relpath: (st.mtime_ns, st.size)
+        for relpath, st in scan_workspace(workspace, ignore=ignore).items()
+    }
+
+
+def _diff_stats(before, after):
+    """
+    Compare two {relpath: (mtime_ns, size)} maps.
+    Returns:
+        list: (event_type, relpath) tuples in detection order.
+    """
+    events = []
+    for relpath, stat in after.items():
+        if relpath not in before:
+            events.append(("CREATE", relpath))
+        elif stat != before[relpath]:
+            events.append(("MODIFY", relpath))
+    for relpath in before:
+        if relpath not in after:
+            events.append(("DELETE", relpath))
+    return events
+
+
+class PollingWatcher:
+    """
+    Portable watcher: full workspace walk every ``interval`` seconds.
+    """
+    backend = "poll"
+
+    def __init__(self, workspace, callback, interval=1.0, ignore=None):
+        self.workspace = workspace
+        self.callback = callback
+        self.interval = interval
+        self.ignore = ignore
+        self.running = False
+        self._thread = None
+        self._snapshot = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._snapshot = _walk_stats(self.workspace, self.ignore)
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def sync(self):
+        """
+        Poll now, delivering every change made before the call.
+        """
+        with self._lock:
+            self._poll()
+
+    def _poll(self):
+        current = _walk_stats(self.workspace, self.ignore)
+        events = _diff_stats(self._snapshot, current)
+        self._snapshot = current
+        for event_type, relpath in events:
+            self.callback(event_type, relpath)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            if not self.running:
+                break
+            with self._lock:
+                self._poll()
+
+
+# --- inotify backend (Linux, via ctypes) ---
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "libc does not provide inotify")
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+class InotifyWatcher:
+    """
+    Linux watcher driven by kernel inotify events.
+
+    Files written in place are reported on each write (``IN_MODIFY``) and
+    again when they are closed (``IN_CLOSE_WRITE``), so writes to a file
+    that stays open are seen too; the Coalescer folds the bursts. A touch
+    is reported through ``IN_ATTRIB``, but only when the file's mtime or
+    size actually changed, so chmod and link count changes are dropped. If
+    the kernel event queue overflows the watcher resynchronises with a
+    single full walk.
+
+    If a directory created while the watcher runs cannot be watched
+    (``fs.inotify.max_user_watches`` is exhausted), the watcher drops its
+    watches, reports what it missed with one full walk, and polls every
+    ``interval`` seconds from then on; ``backend`` becomes ``"poll"`` and
+    ``on_fallback(error)`` is called.
+    """
+    backend = "inotify"
+
+    def __init__(self, workspace, callback, poll_timeout=0.5, ignore=None, interval=1.0, on_fallback=None):
+        self.workspace = workspace
+        self.callback = callback
+        self.ignore = ignore
+        self.poll_timeout = poll_timeout
+        self.interval = interval
+        self.on_fallback = on_fallback
+        self.fallback_error = None
+        self.running = False
+        self._thread = None
+        self._fd = None
+        self._wd_paths = {}
+        self._path_wds = {}
+        self._pending_create = set()
+        self._stats = {}
+        # Held while events are read and dispatched, by _run() and sync()
+        self._lock = threading.Lock()
+
+    def start(self):
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        try:
+            self._add_tree(self.workspace, emit=False)
+            self._stats = _walk_stats(self.workspace, self.ignore)
+        except OSError:
+            os.close(fd)
+            self._fd = None
+            raise
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def sync(self):
+        """
+        Dispatch every event the kernel has queued so far. The kernel
+        queues an event when the syscall happens, so changes made before
+        the call have been delivered when it returns.
+        """
+        with self._lock:
+            if self.backend == "poll":
+                self._poll()
+                return
+            while self._fd is not None:
+                try:
+                    data = os.read(self._fd, _READ_SIZE)
+                except OSError:
+                    # BlockingIOError: the queue is empty
+                    return
+                self._handle(data)
+
+    def _add_watch(self, dirpath):
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(dirpath), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            # ENOSPC means fs.inotify.max_user_watches is exhausted
+            raise OSError(err, "inotify_add_watch(%s): %s" % (dirpath, os.strerror(err)))
+        self._wd_paths[wd] = dirpath
+        self._path_wds[dirpath] = wd
+
+    def _add_tree(self, top, emit):
+        # Each directory is watched before it is listed, so a file renamed
+        # or created in between shows up in the listing or as an event
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            self._add_watch(root)
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            rel = os.path.relpath(root, self.workspace)
+            prefix = "" if rel == os.curdir else rel + os.sep
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if self.ignore is not None and self.ignore.is_ignored(prefix + entry.name, is_dir=is_dir):
+                    continue
+                if is_dir:
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                elif emit:
+                    # Files may land in a new directory before its watch exists
+                    self._emit("CREATE", prefix + entry.name)
+
+    def _remove_tree(self, top):
+        prefix = top + os.sep
+        for path in [p for p in self._path_wds if p == top or p.startswith(prefix)]:
+            wd = self._path_wds.pop(path)
+            self._wd_paths.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def _record_stat(self, relpath):
+        try:
+            st = os.stat(os.path.join(self.workspace, relpath))
+            self._stats[relpath] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+
+    def _stat_changed(self, relpath):
+        try:
+            st = os.stat(os.path.join(self.workspace, relpath))
+        except OSError:
+            return False
+        return self._stats.get(relpath) != (st.st_mtime_ns, st.st_size)
+
+    def _emit(self, event_type, relpath):
+        # Keep the stat map current so an overflow resync only reports news
+        if event_type == "DELETE":
+            self._stats.pop(relpath, None)
+        else:
+            self._record_stat(relpath)
+        self.callback(event_type, relpath)
+
+    def _poll(self):
+        # One full walk, reporting whatever differs from the stat map
+        current = _walk_stats(self.workspace, self.ignore)
+        events = _diff_stats(self._stats, current)
+        self._stats = current
+        for event_type, relpath in events:
+            self.callback(event_type, relpath)
+
+    def _resync(self):
+        # Queue overflow: events were dropped, fall back to one full walk
+        self._remove_tree(self.workspace)
+        self._pending_create.clear()
+        self._add_tree(self.workspace, emit=False)
+        self._poll()
+
+    def _fall_back(self, error):
+        # Out of watches: inotify can no longer see the whole tree
+        self._remove_tree(self.workspace)
+        os.close(self._fd)
+        self._fd = None
+        self._pending_create.clear()
+        self.backend = "poll"
+        self.fallback_error = error
+        self._poll()
+        if self.on_fallback is not None:
+            self.on_fallback(error)
+
+    def _handle(self, data):
+        # Caller holds the lock
+        try:
+            self._dispatch(data)
+        except OSError as e:
+            # inotify_add_watch() failed for a new directory; the events
+            # after it in this batch are picked up by the walk
+            self._fall_back(e)
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        timeout_ms = int(self.poll_timeout * 1000)
+        while self.running:
+            if self.backend == "poll":
+                time.sleep(self.interval)
+                if self.running:
+                    with self._lock:
+                        self._poll()
+                continue
+            if not poller.poll(timeout_ms):
+                continue
+            with self._lock:
+                if self._fd is None:
+                    break
+                try:
+                    data = os.read(self._fd, _READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+                self._handle(data)
+
+    def _dispatch(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._resync()
+                continue
+            dirpath = self._wd_paths.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_IGNORED:
+                self._path_wds.pop(dirpath, None)
+                self._wd_paths.pop(wd, None)
+                continue
+            if not name:
+                continue
+            path = os.path.join(dirpath, os.fsdecode(name))
+            relpath = os.path.relpath(path, self.workspace)
+            if self.ignore is not None and self.ignore.is_ignored(relpath, is_dir=bool(mask & IN_ISDIR)):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path, emit=True)
+                elif mask & IN_MOVED_FROM:
+                    # Moved out of view: every file below it is gone for us
+                    self._remove_tree(path)
+                    prefix = relpath + os.sep
+                    for gone in [p for p in self._stats if p.startswith(prefix)]:
+                        self._emit("DELETE", gone)
+                continue
+            if mask & IN_CREATE:
+                # A CREATE is normally followed by writes and a close; report once
+                self._pending_create.add(relpath)
+                self._emit("CREATE", relpath)
+            elif mask & IN_MOVED_TO:
+                self._emit("MODIFY" if relpath in self._stats else "CREATE", relpath)
+            elif mask & IN_CLOSE_WRITE:
+                if relpath in self._pending_create:
+                    # Written after the CREATE: the Coalescer folds this into it
+                    self._pending_create.discard(relpath)
+                    self._emit("MODIFY", relpath)
+                elif relpath in self._stats:
+                    self._emit("MODIFY", relpath)
+                else:
+                    self._emit("CREATE", relpath)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._pending_create.discard(relpath)
+                if relpath in self._stats:
+                    self._emit("DELETE", relpath)
+            elif mask & (IN_MODIFY | IN_ATTRIB):
+                # A write to a file that may stay open, or a touch
+                if self._stat_changed(relpath):
+                    self._emit("MODIFY" if relpath in self._stats else "CREATE", relpath)
+
+
+def start_watcher(workspace, callback, backend="auto", interval=1.0, ignore=None, on_fallback=None):
+    """
+    Build and start a watcher for the workspace.
+
+    Args:
+        workspace (str): Directory to watch.
+        callback (callable): Called as callback(event_type, relpath).
+        backend (str): "inotify", "poll", or "auto" (inotify where available,
+            polling if inotify is missing or runs out of watches).
+        interval (float): Poll interval in seconds for the polling backend,
+            and for an inotify watcher that runs out of watches later on.
+        ignore: Ignore rules, as accepted by execdiff.ignore.resolve_ignore().
+        on_fallback (callable): Called as on_fallback(error) if an inotify
+            watcher switches to polling while running.
+
+    Returns:
+        The running watcher; its ``backend`` attribute names the one in use.
+    """
+    if backend not in WATCHER_BACKENDS:
+        raise ValueError("Unknown watcher backend: %r" % (backend,))
+    ignore = resolve_ignore(workspace, ignore)
+    if backend != "poll":
+        watcher = InotifyWatcher(workspace, callback, ignore=ignore, interval=interval, on_fallback=on_fallback)
+        try:
+            watcher.start()
+            return watcher
+        except OSError:
+            if backend == "inotify":
+                raise
+    watcher = PollingWatcher(workspace, callback, interval=interval, ignore=ignore)
+    watcher.start()
+    return watcher
@@ -0,0 +1,72 @@
+import os
+import shutil
+
+import pytest
+
+import execdiff
+from execdiff.daemon import TraceDaemon, WorkspaceSession
+
+
+def _write(root, relpath, text="x\n"):
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXECDIFF_LOG_DIR", str(tmp_path / "logs"))
+    root = str(tmp_path / "ws")
+    for relpath in ("old/x/one.txt", "old/two.txt", "src/a.py", "src/b.py", "t.txt"):
+        _write(root, relpath)
+    os.makedirs(os.path.join(root, "empty"))
+    stamp = os.stat(os.path.join(root, "t.txt")).st_mtime - 10
+    os.utime(os.path.join(root, "t.txt"), (stamp, stamp))
+    return root
+
+
+@pytest.mark.parametrize("backend", ["inotify", "poll"])
+def test_end_matches_stop_action_trace(workspace, backend):
+    try:
+        session = WorkspaceSession(workspace, backend=backend, interval=0.2)
+    except OSError:
+        pytest.skip("inotify is not available")
+    try:
+        session.begin("a")
+        execdiff.start_action_trace(workspace)
+        held = open(os.path.join(workspace, "src", "a.py"), "a")
+        try:
+            # Appended to and still open when the action ends
+            held.write("more\n")
+            held.flush()
+            os.utime(os.path.join(workspace, "t.txt"))
+            shutil.rmtree(os.path.join(workspace, "old"))
+            _write(workspace, "new/deep/n.txt")
+            _write(workspace, "new/m.txt")
+            _write(workspace, "empty/e.txt")
+            _write(workspace, "a0.txt")
+            os.remove(os.path.join(workspace, "src", "b.py"))
+            expected = execdiff.stop_action_trace()
+            diff = session.end("a")
+        finally:
+            held.close()
+    finally:
+        session.close()
+
+    assert diff == expected
+    assert [d["path"] for d in diff["files"]["created_dirs"]] == ["new" + os.sep]
+    assert [d["path"] for d in diff["files"]["deleted_dirs"]] == ["old" + os.sep]
+    assert [m["path"] for m in diff["files"]["modified"]] == [os.path.join("src", "a.py"), "t.txt"]
+
+
+def test_register_rejects_other_ignore_rules(workspace, tmp_path):
+    daemon = TraceDaemon(str(tmp_path / "d.sock"), backend="poll")
+    try:
+        session = daemon.register(workspace, ["*.log"])
+        assert daemon.register(workspace) is session
+        assert daemon.register(workspace, ["*.log"]) is session
+        with pytest.raises(RuntimeError):
+            daemon.register(workspace, True)
+    finally:
+        daemon.unregister(workspace)
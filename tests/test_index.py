@@ -0,0 +1,85 @@
+import os
+import time
+import shutil
+
+import pytest
+
+from execdiff import index
+from execdiff.ignore import IgnoreMatcher
+from execdiff.index import scan_and_index, scan_incremental
+from execdiff.snapshot import scan_workspace
+
+
+def _write(root, relpath, text="x\n"):
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _age(root, seconds=60):
+    # Push every mtime out of the racy window, files before their directories
+    stamp = time.time() - seconds
+    for dirpath, _dirs, files in os.walk(root, topdown=False):
+        for name in files:
+            os.utime(os.path.join(dirpath, name), (stamp, stamp))
+        os.utime(dirpath, (stamp, stamp))
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXECDIFF_INDEX_DIR", str(tmp_path / "index"))
+    root = str(tmp_path / "ws")
+    for relpath in ("a.txt", "src/main.py", "src/util.py", "src/pkg/mod.py", "docs/guide.md",
+                    "old/x/one.txt", "old/x/two.txt", "old/y.txt", "build/out.o", "keep/untouched.txt"):
+        _write(root, relpath)
+    _write(root, "debug.log")
+    return root
+
+
+def _mutate(root):
+    os.remove(os.path.join(root, "src", "util.py"))
+    os.rename(os.path.join(root, "src", "main.py"), os.path.join(root, "src", "app.py"))
+    os.rename(os.path.join(root, "docs", "guide.md"), os.path.join(root, "src", "pkg", "guide.md"))
+    shutil.rmtree(os.path.join(root, "old"))
+    _write(root, "build/new.o")
+    _write(root, "trace.log")
+    _write(root, "new/dir/file.txt")
+
+
+@pytest.mark.parametrize("patterns", [None, ["build/", "*.log"]])
+def test_incremental_matches_full_rescan(workspace, monkeypatch, patterns):
+    ignore = IgnoreMatcher(workspace, patterns=patterns) if patterns is not None else None
+    _age(workspace)
+    scan_and_index(workspace, ignore=ignore)
+    _mutate(workspace)
+
+    listed = []
+    scan_dir = index._scan_dir
+
+    def counting_scan_dir(dirpath, prefix, *args):
+        listed.append(prefix)
+        return scan_dir(dirpath, prefix, *args)
+
+    monkeypatch.setattr(index, "_scan_dir", counting_scan_dir)
+    incremental = scan_incremental(workspace, ignore=ignore)
+    monkeypatch.undo()
+
+    assert incremental == scan_workspace(workspace, ignore=ignore)
+    # Unchanged directories came from the index, not from a relisting
+    assert "keep" + os.sep not in listed
+    assert "src" + os.sep in listed
+
+
+def test_incremental_honours_gitignore(workspace):
+    _write(workspace, ".gitignore", "*.o\nsrc/pkg/\n")
+    ignore = IgnoreMatcher(workspace, gitignore=True)
+    _age(workspace)
+    scan_and_index(workspace, ignore=ignore)
+    _mutate(workspace)
+
+    incremental = scan_incremental(workspace, ignore=ignore)
+
+    assert incremental == scan_workspace(workspace, ignore=ignore)
+    assert "build/new.o".replace("/", os.sep) not in incremental
+    assert not any(relpath.startswith(os.path.join("src", "pkg")) for relpath in incremental)
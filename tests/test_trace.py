@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import execdiff
+
+THREADS = 16
+TRACES = 64
+
+
+def _paths(diff, kind):
+    return sorted(record["path"] for record in diff["files"][kind])
+
+
+@pytest.fixture
+def workspaces(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXECDIFF_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("EXECDIFF_INDEX_DIR", str(tmp_path / "index"))
+    roots = []
+    for n in range(TRACES):
+        root = tmp_path / ("ws%d" % n)
+        (root / "src").mkdir(parents=True)
+        for i in range(20):
+            (root / "src" / ("f%d.txt" % i)).write_text("x\n")
+        roots.append(str(root))
+    return roots
+
+
+def test_simultaneous_nested_traces(workspaces):
+    def task(root):
+        with execdiff.Trace(root, persist=False) as parent:
+            steps = []
+            for step in range(3):
+                with parent.child() as child:
+                    with open(os.path.join(root, "src", "f%d.txt" % step), "a") as f:
+                        f.write("more\n")
+                    with open(os.path.join(root, "step%d.txt" % step), "w") as f:
+                        f.write("y\n")
+                    os.remove(os.path.join(root, "src", "f%d.txt" % (10 + step)))
+                steps.append(child.diff)
+        return parent.diff, steps
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(task, workspaces))
+
+    src = "src" + os.sep
+    for parent, steps in results:
+        for step, diff in enumerate(steps):
+            assert _paths(diff, "created") == ["step%d.txt" % step]
+            assert _paths(diff, "modified") == [src + "f%d.txt" % step]
+            assert _paths(diff, "deleted") == [src + "f%d.txt" % (10 + step)]
+        assert _paths(parent, "created") == ["step0.txt", "step1.txt", "step2.txt"]
+        assert _paths(parent, "modified") == [src + "f0.txt", src + "f1.txt", src + "f2.txt"]
+        assert _paths(parent, "deleted") == [src + "f10.txt", src + "f11.txt", src + "f12.txt"]
+
+
+def test_simultaneous_action_traces(workspaces):
+    def task(root):
+        execdiff.start_action_trace(root)
+        with open(os.path.join(root, "out.txt"), "w") as f:
+            f.write("y\n")
+        return execdiff.stop_action_trace()
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        diffs = list(pool.map(task, workspaces))
+
+    for diff in diffs:
+        assert _paths(diff, "created") == ["out.txt"]
+        assert _paths(diff, "modified") == []
+        assert _paths(diff, "deleted") == []